@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Cache of ask_data answers keyed by the embedding of the query.
+    A lookup hits when a stored query is similar enough to the new one, so paraphrased questions are served
+    without searching and filtering again. Answers are tied to the index build they were retrieved from,
+    a cache saved with another index version is discarded when loaded.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float = 24 * 3600,
+        max_items: int = 1000,
+        path: str = None,
+        index_version: str = None,
+    ):
+        """
+        Initializes the SemanticAnswerCache.
+
+        Args:
+            threshold (float): Minimum cosine similarity between queries to hit.
+            ttl (float): Seconds an answer is valid.
+            max_items (int): Maximum number of answers, least recently used are evicted.
+            path (str): JSON file to persist the cache across restarts, memory only if None.
+            index_version (str): Version of the index build, e.g. manifest_version of its manifest.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self.path = path
+        self.index_version = index_version
+
+        self.lock = threading.Lock()
+        self.queries = []
+        self.answers = []
+        self.created = []
+        self.last_access = []
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def manifest_version(manifest_path: str) -> str:
+        """
+        Returns the version of an index build from the manifest written by it.
+
+        Args:
+            manifest_path (str): Manifest of the index data, or of the incremental indexing.
+
+        Returns:
+            str: SHA-256 of the manifest, None if there is no manifest.
+        """
+        if manifest_path is None or not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def get(self, vector: np.array) -> str:
+        """
+        Looks up the answer of the most similar stored query.
+
+        Args:
+            vector (np.array): Embedding of the query.
+
+        Returns:
+            str: The cached answer, None on a miss.
+        """
+        query = self._normalize(vector)
+        with self.lock:
+            self._evict_expired()
+
+            if len(self.answers) > 0:
+                similarities = self.vectors @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    self.last_access[best] = time.time()
+                    return self.answers[best]
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector: np.array, answer: str):
+        """
+        Stores the answer of a query.
+
+        Args:
+            query (str): Query text, kept for inspection.
+            vector (np.array): Embedding of the query.
+            answer (str): Answer to cache.
+        """
+        vector = self._normalize(vector)
+        now = time.time()
+        with self.lock:
+            self._evict_expired()
+
+            # Evict the least recently used answer when full
+            if len(self.answers) >= self.max_items:
+                self._remove([int(np.argmin(self.last_access))])
+
+            self.queries.append(query)
+            self.answers.append(answer)
+            self.created.append(now)
+            self.last_access.append(now)
+            self.vectors = vector[None, :] if len(self.vectors) == 0 else np.vstack([self.vectors, vector[None, :]])
+
+    def stats(self) -> Dict:
+        """Returns the hit/miss statistics."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0.0,
+                "size": len(self.answers),
+            }
+
+    def save(self):
+        """Writes the cache to its path."""
+        if self.path is None:
+            return
+
+        with self.lock:
+            data = {
+                "index_version": self.index_version,
+                "queries": self.queries,
+                "answers": self.answers,
+                "created": self.created,
+                "last_access": self.last_access,
+                "vectors": self.vectors.tolist(),
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+    def load(self):
+        """Reads the cache from its path, dropping the expired answers and the answers of another index build."""
+        with open(self.path, "r") as f:
+            data = json.load(f)
+
+        if data.get("index_version") != self.index_version:
+            print(f"Answer cache of index {data.get('index_version')} discarded, index is {self.index_version}")
+            self.clear()
+            return
+
+        with self.lock:
+            self.queries = data["queries"]
+            self.answers = data["answers"]
+            self.created = data["created"]
+            self.last_access = data["last_access"]
+            self.vectors = np.asarray(data["vectors"], dtype=np.float32)
+            self._evict_expired()
+
+    def clear(self):
+        """Removes all the answers, e.g. after the index is updated."""
+        with self.lock:
+            self._remove(range(len(self.answers)))
+
+    @staticmethod
+    def _normalize(vector: np.array) -> np.array:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _evict_expired(self):
+        now = time.time()
+        self._remove([i for i, created in enumerate(self.created) if now - created > self.ttl])
+
+    def _remove(self, positions):
+        positions = set(positions)
+        if len(positions) == 0:
+            return
+        keep = [i for i in range(len(self.answers)) if i not in positions]
+        self.queries = [self.queries[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.created = [self.created[i] for i in keep]
+        self.last_access = [self.last_access[i] for i in keep]
+        self.vectors = self.vectors[keep]
@@ -1,9 +1,9 @@
 import sys
+import re
 import json
-from typing import List, Dict
-from PIL import Image
-
-from azure.search.documents import SearchClient
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Iterator, Tuple, TYPE_CHECKING
 
 sys.path.append("..")
 sys.path.append(".")
@@ -11,8 +11,22 @@ sys.path.append(".")
 from models.embedding_model import AzureAIEmbedding
 from models.chatcomplete_model import AzureAIChatComplete
 from models.imagegen_model import StabilityAIImageGen
+from models.image_jobs import ImageJobQueue, image_key
+from models.telemetry import tracer
+
+from search_utils import (
+    search_knowledgebase_single,
+    search_knowledgebase_hybrid,
+    search_knowledgebase_batch,
+    search_lexical,
+    search_vector,
+)
+from answer_cache import SemanticAnswerCache
+from context_window import ContextWindow
+from router import KeywordRouter
 
-from search_utils import search_knowledgebase_single
+if TYPE_CHECKING:
+    from azure.search.documents import SearchClient
 
 
 class ChatBot:
@@ -56,6 +70,19 @@ class ChatBot:
 
     ¿Es útil o relevante?:"""
 
+    FILTERER_BATCH = """Necesitas responder a una pregunta. Para ello vas a recibir varios fragmentos numerados.
+    Tu tarea es filtrar dichos fragmentos, quedándote solo con aquellos que puedan ser relevantes
+    para responder la pregunta, y descartando los demás.
+    Responde solamente con los números de los fragmentos útiles separados por comas (por ejemplo: 1, 3),
+    o "NINGUNO" si ninguno es útil.
+
+    Pregunta: {pregunta}
+
+    Fragmentos a filtrar:
+    {fragmentos}
+
+    Fragmentos útiles o relevantes:"""
+
     FUNC_SEARCH_DATA = {
         "name": "ask_data",
         "description": "Auxiliary function to search for specific excerpts from Brandon Sanderson's books. It has all the excerpts separately accessible for searching (in Spanish).",
@@ -96,20 +123,60 @@ class ChatBot:
 
     ASSISTANT_TOOLS = [FUNC_SEARCH_DATA, FUNC_CREATE_IMAGE]
 
+    STOP_TOKENS = [
+        "<|start_header_id|>",
+        "<|end_header_id|>",
+        "<|eot_id|>",
+        "<|reserved_special_token",
+    ]
+
     def __init__(
         self,
         embedding_model: AzureAIEmbedding,
         chatcomplete_model: AzureAIChatComplete,
         imagegen_model: StabilityAIImageGen,
-        search_client: SearchClient,
+        search_client: "SearchClient",
+        concurrent: bool = False,
+        max_concurrency: int = 8,
+        batch_filter: bool = False,
+        lexical_index=None,
+        batch_search: bool = False,
+        answer_cache: SemanticAnswerCache = None,
+        context_window: ContextWindow = None,
+        router: KeywordRouter = None,
+        image_jobs: ImageJobQueue = None,
     ):
         """
         Initializes a ChatBot instance.
+
+        Args:
+            concurrent (bool): Whether ask_data searches the queries and filters the passages in parallel.
+            max_concurrency (int): Maximum number of filter calls in flight at the same time (concurrent mode).
+            batch_filter (bool): Whether each batch of passages is judged in a single LLM call.
+            lexical_index (BM25Index): Optional lexical index, searches are hybrid (BM25 + vector) if given.
+            batch_search (bool): Whether all the queries of ask_data are embedded and searched at once.
+            answer_cache (SemanticAnswerCache): Optional cache of the filtered data of similar queries.
+            context_window (ContextWindow): Optional token budget for the history, last 20 messages if None.
+            router (KeywordRouter): Optional local router, clear-cut turns skip the tool selection LLM call.
+            image_jobs (ImageJobQueue): Optional background queue, create_image returns without waiting if given.
         """
         self.embedding_model = embedding_model
         self.chatcomplete_model = chatcomplete_model
         self.imagegen_model = imagegen_model
         self.search_client = search_client
+        self.concurrent = concurrent
+        self.max_concurrency = max_concurrency
+        self.batch_filter = batch_filter
+        self.lexical_index = lexical_index
+        self.batch_search = batch_search
+        self.answer_cache = answer_cache
+        self.context_window = context_window
+        self.router = router
+        self.image_jobs = image_jobs
+
+        # Shared pool for the filter calls, so the limit holds across all the queries of a turn
+        self.filter_executor = ThreadPoolExecutor(max_workers=max_concurrency) if concurrent else None
+        self.verdicts_lock = threading.Lock()
 
     def chat(self, messages: List[Dict]) -> List[Dict]:
         """
@@ -121,29 +188,124 @@ class ChatBot:
         Returns:
             list: Generated messages exchanged in the conversation.
         """
+        # Initialize list to store generated messages
+        generated_messages = []
 
-        try:
+        with tracer.span("chat.turn", stream=False) as span:
+            try:
+                response_message, finisher_messages = self._call_tools(messages, generated_messages)
+
+                # Request a new response from LLM incorporating function response
+                if finisher_messages is not None:
+                    with tracer.span("chat.finisher"):
+                        response = self.chatcomplete_model.predict(
+                            messages=finisher_messages,
+                            temperature=0.4,
+                            max_tokens=300,
+                            stop=self.STOP_TOKENS,
+                        )
+                    print(response)
+                    response_message = response["choices"][0]["message"]["content"]
+
+                # Append the assistant's response to the generated messages
+                generated_messages.append({"role": "assistant", "content": response_message})
+            except Exception as e:
+                print(e)
+                span.set(error=str(e))
+                generated_messages.append({"role": "assistant", "content": str(e)})
+
+        # Return generated messages and search debug information (if applicable)
+        return generated_messages
+
+    def chat_stream(
+        self, messages: List[Dict], generated_messages: List[Dict], cancelled: threading.Event = None
+    ) -> Iterator[str]:
+        """
+        Conducts a conversation between the user and the assistant, yielding the final answer as it is generated.
+        The tool selection step is not streamed.
+
+        Args:
+            messages (list): List of previous messages exchanged in the conversation.
+            generated_messages (list): List where the generated messages are appended.
+            cancelled (threading.Event): Set when the answer is no longer needed, the turn stops before the next
+                model call without answering.
+
+        Returns:
+            Iterator[str]: Pieces of the assistant's response.
+        """
+        response_message = ""
+        with tracer.span("chat.turn", stream=True) as span:
+            try:
+                tool_response_message, finisher_messages = self._call_tools(messages, generated_messages, cancelled)
+
+                if finisher_messages is None:
+                    response_message = tool_response_message
+                    yield response_message
+                else:
+                    self._check_cancelled(cancelled)
+                    with tracer.span("chat.finisher"):
+                        for delta in self.chatcomplete_model.predict_stream(
+                            messages=finisher_messages,
+                            temperature=0.4,
+                            max_tokens=300,
+                            stop=self.STOP_TOKENS,
+                        ):
+                            response_message += delta
+                            yield delta
+
+                # Append the assistant's response to the generated messages
+                generated_messages.append({"role": "assistant", "content": response_message})
+            except Exception as e:
+                if cancelled is not None and cancelled.is_set():
+                    span.set(cancelled=True)
+                    return
+                print(e)
+                span.set(error=str(e))
+                generated_messages.append({"role": "assistant", "content": response_message + str(e)})
+                yield str(e)
+
+    def _call_tools(
+        self, messages: List[Dict], generated_messages: List[Dict], cancelled: threading.Event = None
+    ) -> Tuple[str, List[Dict]]:
+        """
+        Asks the router or the model whether a function is needed and calls it.
+
+        Args:
+            messages (list): List of previous messages exchanged in the conversation.
+            generated_messages (list): List where the tool messages are appended.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every model call.
+
+        Returns:
+            tuple: The response message, and the messages to request the final answer with
+                (None if the response message is already the final answer).
+        """
+        # Clear-cut turns go straight to the tool chosen by the local router
+        with tracer.span("chat.route") as span:
+            route = self.router.route(messages) if self.router is not None else None
+            if route is not None:
+                span.set(function_name=route["function_name"], confidence=route["confidence"])
+        if route is not None and route["routed"]:
+            f_dict = {"function_name": route["function_name"], "parameters": route["parameters"]}
+            response_message = json.dumps(f_dict)
+            function_name = f_dict["function_name"]
+            function_args = f_dict["parameters"]
+            method = getattr(self, function_name)
+        else:
             # Define initial system message
             message_init = {
                 "role": "system",
                 "content": self.ASSISTANT.format(tools=str(self.ASSISTANT_TOOLS)),
             }
 
-            # Initialize list to store generated messages
-            generated_messages = []
-
             # Request response from model based on the original messages
-            response = self.chatcomplete_model.predict(
-                messages=[message_init] + messages[-20:],
-                temperature=0.4,
-                max_tokens=300,
-                stop=[
-                    "<|start_header_id|>",
-                    "<|end_header_id|>",
-                    "<|eot_id|>",
-                    "<|reserved_special_token",
-                ],
-            )
+            self._check_cancelled(cancelled)
+            with tracer.span("chat.tool_selection"):
+                response = self.chatcomplete_model.predict(
+                    messages=[message_init] + self._history(messages, [message_init]),
+                    temperature=0.4,
+                    max_tokens=300,
+                    stop=self.STOP_TOKENS,
+                )
             response_message = response["choices"][0]["message"]["content"]
 
             # Check if the model requested a valid function call
@@ -155,130 +317,425 @@ class ChatBot:
                 method = getattr(self, function_name)
             except Exception as e:
                 print(e)
-                function_name = None
-
-            if function_name is not None:
-                print(f_dict)
-                # Call the corresponding method with the provided arguments
-                function_response = method(**function_args)
-                function_response_str = str(function_response)
-                print(function_response_str)
-                # For images thats enough
-                if function_name == "create_image":
-                    response_message = function_response_str
-                # For others generate a final answer
-                else:
-                    # Extend conversation with function response
-                    generated_messages.append(
-                        {
-                            "role": "tool",
-                            "name": function_name,
-                            "content": f"{function_response_str}",
-                        }
-                    )
+                return response_message, None
+
+        print(f_dict)
+        # Call the corresponding method with the provided arguments, ask_data stops its filter calls if cancelled
+        self._check_cancelled(cancelled)
+        if function_name == "ask_data":
+            function_args = dict(function_args, cancelled=cancelled)
+        with tracer.span(f"tool.{function_name}"):
+            function_response = method(**function_args)
+        function_response_str = str(function_response)
+        print(function_response_str)
+
+        # For images thats enough
+        if function_name == "create_image":
+            return function_response_str, None
+
+        # For others generate a final answer, extending conversation with function response
+        generated_messages.append(
+            {
+                "role": "tool",
+                "name": function_name,
+                "content": f"{function_response_str}",
+            }
+        )
+        message_init = {
+            "role": "system",
+            "content": self.ASSISTANT_FINISHER,
+        }
 
-                    # Request a new response from LLM incorporating function response
-                    message_init = {
-                        "role": "system",
-                        "content": self.ASSISTANT_FINISHER,
-                    }
-                    response = self.chatcomplete_model.predict(
-                        messages=[message_init] + messages[-20:] + generated_messages,
-                        temperature=0.4,
-                        max_tokens=300,
-                        stop=[
-                            "<|start_header_id|>",
-                            "<|end_header_id|>",
-                            "<|eot_id|>",
-                            "<|reserved_special_token",
-                        ],
-                    )
-                    print(response)
-                    response_message = response["choices"][0]["message"]["content"]
+        history = self._history(messages, [message_init] + generated_messages)
 
-            # Append the assistant's response to the generated messages
-            generated_messages.append({"role": "assistant", "content": response_message})
-        except Exception as e:
-            print(e)
-            generated_messages.append({"role": "assistant", "content": str(e)})
+        return response_message, [message_init] + history + generated_messages
 
-        # Return generated messages and search debug information (if applicable)
-        return generated_messages
+    @staticmethod
+    def _check_cancelled(cancelled: threading.Event):
+        """Stops the turn before a model call if its answer is no longer needed"""
+        if cancelled is not None and cancelled.is_set():
+            raise Exception("The turn was cancelled")
 
-    def ask_data(self, search_queries: List[str]) -> str:
+    def _history(self, messages: List[Dict], reserved_messages: List[Dict]) -> List[Dict]:
+        """
+        Selects the history messages sent to the model.
+
+        Args:
+            messages (list): List of previous messages exchanged in the conversation.
+            reserved_messages (list): Other messages of the request, they count against the token budget.
+
+        Returns:
+            list: History messages to send.
+        """
+        if self.context_window is None:
+            return messages[-20:]
+
+        history = self.context_window.fit(messages, reserved_messages)
+        tracer.current_span().set(**self.context_window.last_usage)
+        return history
+
+    def ask_data(self, search_queries: List[str], cancelled: threading.Event = None) -> str:
         """
         Retrieve filtered data based on search queries.
 
         Args:
             search_queries (list): List of search queries.
-            message_id (str): The ID of the message associated with the search.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every filter call.
 
         Returns:
             str: Concatenated filtered data answers.
         """
-        # Initialize lists to store filtered data answers and search results debug information
-        all_data_answers = []
+        if self.answer_cache is None:
+            answers = self._ask_data_queries(search_queries, cancelled=cancelled)
+            return "\n\n".join(answer for answer in answers if len(answer) > 0)
+
+        # Queries confidently answered by the lexical index need no embedding, so they skip the cache
+        lexical_results = [
+            search_lexical(self.lexical_index, search_query) if self.lexical_index is not None else None
+            for search_query in search_queries
+        ]
+        cached_positions = [
+            i for i, lexical in enumerate(lexical_results) if lexical is None or not lexical["confident"]
+        ]
+
+        # Serve the queries similar to a cached one, the embeddings and lexical results are reused by the search
+        all_data_answers = [None] * len(search_queries)
+        query_vectors = [None] * len(search_queries)
+        if len(cached_positions) > 0:
+            vectors = self.embedding_model.predict([search_queries[i] for i in cached_positions])
+            for i, vector in zip(cached_positions, vectors):
+                query_vectors[i] = vector
+                all_data_answers[i] = self.answer_cache.get(vector)
+        missing = [i for i, answer in enumerate(all_data_answers) if answer is None]
+        tracer.current_span().set(cache_hits=len(search_queries) - len(missing))
+
+        if len(missing) > 0:
+            new_answers = self._ask_data_queries(
+                [search_queries[i] for i in missing],
+                vectors=[query_vectors[i] for i in missing],
+                lexical_results=[lexical_results[i] for i in missing],
+                cancelled=cancelled,
+            )
+            for i, answer in zip(missing, new_answers):
+                all_data_answers[i] = answer
+                # Queries without relevant data are not cached, they may succeed next time
+                if len(answer) > 0 and query_vectors[i] is not None:
+                    self.answer_cache.put(search_queries[i], query_vectors[i], answer)
 
-        # Iterate over each search query
-        for search_query in search_queries:
+        # Queries without relevant data add nothing to the answer
+        return "\n\n".join(answer for answer in all_data_answers if len(answer) > 0)
 
-            # Retrieve search results for the current search query
-            cogs_orig_results = search_knowledgebase_single(self.search_client, self.embedding_model, search_query)
-            cogs_final_results = []
-            filtered_info = ""
-
-            # Iterate over search results in batches of 5
-            for k in range(0, min(20, len(cogs_orig_results)), 5):
-
-                # Iterate over each search result within the current batch
-                for i in range(0, 5):
-                    context = cogs_orig_results[k + i]["content"]
-                    message = {
-                        "role": "user",
-                        "content": self.FILTERER.format(
-                            pregunta=search_query,
-                            info_sin_filtrar=context,
-                            info_filtrada_prev=filtered_info,
-                        ),
-                    }
-                    # Request response from LLM to filter the information
-                    response = self.chatcomplete_model.predict(
-                        messages=[message],
-                        max_tokens=2,
-                        temperature=0.01,
-                        stop=[
-                            "<|start_header_id|>",
-                            "<|end_header_id|>",
-                            "<|eot_id|>",
-                            "<|reserved_special_token",
-                        ],
+    def _ask_data_queries(
+        self,
+        search_queries: List[str],
+        vectors: List = None,
+        lexical_results: List = None,
+        cancelled: threading.Event = None,
+    ) -> List[str]:
+        """
+        Retrieve filtered data for several search queries.
+
+        Args:
+            search_queries (list): List of search queries.
+            vectors (list): Embedding of every query if already embedded, None entries are embedded by the search.
+            lexical_results (list): search_lexical result of every query if already searched, None entries as well.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every filter call.
+
+        Returns:
+            list: Filtered data answer of every query.
+        """
+        # Retrieve the search results of all the queries at once if configured, a passage returned for several
+        # queries is judged once and its verdict reused
+        if self.batch_search:
+            all_results = search_knowledgebase_batch(
+                self.search_client,
+                self.embedding_model,
+                search_queries,
+                lexical_index=self.lexical_index,
+                lexical_results=lexical_results,
+                vectors=vectors,
+            )
+            verdicts = {}
+        else:
+            all_results = [None] * len(search_queries)
+            verdicts = None
+        all_verdicts = [verdicts] * len(search_queries)
+        vectors = vectors or [None] * len(search_queries)
+        lexical_results = lexical_results or [None] * len(search_queries)
+        all_cancelled = [cancelled] * len(search_queries)
+
+        # Retrieve the filtered data for every query, in parallel if configured
+        if self.concurrent:
+            with ThreadPoolExecutor(max_workers=max(1, len(search_queries))) as executor:
+                all_data_answers = list(
+                    executor.map(
+                        tracer.bind(self._ask_data_single),
+                        search_queries,
+                        all_results,
+                        all_verdicts,
+                        vectors,
+                        lexical_results,
+                        all_cancelled,
                     )
-                    response_message = response["choices"][0]["message"]["content"]
-                    # If the response is 'SI' (yes), include the context in filtered_info and cogs_final_results
-                    if response_message == "SI":
-                        filtered_info += context
-                        cogs_final_results.append(cogs_orig_results[k + i])
+                )
+        else:
+            all_data_answers = [
+                self._ask_data_single(*args)
+                for args in zip(search_queries, all_results, all_verdicts, vectors, lexical_results, all_cancelled)
+            ]
 
-                # If filtered information is found, break out of the loop
-                if len(filtered_info) > 0:
-                    break
+        return all_data_answers
 
-            # Append the filtered data answer to all_data_answers
-            all_data_answers.append(f"{filtered_info}")
+    def _ask_data_single(
+        self,
+        search_query: str,
+        cogs_orig_results: List[Dict] = None,
+        verdicts: Dict = None,
+        vector=None,
+        lexical_results: Dict = None,
+        cancelled: threading.Event = None,
+    ) -> str:
+        """
+        Retrieve filtered data for a single search query.
+
+        Search results are judged in batches of 5 and the loop stops at the first batch with relevant results.
 
-        # Concatenate all filtered data answers with newline separator and return along with search results debug information
-        return "\n\n".join(all_data_answers)
+        Args:
+            search_query (str): Search query.
+            cogs_orig_results (list): Search results of the query, searched here if None.
+            verdicts (dict): Verdicts shared by the queries of a turn, by passage id, None to judge every passage.
+            vector: Embedding of the query if already embedded, used when the query is searched here.
+            lexical_results (dict): search_lexical result of the query if already searched, as well.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every filter call.
 
-    def create_image(self, prompt_description: str, style_preset: str) -> Image:
+        Returns:
+            str: Concatenated relevant contents.
         """
-        Retrieve filtered data based on search queries.
+        with tracer.span("ask_data.query"):
+            return self._ask_data_filtered(
+                search_query, cogs_orig_results, verdicts, vector, lexical_results, cancelled
+            )
+
+    def _ask_data_filtered(
+        self,
+        search_query: str,
+        cogs_orig_results: List[Dict] = None,
+        verdicts: Dict = None,
+        vector=None,
+        lexical_results: Dict = None,
+        cancelled: threading.Event = None,
+    ) -> str:
+        """Searches a query (unless already searched) and keeps the relevant results, as in _ask_data_single"""
+        # Retrieve search results for the current search query
+        if cogs_orig_results is None and self.lexical_index is not None:
+            cogs_orig_results = search_knowledgebase_hybrid(
+                self.search_client,
+                self.embedding_model,
+                self.lexical_index,
+                search_query,
+                lexical_results=lexical_results,
+                vector=vector,
+            )
+        elif cogs_orig_results is None and vector is not None:
+            cogs_orig_results = search_vector(self.search_client, vector)
+        elif cogs_orig_results is None:
+            cogs_orig_results = search_knowledgebase_single(self.search_client, self.embedding_model, search_query)
+        filtered_info = ""
+
+        # Iterate over search results in batches of 5
+        for k in range(0, min(20, len(cogs_orig_results)), 5):
+            results = cogs_orig_results[k : k + 5]
+            contexts = [result["content"] for result in results]
+
+            # Judge every search result within the current batch
+            if verdicts is None:
+                relevant = self._filter_passages(search_query, contexts, cancelled)
+            else:
+                relevant = self._filter_passages_shared(search_query, results, verdicts, cancelled)
+
+            # Keep the relevant contexts in the original order
+            for context, is_relevant in zip(contexts, relevant):
+                if is_relevant:
+                    filtered_info += context
+
+            # If filtered information is found, break out of the loop
+            if len(filtered_info) > 0:
+                break
+
+        return filtered_info
+
+    def _filter_passages(self, search_query: str, contexts: List[str], cancelled: threading.Event = None) -> List[bool]:
+        """
+        Ask the LLM which passages are relevant to answer the query, in one call if configured.
+
+        Args:
+            search_query (str): Search query.
+            contexts (list): Passages to judge.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every call.
+
+        Returns:
+            list: Relevance flag for every passage.
+        """
+
+        def filter_passage(context: str) -> bool:
+            self._check_cancelled(cancelled)
+            return self._filter_passage(search_query, context)
+
+        self._check_cancelled(cancelled)
+        relevant = self._filter_passages_batch(search_query, contexts) if self.batch_filter else None
+        if relevant is None and self.filter_executor is not None:
+            relevant = list(self.filter_executor.map(tracer.bind(filter_passage), contexts))
+        elif relevant is None:
+            relevant = [filter_passage(context) for context in contexts]
+        return relevant
+
+    def _filter_passages_shared(
+        self, search_query: str, results: List[Dict], verdicts: Dict, cancelled: threading.Event = None
+    ) -> List[bool]:
+        """
+        Judges the passages not judged yet for another query of the turn and reuses the verdicts of the others.
+
+        A passage being judged for another query is waited for, not judged again.
+
+        Args:
+            search_query (str): Search query.
+            results (list): Search results to judge.
+            verdicts (dict): Future verdict of every passage judged in the turn, by passage id.
+            cancelled (threading.Event): Set when the answer is no longer needed, checked before every call.
+
+        Returns:
+            list: Relevance flag for every passage.
+        """
+        claimed = []
+        with self.verdicts_lock:
+            for result in results:
+                if result["id"] not in verdicts:
+                    verdicts[result["id"]] = Future()
+                    claimed.append(result)
+            futures = [verdicts[result["id"]] for result in results]
+
+        if len(claimed) > 0:
+            try:
+                relevant = self._filter_passages(search_query, [result["content"] for result in claimed], cancelled)
+            except Exception as e:
+                # Other queries waiting for these verdicts fail as well instead of hanging
+                for result in claimed:
+                    verdicts[result["id"]].set_exception(e)
+                raise
+            for result, is_relevant in zip(claimed, relevant):
+                verdicts[result["id"]].set_result(is_relevant)
+
+        return [future.result() for future in futures]
+
+    def _filter_passage(self, search_query: str, context: str) -> bool:
+        """
+        Ask the LLM whether a passage is relevant to answer the query.
+
+        Args:
+            search_query (str): Search query.
+            context (str): Passage to judge.
+
+        Returns:
+            bool: True if the model answered 'SI' (yes).
+        """
+        message = {
+            "role": "user",
+            "content": self.FILTERER.format(
+                pregunta=search_query,
+                info_sin_filtrar=context,
+            ),
+        }
+        # Request response from LLM to filter the information
+        with tracer.span("ask_data.filter"):
+            response = self.chatcomplete_model.predict(
+                messages=[message],
+                max_tokens=2,
+                temperature=0.01,
+                stop=self.STOP_TOKENS,
+            )
+        response_message = response["choices"][0]["message"]["content"]
+        return response_message == "SI"
+
+    def _filter_passages_batch(self, search_query: str, contexts: List[str]) -> List[bool]:
+        """
+        Ask the LLM which passages of a numbered list are relevant to answer the query, in a single call.
+
+        Args:
+            search_query (str): Search query.
+            contexts (list): Passages to judge.
+
+        Returns:
+            list: Relevance flag for every passage, or None if the model output could not be parsed.
+        """
+        fragments = "\n\n".join([f"[{i + 1}] {context}" for i, context in enumerate(contexts)])
+        message = {
+            "role": "user",
+            "content": self.FILTERER_BATCH.format(pregunta=search_query, fragmentos=fragments),
+        }
+        # Request the indices of the relevant passages
+        try:
+            with tracer.span("ask_data.filter_batch", n_contexts=len(contexts)):
+                response = self.chatcomplete_model.predict(
+                    messages=[message],
+                    max_tokens=4 * len(contexts) + 4,
+                    temperature=0.01,
+                    stop=self.STOP_TOKENS,
+                )
+            response_message = response["choices"][0]["message"]["content"]
+        except Exception as e:
+            print(e)
+            return None
+
+        indices = self._parse_relevant_indices(response_message, len(contexts))
+        if indices is None:
+            return None
+        return [i in indices for i in range(len(contexts))]
+
+    @staticmethod
+    def _parse_relevant_indices(response_message: str, n_contexts: int) -> set:
+        """
+        Parse the answer of the batch filter into 0-based passage indices.
+
+        Args:
+            response_message (str): Model answer, e.g. "1, 3" or "NINGUNO".
+            n_contexts (int): Number of passages that were judged.
+
+        Returns:
+            set: Indices of the relevant passages, or None if the answer is malformed.
+        """
+        text = response_message.strip().strip(".").strip()
+        if text.upper().startswith("NINGUNO"):
+            return set()
+
+        # Only numbers (optionally in brackets) separated by commas, spaces or "y" are accepted
+        if not re.fullmatch(r"[\[\]\d\s,y]+", text):
+            return None
+        numbers = [int(n) for n in re.findall(r"\d+", text)]
+        if len(numbers) == 0 or any(n < 1 or n > n_contexts for n in numbers):
+            return None
+
+        return {n - 1 for n in numbers}
+
+    def create_image(self, prompt_description: str, style_preset: str = None) -> str:
+        """
+        Generates an image, in the background if there is an image job queue.
 
         Args:
             prompt_description (str): Prompt describing the image.
+            style_preset (str): Style of the image.
 
         Returns:
-            Image: Generated PIL image.
+            str: Message for the user about the image.
         """
+        if self.image_jobs is not None:
+            job_id = self.image_jobs.submit(prompt_description, style_preset)
+            job = self.image_jobs.status(job_id)
+            if job["status"] == ImageJobQueue.DONE:
+                return f"Image generated: {job['path']}"
+            return f"Image generation started, job id: {job_id}"
+
+        # Named as the images of the job queue, so different prompts never overwrite each other
         img = self.imagegen_model.predict(prompt=prompt_description, style_preset=style_preset)
-        img.save(f"/........./data/images/{prompt_description[:15]}.jpeg")
-        return "Image generated"
+        name = image_key(self.imagegen_model.model_name, prompt_description, style_preset)
+        img.save(f"/........./data/images/{name}.jpeg")
+        return f"Image generated, id: {name}"
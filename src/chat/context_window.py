@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+
+class ContextWindow:
+    """
+    Fits the conversation history to a token budget.
+    Old tool outputs are compacted first, then dropped, and only then the oldest messages are dropped.
+    Token counts are cached per message, so every message is tokenized once. The caches are shared by the
+    sessions, so they are only changed under a lock.
+    """
+
+    def __init__(
+        self,
+        token_counter,
+        max_tokens: int = 4000,
+        compacted_tool_tokens: int = 100,
+        message_overhead: int = 4,
+        max_cached_messages: int = 10000,
+    ):
+        """
+        Initializes the ContextWindow.
+
+        Args:
+            token_counter (TokenCounter): Token counter of the model.
+            max_tokens (int): Maximum number of prompt tokens of a request.
+            compacted_tool_tokens (int): Number of tokens kept from an old tool output when it is compacted.
+            message_overhead (int): Extra tokens per message for the role and the chat template.
+            max_cached_messages (int): Maximum number of cached token counts, least recently used are evicted.
+        """
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens
+        self.compacted_tool_tokens = compacted_tool_tokens
+        self.message_overhead = message_overhead
+        self.max_cached_messages = max_cached_messages
+
+        self.lock = threading.Lock()
+        self.token_cache = OrderedDict()
+        self.compacted_cache = OrderedDict()
+        self.last_usage = {}
+
+    def count(self, message: Dict) -> int:
+        """
+        Returns the number of tokens of a message, from the cache if it was already counted.
+
+        Args:
+            message (dict): Chat message.
+
+        Returns:
+            int: Number of tokens.
+        """
+        key = (message["role"], message.get("name"), message["content"])
+        n_tokens = self._cache_get(self.token_cache, key)
+        if n_tokens is None:
+            # Tokenized outside the lock, another session may count the same message meanwhile
+            n_tokens = self.token_counter.num_tokens_from_string(message["content"])
+            self._cache_put(self.token_cache, key, n_tokens)
+        return n_tokens + self.message_overhead
+
+    def fit(self, messages: List[Dict], reserved_messages: List[Dict] = None) -> List[Dict]:
+        """
+        Selects and compacts the history messages so the request fits the token budget.
+
+        Args:
+            messages (list): Conversation history, oldest first.
+            reserved_messages (list): Messages always sent with the history (system prompt, current tool outputs).
+
+        Returns:
+            list: Messages of the history to send.
+        """
+        budget = self.max_tokens - sum([self.count(message) for message in reserved_messages or []])
+        history = list(messages)
+        counts = [self.count(message) for message in history]
+        total = sum(counts)
+        n_compacted = 0
+        n_dropped = 0
+
+        # Tool outputs of previous turns, oldest first (the last message is never touched)
+        old_tools = [i for i, message in enumerate(history[:-1]) if message["role"] == "tool"]
+
+        # Compact old tool outputs
+        for i in old_tools:
+            if total <= budget:
+                break
+            compacted = self._compact(history[i])
+            compacted_count = self.count(compacted)
+            if compacted_count < counts[i]:
+                total -= counts[i] - compacted_count
+                history[i] = compacted
+                counts[i] = compacted_count
+                n_compacted += 1
+
+        # Drop old tool outputs
+        for i in old_tools:
+            if total <= budget:
+                break
+            total -= counts[i]
+            history[i] = None
+            counts[i] = 0
+            n_dropped += 1
+
+        counts = [count for message, count in zip(history, counts) if message is not None]
+        history = [message for message in history if message is not None]
+
+        # Drop the oldest messages
+        start = 0
+        while start < len(history) - 1 and total > budget:
+            total -= counts[start]
+            start += 1
+            n_dropped += 1
+        history = history[start:]
+
+        self.last_usage = {
+            "prompt_tokens": total + self.max_tokens - budget,
+            "history_messages": len(history),
+            "compacted_messages": n_compacted,
+            "dropped_messages": n_dropped,
+        }
+
+        return history
+
+    def _compact(self, message: Dict) -> Dict:
+        """Returns a copy of a message with its content cut to the compacted size."""
+        key = (message["role"], message.get("name"), message["content"])
+        content = self._cache_get(self.compacted_cache, key)
+        if content is None:
+            encoding = self.token_counter.encoding
+            tokens = encoding.encode(message["content"])
+            content = message["content"]
+            if len(tokens) > self.compacted_tool_tokens:
+                content = encoding.decode(tokens[: self.compacted_tool_tokens]) + " [...]"
+            self._cache_put(self.compacted_cache, key, content)
+
+        return dict(message, content=content)
+
+    def _cache_get(self, cache: OrderedDict, key):
+        """Returns a cached value (None if missing), marking it as recently used."""
+        with self.lock:
+            if key not in cache:
+                return None
+            cache.move_to_end(key)
+            return cache[key]
+
+    def _cache_put(self, cache: OrderedDict, key, value):
+        """Stores a value, evicting the least recently used one when the cache is full."""
+        with self.lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_cached_messages:
+                cache.popitem(last=False)
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import unicodedata
+from typing import Dict, List
+
+
+class KeywordRouter:
+    """
+    Local router that sends clear-cut turns straight to a tool, skipping the tool-selection LLM call.
+    Ambiguous turns get a low confidence and are left to the LLM: keywords without a question, follow-ups that refer
+    to previous turns with a pronoun, and image requests without an explicit image noun. Every decision is logged to
+    tune the threshold.
+    """
+
+    # Question openers (text without accents)
+    QUESTION_PATTERNS = [
+        r"^(quien|quienes|que|como|cual|cuales|cuando|donde|por que|cuanto|cuantos)\b",
+        r"\b(dame informacion|dime|hablame|cuentame|describe|describeme|resume|resumen)\b",
+        r"^(who|what|how|which|when|where|why)\b",
+        r"\b(tell me about|give me|describe|summary of|summarize)\b",
+    ]
+
+    # Requests of images, only English ones are routed since the image model needs an English prompt
+    IMAGE_PATTERN_EN = (
+        r"\b(generate|create|draw|make|paint|render)\b"
+        r".{0,20}\b(image|picture|drawing|illustration|portrait)\b"
+    )
+    IMAGE_PATTERN_ES = (
+        r"\b(genera|generame|generar|crea|creame|crear|dibuja|dibujame|dibujar|haz|hazme|hacer|pinta|pintame|pintar)\b"
+        r".{0,20}\b(imagen|dibujo|ilustracion|retrato)\b"
+    )
+    # Verbs asking for an image without naming one ("Can you draw Kaladin?"), left to the LLM
+    IMAGE_VERBS = (
+        r"\b(draw|paint|sketch|illustrate|dibuja|dibujame|dibujar|dibujes|pinta|pintame|pintar|pintes|ilustra"
+        r"|ilustrar)\b"
+    )
+
+    # Pronouns and deictics pointing to previous turns, the search query would need the conversation
+    CONTEXT_WORDS = [
+        "él", "ella", "ellos", "ellas", "ello", "eso", "esto", "aquel", "aquella", "aquello", "su", "sus", "le",
+        "les", "he", "she", "him", "her", "his", "hers", "it", "its", "they", "them", "their", "that", "this",
+        "those", "these",
+    ]  # fmt: skip
+
+    STYLE_PRESETS = [
+        "3d-model", "analog-film", "anime", "cinematic", "comic-book", "digital-art", "enhance", "fantasy-art",
+        "isometric", "line-art", "low-poly", "modeling-compound", "neon-punk", "origami", "photographic",
+        "pixel-art", "tile-texture",
+    ]  # fmt: skip
+
+    # Names that are also common words (rock, honor, lift, pattern, sel, wax, siri, radiant...) are left out,
+    # a turn about music or honesty must not be sent to the books
+    COSMERE_KEYWORDS = [
+        "cosmere", "kaladin", "shallan", "dalinar", "adolin", "navani", "jasnah", "szeth", "hoid", "syl", "renarin",
+        "moash", "teft", "lopen", "sadeas", "elhokar", "gavilar", "taravangian", "roshar", "alethkar", "urithiru",
+        "shadesmar", "stormlight", "spren", "caballeros radiantes", "knights radiant", "shardblade",
+        "hoja esquirlada", "esquirlada", "puente cuatro", "bridge four", "kelsier", "elend", "sazed", "marasi",
+        "scadrial", "luthadel", "alomancia", "allomancy", "feruquimia", "feruchemy", "nacidos de la bruma",
+        "mistborn", "vivenna", "vasher", "nalthis", "elantris", "raoden", "sarene", "hrathen", "taldain", "venli",
+        "eshonai", "rlain", "parshendi",
+    ]  # fmt: skip
+
+    def __init__(
+        self,
+        keywords: List[str] = None,
+        threshold: float = 0.9,
+        log_path: str = None,
+    ):
+        """
+        Initializes the KeywordRouter.
+
+        Args:
+            keywords (list): Names that mark a question about the books, COSMERE_KEYWORDS if None.
+            threshold (float): Confidence to reach to skip the LLM, a question with a keyword reaches 0.9.
+            log_path (str): JSON lines file where the decisions are appended, not logged if None.
+        """
+        self.keywords = [self._normalize(k) for k in (keywords or self.COSMERE_KEYWORDS)]
+        self.threshold = threshold
+        self.log_path = log_path
+
+        if log_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+
+    def route(self, messages: List[Dict]) -> Dict:
+        """
+        Decides the tool for the last user message.
+
+        Args:
+            messages (list): List of previous messages exchanged in the conversation.
+
+        Returns:
+            dict: 'function_name' and 'parameters' of the tool (None if no tool is clear), 'confidence' and 'reason',
+                and whether it is 'routed' (a tool with a confidence of at least the threshold), otherwise the LLM
+                decides.
+        """
+        decision = {"function_name": None, "parameters": {}, "confidence": 0.0, "reason": "not a user message"}
+        if len(messages) > 0 and messages[-1]["role"] == "user":
+            decision = self._route_text(messages[-1]["content"])
+
+            # Follow-ups pointing to the previous turns cannot be searched alone, the LLM rewrites them
+            reference = self._context_reference(messages)
+            if reference is not None and decision["confidence"] > 0.5:
+                decision["confidence"] = 0.5
+                decision["reason"] += f" context={reference}"
+
+        decision["routed"] = decision["function_name"] is not None and decision["confidence"] >= self.threshold
+        self._log(messages[-1]["content"] if len(messages) > 0 else "", decision)
+        return decision
+
+    def _route_text(self, text: str) -> Dict:
+        """Scores the tools for a user message"""
+        normalized = self._normalize(text)
+
+        # Image requests
+        if re.search(self.IMAGE_PATTERN_EN, normalized):
+            style_preset = next((style for style in self.STYLE_PRESETS if style in normalized), None)
+            parameters = {"prompt_description": text.strip(), "style_preset": style_preset}
+            return {"function_name": "create_image", "parameters": parameters, "confidence": 1.0, "reason": "image en"}
+        if re.search(self.IMAGE_PATTERN_ES, normalized):
+            # The prompt needs a translation, leave it to the LLM
+            return {"function_name": "create_image", "parameters": {}, "confidence": 0.4, "reason": "image es"}
+        if re.search(self.IMAGE_VERBS, normalized):
+            # Probably an image, but not a clear one, and never a question about the books
+            return {"function_name": "create_image", "parameters": {}, "confidence": 0.3, "reason": "image verb"}
+
+        # Questions about the books
+        is_question = "?" in text or any(re.search(pattern, normalized) for pattern in self.QUESTION_PATTERNS)
+        keywords = [k for k in self.keywords if re.search(rf"\b{re.escape(k)}\b", normalized)]
+        confidence = 0.5 * is_question + 0.4 * (len(keywords) > 0) + 0.1 * (len(keywords) > 1)
+        if confidence > 0:
+            return {
+                "function_name": "ask_data",
+                "parameters": {"search_queries": [text.strip()]},
+                "confidence": confidence,
+                "reason": f"question={is_question} keywords={keywords}",
+            }
+
+        return {"function_name": None, "parameters": {}, "confidence": 0.0, "reason": "no match"}
+
+    def _context_reference(self, messages: List[Dict]) -> str:
+        """Returns the word of the last user message that refers to previous turns, None if it stands alone"""
+        # Accents are kept, él and el are different words
+        words = re.findall(r"\w+", messages[-1]["content"].lower())
+        return next((word for word in words if word in self.CONTEXT_WORDS), None)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """Lowercase text without accents nor opening question marks"""
+        text = unicodedata.normalize("NFKD", text.lower().replace("¿", ""))
+        return "".join([c for c in text if not unicodedata.combining(c)]).strip()
+
+    def _log(self, text: str, decision: Dict):
+        """Stores a routing decision in the log file, if any"""
+        if self.log_path is None:
+            return
+
+        record = {
+            "time": time.time(),
+            "text": text,
+            "function_name": decision["function_name"],
+            "confidence": decision["confidence"],
+            "routed": decision["routed"],
+            "reason": decision["reason"],
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -1,5 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
-from azure.search.documents.models import VectorizedQuery
+
+from models.telemetry import tracer
+from models.single_flight import SingleFlight, default_single_flight
 
 
 def search_knowledgebase_single(search_client, embedding_model, search_query: str) -> List[Dict]:
@@ -19,10 +22,41 @@ def search_knowledgebase_single(search_client, embedding_model, search_query: st
                 - 'source': The source of the information (e.g., validation name, filename).
                 - 'content': The content of the search result.
     """
+    return search_vector(search_client, embedding_model.predict([search_query])[0])
+
+
+def search_vector(search_client, vector, top: int = 5) -> List[Dict]:
+    """
+    Searches the knowledge base with an already embedded query.
+
+    Args:
+        search_client: An instance of the search client.
+        vector: Embedding of the query.
+        top: Number of results.
+
+    Returns:
+        list: A list of dictionaries containing relevant search results, as in search_knowledgebase_single.
+    """
+    # Identical searches in flight (e.g. the same question from several sessions) share one request
+    key = SingleFlight.key("search", id(search_client), top, vector)
+
+    # Results are fetched while iterating, so the span covers both
+    with tracer.span("search", top=top) as span:
+        final_results = default_single_flight.do(key, _search_vector, search_client, vector, top)
+        span.set(n_results=len(final_results))
+
+    return final_results
+
+
+def _search_vector(search_client, vector, top: int) -> List[Dict]:
+    """Sends a vector search request"""
+    # Imported on first search, so starting the chatbot does not load the Azure SDK
+    from azure.search.documents.models import VectorizedQuery
+
     # Define the vectorized query for searching similar documents
     vector_query = VectorizedQuery(
-        vector=embedding_model.predict([search_query])[0],
-        k_nearest_neighbors=5,
+        vector=vector,
+        k_nearest_neighbors=top,
         fields="vector",
     )
 
@@ -30,10 +64,10 @@ def search_knowledgebase_single(search_client, embedding_model, search_query: st
         search_text=None,
         vector_queries=[vector_query],
         select=["id", "document", "path", "content"],
-        top=5,
+        top=top,
     )
 
-    final_results = [
+    return [
         {
             "id": result["id"],
             "score": result["@search.score"],
@@ -42,4 +76,178 @@ def search_knowledgebase_single(search_client, embedding_model, search_query: st
         for result in results
     ]
 
-    return final_results
+
+def reciprocal_rank_fusion(results_lists: List[List[Dict]], top: int = 5, k: int = 60) -> List[Dict]:
+    """
+    Fuses several ranked result lists with reciprocal rank fusion.
+
+    Args:
+        results_lists: Lists of search results, each one sorted by relevance.
+        top: Number of fused results.
+        k: Rank constant, higher values flatten the contribution of the first positions.
+
+    Returns:
+        list: The fused results, with the fused score in 'score'.
+    """
+    fused = {}
+    for results in results_lists:
+        for rank, result in enumerate(results):
+            if result["id"] not in fused:
+                fused[result["id"]] = dict(result, score=0.0)
+            fused[result["id"]]["score"] += 1 / (k + rank + 1)
+
+    return sorted(fused.values(), key=lambda result: -result["score"])[:top]
+
+
+def search_knowledgebase_hybrid(
+    search_client,
+    embedding_model,
+    lexical_index,
+    search_query: str,
+    top: int = 5,
+    rrf_k: int = 60,
+    lexical_confidence: float = 2.0,
+    min_lexical_score: float = 10.0,
+    lexical_results: Dict = None,
+    vector=None,
+) -> List[Dict]:
+    """
+    Searches the knowledge base combining the lexical (BM25) and the vector results.
+
+    When the best lexical result scores high and clearly outscores the second one the lexical results are returned
+    directly, skipping the embedding and search calls.
+
+    Args:
+        search_client: An instance of the search client.
+        embedding_model: Embedding model.
+        lexical_index: BM25Index built from the same chunks.
+        search_query: The query to search for in the knowledge base.
+        top: Number of results.
+        rrf_k: Rank constant of the reciprocal rank fusion.
+        lexical_confidence: Minimum ratio between the first and second lexical scores to skip the vector search,
+            None to always run it.
+        min_lexical_score: Minimum BM25 score of the first lexical result to skip the vector search.
+        lexical_results: Result of search_lexical for the query if already searched.
+        vector: Embedding of the query if already embedded.
+
+    Returns:
+        list: A list of dictionaries containing relevant search results, as in search_knowledgebase_single.
+    """
+    if lexical_results is None:
+        lexical_results = search_lexical(lexical_index, search_query, top, lexical_confidence, min_lexical_score)
+    if lexical_results["confident"]:
+        return lexical_results["results"]
+
+    if vector is None:
+        vector_results = search_knowledgebase_single(search_client, embedding_model, search_query)
+    else:
+        vector_results = search_vector(search_client, vector, top)
+
+    return reciprocal_rank_fusion([vector_results, lexical_results["results"]], top=top, k=rrf_k)
+
+
+def search_lexical(
+    lexical_index,
+    search_query: str,
+    top: int = 5,
+    lexical_confidence: float = 2.0,
+    min_lexical_score: float = 10.0,
+) -> Dict:
+    """
+    Searches the lexical index and decides whether its results are good enough on their own.
+    They are when the first result matches the query strongly (rare terms, several terms) and clearly outscores
+    the second one. A lone weak hit is not enough, the vector search may find passages without the query terms.
+
+    Args:
+        lexical_index: BM25Index built from the same chunks.
+        search_query: The query to search for in the knowledge base.
+        top: Number of results.
+        lexical_confidence: Minimum ratio between the first and second scores to be confident, None to never be.
+        min_lexical_score: Minimum BM25 score of the first result to be confident.
+
+    Returns:
+        dict: The lexical 'results', and whether they are 'confident'.
+    """
+    with tracer.span("search.lexical", top=top) as span:
+        lexical_hits = lexical_index.search(search_query, top=top)
+        results = [lexical_index.get_result(doc_idx, score) for doc_idx, score in lexical_hits]
+
+        confident = False
+        if lexical_confidence is not None and len(lexical_hits) > 0:
+            # A lone hit only needs to reach the floor
+            second_score = lexical_hits[1][1] if len(lexical_hits) > 1 else 0.0
+            confident = (
+                lexical_hits[0][1] >= min_lexical_score and lexical_hits[0][1] >= lexical_confidence * second_score
+            )
+        span.set(n_results=len(results), confident=confident)
+
+    return {"results": results, "confident": confident}
+
+
+def search_knowledgebase_batch(
+    search_client,
+    embedding_model,
+    search_queries: List[str],
+    lexical_index=None,
+    top: int = 5,
+    rrf_k: int = 60,
+    lexical_confidence: float = 2.0,
+    min_lexical_score: float = 10.0,
+    lexical_results: List[Dict] = None,
+    vectors: List = None,
+) -> List[List[Dict]]:
+    """
+    Searches the knowledge base for several queries at once.
+
+    All the queries are embedded in a single call and searched concurrently. A chunk may be returned for more than
+    one query, the caller judges it once and reuses the verdict (see ChatBot._ask_data_queries).
+
+    Args:
+        search_client: An instance of the search client.
+        embedding_model: Embedding model.
+        search_queries: The queries to search for in the knowledge base.
+        lexical_index: Optional BM25Index, searches are hybrid as in search_knowledgebase_hybrid if given.
+        top: Number of results per query.
+        rrf_k: Rank constant of the reciprocal rank fusion.
+        lexical_confidence: Minimum ratio between the first and second lexical scores to skip the vector search.
+        min_lexical_score: Minimum BM25 score of the first lexical result to skip the vector search.
+        lexical_results: Result of search_lexical of every query if already searched, None entries are searched.
+        vectors: Embedding of every query if already embedded, None entries are embedded.
+
+    Returns:
+        list: The list of search results of every query.
+    """
+    # Queries confidently answered by the lexical index skip the embedding and the vector search
+    lexical_results = list(lexical_results or [None] * len(search_queries))
+    if lexical_index is not None:
+        for i, search_query in enumerate(search_queries):
+            if lexical_results[i] is None:
+                lexical_results[i] = search_lexical(
+                    lexical_index, search_query, top, lexical_confidence, min_lexical_score
+                )
+    vector_positions = [i for i, lexical in enumerate(lexical_results) if lexical is None or not lexical["confident"]]
+
+    all_results = [lexical["results"] if lexical is not None else [] for lexical in lexical_results]
+    if len(vector_positions) > 0:
+        # Only the queries not embedded yet are sent to the embedding model, in a single call
+        vectors = list(vectors or [None] * len(search_queries))
+        missing = [i for i in vector_positions if vectors[i] is None]
+        if len(missing) > 0:
+            for i, vector in zip(missing, embedding_model.predict([search_queries[i] for i in missing])):
+                vectors[i] = vector
+
+        with ThreadPoolExecutor(max_workers=len(vector_positions)) as executor:
+            vector_results = list(
+                executor.map(
+                    tracer.bind(lambda vector: search_vector(search_client, vector, top)),
+                    [vectors[i] for i in vector_positions],
+                )
+            )
+
+        for i, results in zip(vector_positions, vector_results):
+            if lexical_results[i] is None:
+                all_results[i] = results
+            else:
+                all_results[i] = reciprocal_rank_fusion([results, lexical_results[i]["results"]], top=top, k=rrf_k)
+
+    return all_results
@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from chatbot import ChatBot
+from models.image_jobs import ImageJobQueue
+
+
+class ChatServer:
+    """
+    Asyncio HTTP server around a ChatBot, serving many users from one process.
+
+    Every session keeps its own history and is evicted after being idle. Turns run in a pool of
+    max_concurrent_turns threads (the model clients are blocking), later turns wait in a bounded queue
+    and are rejected with 503 when it is full. Answers are streamed as they are generated, and a turn is
+    cancelled when its client disconnects.
+
+    Endpoints:
+        POST /chat {"session_id": optional, "message": str} -> streamed text/plain answer,
+            the session id (up to 64 letters, digits, '-' or '_') is returned in the X-Session-Id header.
+        DELETE /sessions/<session_id> -> forgets a session.
+        GET /images/<job_id> -> the image of a create_image job once done, otherwise JSON with its status.
+        GET /health -> JSON with the number of sessions, running and queued turns.
+    """
+
+    IMAGE_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+    # Session ids chosen by the clients
+    SESSION_ID_PATTERN = r"[A-Za-z0-9_-]{1,64}"
+
+    # Marks the end of a turn in the queue of deltas
+    _END = object()
+
+    def __init__(
+        self,
+        chatbot: ChatBot,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        max_concurrent_turns: int = 8,
+        max_queued_turns: int = 32,
+        session_ttl: float = 30 * 60,
+        max_sessions: int = 10000,
+        max_request_bytes: int = 64 * 1024,
+    ):
+        """
+        Initializes the ChatServer.
+
+        Args:
+            chatbot (ChatBot): Chatbot shared by all the sessions.
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 for a free one.
+            max_concurrent_turns (int): Maximum number of turns running at the same time.
+            max_queued_turns (int): Maximum number of turns waiting for a slot, more are rejected.
+            session_ttl (float): Seconds a session is kept without activity.
+            max_sessions (int): Maximum number of sessions, least recently used are evicted.
+            max_request_bytes (int): Maximum size of a request body.
+        """
+        self.chatbot = chatbot
+        self.host = host
+        self.port = port
+        self.max_concurrent_turns = max_concurrent_turns
+        self.max_queued_turns = max_queued_turns
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.max_request_bytes = max_request_bytes
+
+        self.sessions = {}
+        self.running_turns = 0
+        self.queued_turns = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_turns)
+        self.slots = None
+        self.server = None
+        self.eviction_task = None
+
+    async def start(self):
+        """Starts listening, self.port is updated with the bound port."""
+        self.slots = asyncio.Semaphore(self.max_concurrent_turns)
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.eviction_task = asyncio.create_task(self._evict_idle_sessions())
+        print(f"Serving on http://{self.host}:{self.port}")
+
+    async def serve(self):
+        """Starts the server and serves until cancelled."""
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        self.eviction_task.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.sessions),
+            "running_turns": self.running_turns,
+            "queued_turns": self.queued_turns,
+        }
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves a single request per connection"""
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                await self._send_json(writer, 400, {"error": "Bad request"})
+                return
+
+            method, path, body = request
+            if method == "POST" and path == "/chat":
+                await self._chat(reader, writer, body)
+            elif method == "DELETE" and path.startswith("/sessions/"):
+                found = self.sessions.pop(path[len("/sessions/") :], None) is not None
+                await self._send_json(writer, 200 if found else 404, {"deleted": found})
+            elif method == "GET" and path.startswith("/images/"):
+                await self._image(writer, path[len("/images/") :])
+            elif method == "GET" and path == "/health":
+                await self._send_json(writer, 200, self.stats())
+            else:
+                await self._send_json(writer, 404, {"error": "Not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple:
+        """Reads the method, path and JSON body of a request, None if it is malformed"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            return None
+
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            return None
+        method, path, _ = parts
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            return None
+        if length < 0 or length > self.max_request_bytes:
+            return None
+        body = {}
+        if length > 0:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except ValueError:
+                return None
+
+        return method, path, body
+
+    async def _chat(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, body: Dict):
+        """Runs a turn of a session, streaming the answer"""
+        if not isinstance(body, dict) or not isinstance(body.get("message"), str):
+            await self._send_json(writer, 400, {"error": "A 'message' string is required"})
+            return
+
+        # Backpressure: reject when too many turns are already waiting
+        if self.queued_turns >= self.max_queued_turns:
+            await self._send_json(writer, 503, {"error": "Server busy, try again later"}, {"Retry-After": "1"})
+            return
+
+        # The id is sent back in a header and used as a key, only short ids of safe characters are accepted
+        session_id = body.get("session_id")
+        valid = isinstance(session_id, str) and re.fullmatch(self.SESSION_ID_PATTERN, session_id) is not None
+        if session_id is not None and not valid:
+            await self._send_json(writer, 400, {"error": "'session_id' must be 1 to 64 letters, digits, '-' or '_'"})
+            return
+        session_id = session_id or uuid.uuid4().hex
+        session = self._get_session(session_id)
+
+        # Turns of the same session run one after another, the other sessions share the slots
+        cancelled = threading.Event()
+        disconnect = asyncio.create_task(self._wait_disconnect(reader))
+        self.queued_turns += 1
+        try:
+            wait_slot = asyncio.create_task(self._acquire(session))
+            done, _ = await asyncio.wait({wait_slot, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if wait_slot not in done:
+                # The client left while queued
+                wait_slot.cancel()
+                return
+        finally:
+            self.queued_turns -= 1
+
+        self.running_turns += 1
+        try:
+            session["last_access"] = time.monotonic()
+            messages = session["messages"] + [{"role": "user", "content": body["message"]}]
+            generated_messages = []
+
+            writer.write(
+                (
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: text/plain; charset=utf-8\r\n"
+                    "Transfer-Encoding: chunked\r\n"
+                    "Cache-Control: no-cache\r\n"
+                    f"X-Session-Id: {session_id}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("latin-1")
+            )
+            await writer.drain()
+
+            deltas = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            turn = loop.run_in_executor(
+                self.executor, self._run_turn, messages, generated_messages, deltas, loop, cancelled
+            )
+
+            completed = await self._stream(writer, deltas, disconnect)
+            if not completed:
+                cancelled.set()
+            await turn
+
+            # Only completed turns are part of the history
+            if completed and not cancelled.is_set():
+                session["messages"] = messages + generated_messages
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            disconnect.cancel()
+            session["last_access"] = time.monotonic()
+            self.running_turns -= 1
+            self._release(session)
+
+    async def _image(self, writer: asyncio.StreamWriter, job_id: str):
+        """Sends the image of a job, or its status while it is not done"""
+        image_jobs = getattr(self.chatbot, "image_jobs", None)
+        job = image_jobs.status(job_id) if image_jobs is not None else None
+        if job is None:
+            await self._send_json(writer, 404, {"error": "Unknown image job"})
+            return
+        if job["status"] != ImageJobQueue.DONE:
+            await self._send_json(writer, 200, {"job_id": job_id, "status": job["status"], "error": job["error"]})
+            return
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self._read_file, job["path"])
+        extension = os.path.splitext(job["path"])[1].lstrip(".")
+        head = "HTTP/1.1 200 OK\r\n"
+        head += f"Content-Type: {self.IMAGE_TYPES.get(extension, 'application/octet-stream')}\r\n"
+        head += f"Content-Length: {len(data)}\r\n"
+        head += "Cache-Control: max-age=86400\r\n"
+        head += "Connection: close\r\n\r\n"
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _stream(self, writer: asyncio.StreamWriter, deltas: asyncio.Queue, disconnect: asyncio.Task) -> bool:
+        """Writes the deltas of a turn as chunks, returns False if the client disconnected"""
+        while True:
+            get_delta = asyncio.create_task(deltas.get())
+            done, _ = await asyncio.wait({get_delta, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if get_delta not in done:
+                get_delta.cancel()
+                return False
+
+            delta = get_delta.result()
+            if delta is self._END:
+                return True
+
+            data = delta.encode("utf-8")
+            if len(data) == 0:
+                continue
+            try:
+                writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                await writer.drain()
+            except ConnectionError:
+                return False
+
+    def _run_turn(
+        self,
+        messages: List[Dict],
+        generated_messages: List[Dict],
+        deltas: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop,
+        cancelled: threading.Event,
+    ):
+        """Runs a turn in a worker thread, sending the deltas to the event loop until done or cancelled"""
+        # The chatbot also checks the event before every model call of the tool step
+        stream = self.chatbot.chat_stream(messages, generated_messages, cancelled=cancelled)
+        try:
+            for delta in stream:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(deltas.put_nowait, delta)
+        finally:
+            # Closing the generator also closes the streamed request to the model
+            stream.close()
+            loop.call_soon_threadsafe(deltas.put_nowait, self._END)
+
+    @staticmethod
+    async def _wait_disconnect(reader: asyncio.StreamReader):
+        """Returns when the client closes the connection, bytes sent after the request are ignored"""
+        while len(await reader.read(4096)) > 0:
+            pass
+
+    async def _acquire(self, session: Dict):
+        await session["lock"].acquire()
+        try:
+            await self.slots.acquire()
+        except BaseException:
+            session["lock"].release()
+            raise
+
+    def _release(self, session: Dict):
+        self.slots.release()
+        session["lock"].release()
+
+    def _get_session(self, session_id: str) -> Dict:
+        """Returns a session, creating it (and evicting the least recently used if full) when new"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                idle = [s for s in self.sessions if not self.sessions[s]["lock"].locked()]
+                if len(idle) > 0:
+                    self.sessions.pop(min(idle, key=lambda s: self.sessions[s]["last_access"]))
+            session = {"messages": [], "last_access": time.monotonic(), "lock": asyncio.Lock()}
+            self.sessions[session_id] = session
+        return session
+
+    async def _evict_idle_sessions(self):
+        """Periodically forgets the sessions idle for longer than session_ttl"""
+        while True:
+            await asyncio.sleep(min(60, self.session_ttl))
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if now - session["last_access"] > self.session_ttl and not session["lock"].locked():
+                    self.sessions.pop(session_id, None)
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, data: Dict, headers: Dict = None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+        payload = json.dumps(data).encode("utf-8")
+        head = f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+        head += "Content-Type: application/json\r\n"
+        head += f"Content-Length: {len(payload)}\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        head += "Connection: close\r\n\r\n"
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
@@ -1,18 +1,72 @@
+import codecs
+from typing import Iterator, List, NamedTuple
+
+
+class Paragraph(NamedTuple):
+    """A paragraph (non empty line) of a book, with its position in the file in bytes"""
+
+    text: str
+    start: int
+    end: int
+
+
 class Book:
 
     def __init__(
         self,
         path: str,
+        encoding: str = "utf-8",
+        errors: str = "strict",
+        buffer_size: int = 1024 * 1024,
     ):
         """
-        Initializes the Book class from the path and loads text.
+        Initializes the Book class from the path. The text is not loaded, paragraphs are read on demand.
 
         Args:
-            path (str):
+            path (str): Path of the text file.
+            encoding (str): Encoding of the file, it must keep "\\n" as a single byte (UTF-8, Latin-1...).
+            errors (str): How to handle undecodable bytes, as in bytes.decode ("strict", "replace"...).
+            buffer_size (int): Size of the read buffer, in bytes.
         """
         self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self.buffer_size = buffer_size
+
+    def iter_paragraphs(self) -> Iterator[Paragraph]:
+        """
+        Yields the paragraphs of the book, reading the file in buffered blocks.
+
+        Returns:
+            Iterator[Paragraph]: Paragraphs with their text and the byte offsets of their start and end
+                (without the line break) in the file.
+        """
+        offset = 0
+        with open(self.path, "rb", buffering=self.buffer_size) as f:
+            for line in f:
+                start = offset
+                offset += len(line)
+
+                # A UTF-8 byte order mark is not part of the text
+                is_utf8 = codecs.lookup(self.encoding).name in ("utf-8", "utf-8-sig")
+                if start == 0 and is_utf8 and line.startswith(codecs.BOM_UTF8):
+                    line = line[len(codecs.BOM_UTF8) :]
+                    start = len(codecs.BOM_UTF8)
+
+                content = line.rstrip(b"\r\n")
+                if len(content) == 0:
+                    continue
+
+                try:
+                    text = content.decode(self.encoding, self.errors)
+                except UnicodeDecodeError as e:
+                    raise ValueError(
+                        f"{self.path}: bytes {start + e.start}-{start + e.end} are not valid {self.encoding}"
+                    ) from e
 
-        with open(path) as f:
-            self.text = f.read()
+                yield Paragraph(text, start, start + len(content))
 
-        self.paragraphs = [p for p in self.text.split("\n") if len(p) > 0]
+    @property
+    def paragraphs(self) -> List[str]:
+        """Text of all the paragraphs of the book."""
+        return [paragraph.text for paragraph in self.iter_paragraphs()]
@@ -1,6 +1,8 @@
 import os
 import pandas as pd
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import sys
 
@@ -10,6 +12,24 @@ sys.path.append(".")
 from models.embedding_model import AzureAIEmbedding
 from chunker import Chunker
 from book import Book
+from index_manifest import IndexManifest
+from near_duplicates import NearDuplicateDetector
+
+
+# Chunker of every worker process, created once when the worker starts
+_worker_chunker = None
+
+
+def _init_chunk_worker(chunk_size: int, chunk_overlap: int):
+    """Loads the chunker (and its tokenizer) of a worker process"""
+    global _worker_chunker
+    _worker_chunker = Chunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _chunk_book_worker(path_file: str):
+    """Generate chunks for a book in a worker process"""
+    book = Book(path_file)
+    return _worker_chunker.split_paragraphs(book.iter_paragraphs())
 
 
 class BookIndexer:
@@ -19,10 +39,20 @@ class BookIndexer:
         orig_data_path: str,
         chunker: Chunker,
         embedding_model: AzureAIEmbedding,
+        n_workers: int = 1,
+        near_duplicates: NearDuplicateDetector = None,
     ):
+        """
+        Args:
+            n_workers (int): Number of processes used to chunk the books, sequential if 1.
+            near_duplicates (NearDuplicateDetector): Optional detector, near-duplicate chunks are collapsed
+                (or only reported) before being embedded by iter_chunk_records.
+        """
         self.orig_data_path = orig_data_path
         self.embedding_model = embedding_model
         self.chunker = chunker
+        self.n_workers = n_workers
+        self.near_duplicates = near_duplicates
         self.files_mapping = []
 
         self.index_column_names = [
@@ -30,13 +60,17 @@ class BookIndexer:
             "document",
             "content",
             "path",
+            "start",
+            "end",
             "vector",
         ]
 
     def load_data(self):
         """Loads all files"""
         for root, dir, filenames in os.walk(self.orig_data_path):
-            for fname in filenames:
+            # Sorted, so every run sees the books (and the originals of the duplicates) in the same order
+            dir.sort()
+            for fname in sorted(filenames):
 
                 # Get file information
                 extension = os.path.splitext(fname)[-1]
@@ -55,28 +89,144 @@ class BookIndexer:
 
         return self.files_mapping
 
+    def load_changed_data(self, manifest: IndexManifest):
+        """Loads only the files that are new or changed since the manifest was committed.
+
+        Returns:
+            dict: The delta, as in IndexManifest.diff.
+        """
+        self.files_mapping = []
+        self.load_data()
+        delta = manifest.diff(self.files_mapping)
+        self.files_mapping = delta["new"] + delta["changed"]
+
+        # The chunks of the unchanged books are not read again, their duplicates are found by their signatures
+        if self.near_duplicates is not None:
+            manifest.seed_near_duplicates(self.near_duplicates, delta["unchanged"])
+        return delta
+
     def generate_chunks(self):
         """Generates chunks for all files"""
+        if self.n_workers > 1:
+            return self.generate_chunks_parallel()
+
         for fmap in self.files_mapping:
             book = Book(fmap["path_file"])
             chunks = self.chunk_single_book(book)
             fmap["chunks"] = chunks
         return self.files_mapping
 
+    def generate_chunks_parallel(self):
+        """Generates chunks for all files, spreading the books across worker processes.
+        The chunks are the same, and in the same order, as in the sequential path."""
+        paths = [fmap["path_file"] for fmap in self.files_mapping]
+        with ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=_init_chunk_worker,
+            initargs=(self.chunker.chunk_size, self.chunker.chunk_overlap),
+        ) as executor:
+            for fmap, chunks in zip(self.files_mapping, executor.map(_chunk_book_worker, paths)):
+                fmap["chunks"] = chunks
+        return self.files_mapping
+
     def chunk_single_book(self, book: Book):
-        """Generate chunks for a book"""
-        chunks = self.chunker.split_paragraphs(book.paragraphs)
+        """Generate chunks for a book, streaming its paragraphs from the file"""
+        chunks = self.chunker.split_paragraphs(book.iter_paragraphs())
         return chunks
 
+    @staticmethod
+    def chunk_id(document: str, i: int) -> str:
+        """Returns the index id of the i-th chunk of a document"""
+        return re.sub(r"\W+", "", f"{document}_{i}")
+
+    def iter_book_chunks(self):
+        """Yields the file mappings with their chunks, in order.
+        Books are chunked on demand unless generate_chunks was already run, by the worker processes if
+        n_workers > 1. Only a few books ahead are chunked, so the memory use does not grow with the corpus."""
+        if self.n_workers <= 1:
+            for fmap in self.files_mapping:
+                yield fmap, fmap["chunks"] if "chunks" in fmap else self.chunk_single_book(Book(fmap["path_file"]))
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=_init_chunk_worker,
+            initargs=(self.chunker.chunk_size, self.chunker.chunk_overlap),
+        ) as executor:
+            pending = deque()
+            try:
+                for fmap in self.files_mapping:
+                    future = None if "chunks" in fmap else executor.submit(_chunk_book_worker, fmap["path_file"])
+                    pending.append((fmap, future))
+                    if len(pending) > 2 * self.n_workers:
+                        fmap, future = pending.popleft()
+                        yield fmap, fmap["chunks"] if future is None else future.result()
+                while pending:
+                    fmap, future = pending.popleft()
+                    yield fmap, fmap["chunks"] if future is None else future.result()
+            finally:
+                # Stopped early, the books not started yet are not chunked
+                for _, future in pending:
+                    if future is not None:
+                        future.cancel()
+
+    def iter_chunk_records(self):
+        """Yields the index records (without embeddings) of all files, one book at a time.
+        Books are chunked by iter_book_chunks. Records keep the 'tokens' counted by the chunker, the IndexPipeline
+        drops them before the upload.
+        The ids of the yielded chunks are kept in the 'chunk_ids' of every file mapping, the books holding
+        the originals of its collapsed duplicates in 'depends_on', and the MinHash signatures of its originals in
+        'signatures', so later incremental runs can check new books against them."""
+        for fmap, chunks in self.iter_book_chunks():
+            document = fmap["file"]
+            path = fmap["path_file"]
+            fmap["chunk_ids"] = []
+            depends_on = set()
+            if self.near_duplicates is not None:
+                fmap["signatures"] = {}
+
+            for i, chunk in enumerate(chunks):
+                chunk_id = self.chunk_id(document, i)
+
+                if self.near_duplicates is not None:
+                    signature = self.near_duplicates.signature(chunk["content"])
+                    original = self.near_duplicates.add(
+                        chunk_id, chunk["content"], path, chunk.get("tokens"), signature=signature
+                    )
+                    if original is None:
+                        fmap["signatures"][chunk_id] = signature.tolist()
+                    elif self.near_duplicates.collapse:
+                        depends_on.add(original["source"])
+                        continue
+
+                fmap["chunk_ids"].append(chunk_id)
+                yield {
+                    "id": chunk_id,
+                    "document": document,
+                    "content": chunk["content"],
+                    "path": path,
+                    # Byte range of the chunk in the book
+                    "start": chunk.get("start"),
+                    "end": chunk.get("end"),
+                    # Counted by the chunker, the embedding model packs its requests with it
+                    "tokens": chunk.get("tokens"),
+                }
+
+            fmap["depends_on"] = sorted(depends_on - {path})
+
     def _create_df_chunks(self, chunks, document, path):
         """Creates a DF with the extra metadata and the embeddigns for a single file"""
         # Convert to DF
         df_chunks = pd.DataFrame(chunks)
 
         # Generate additional data
-        df_chunks["id"] = [re.sub(r"\W+", "", f"{document}_{i}") for i in range(len(df_chunks))]
+        df_chunks["id"] = [self.chunk_id(document, i) for i in range(len(df_chunks))]
         df_chunks["document"] = document
         df_chunks["path"] = path
+        # Byte range of the chunk in the book, missing for chunks not split from paragraphs (e.g. split_tokens)
+        for column in ["start", "end"]:
+            if column not in df_chunks:
+                df_chunks[column] = None
 
         # Generate embeddings
         df_chunks["vector"] = self.embedding_model.predict(df_chunks["content"].to_list()).tolist()
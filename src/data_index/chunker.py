@@ -1,4 +1,58 @@
-import tiktoken
+import os
+import bisect
+import shutil
+import hashlib
+import threading
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+
+# Folder where tiktoken caches the encodings, so they are downloaded once and later starts work offline.
+# A bundled <encoding_name>.tiktoken file placed here is used as well.
+TOKENIZER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "tokenizers")
+
+ENCODING_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+    "p50k_base": "https://openaipublic.blob.core.windows.net/encodings/p50k_base.tiktoken",
+    "r50k_base": "https://openaipublic.blob.core.windows.net/encodings/r50k_base.tiktoken",
+}
+
+# Encodings loaded in this process, shared by all the TokenCounters
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(encoding_name: str):
+    """
+    Returns a tiktoken encoding, loading it on first use.
+
+    Args:
+        encoding_name (str): The name of the encoding.
+
+    Returns:
+        tiktoken.Encoding: The encoding, the same instance for every caller.
+    """
+    with _encodings_lock:
+        if encoding_name not in _encodings:
+            cache_dir = os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR)
+            _use_bundled_encoding(cache_dir, encoding_name)
+
+            import tiktoken
+
+            _encodings[encoding_name] = tiktoken.get_encoding(encoding_name)
+        return _encodings[encoding_name]
+
+
+def _use_bundled_encoding(cache_dir: str, encoding_name: str):
+    """Copies a bundled <encoding_name>.tiktoken file to the name tiktoken looks for in its cache"""
+    bundled_path = os.path.join(cache_dir, f"{encoding_name}.tiktoken")
+    if encoding_name not in ENCODING_URLS or not os.path.exists(bundled_path):
+        return
+
+    cache_path = os.path.join(cache_dir, hashlib.sha1(ENCODING_URLS[encoding_name].encode()).hexdigest())
+    if not os.path.exists(cache_path):
+        shutil.copyfile(bundled_path, cache_path)
 
 
 class TokenCounter:
@@ -8,13 +62,20 @@ class TokenCounter:
         encoding_name: str = "",
     ):
         """
-        Initializes the TokenCounter class.
+        Initializes the TokenCounter class. The encoding is loaded on first use.
 
         Args:
             encoding_name (str):  The name of the encoding.
         """
         self.encoding_name = encoding_name
-        self.encoding = tiktoken.get_encoding(self.encoding_name)
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        """The tiktoken encoding, shared with the other TokenCounters of the same encoding."""
+        if self._encoding is None:
+            self._encoding = get_encoding(self.encoding_name)
+        return self._encoding
 
     def num_tokens_from_string(self, text: str) -> int:
         """
@@ -29,6 +90,30 @@ class TokenCounter:
         num_tokens = len(self.encoding.encode(text))
         return num_tokens
 
+    def encode_batch(self, texts: List[str]) -> List[List[int]]:
+        """
+        Returns the tokens of several text strings, encoded in parallel.
+
+        Args:
+            texts (List[str]): The text strings.
+
+        Returns:
+            list: The tokens of every text string.
+        """
+        return self.encoding.encode_batch(texts)
+
+    def num_tokens_from_strings(self, texts: List[str]) -> List[int]:
+        """
+        Returns the number of tokens of several text strings, encoded in parallel.
+
+        Args:
+            texts (List[str]): The text strings.
+
+        Returns:
+            list: The number of tokens of every text string.
+        """
+        return [len(tokens) for tokens in self.encode_batch(texts)]
+
 
 class Chunker:
     """
@@ -47,68 +132,116 @@ class Chunker:
         self.chunk_overlap = chunk_overlap
         self.token_counter = TokenCounter("cl100k_base")
 
-    def split_paragraphs(self, paragraphs: list[str]):
+    def split_paragraphs(self, paragraphs: Iterable) -> List[dict]:
         """
         Split paragraphs into text chunks, keeping track of token limits.
 
-        This function divides a list of paragraphs into text chunks based on specified conditions.
-        It ensures that chunks do not exceed a maximum token size.
-        Finally, it returns a list of chunks containing the text.
+        Args:
+            paragraphs (Iterable): Paragraphs, as strings or as book.Paragraph with their byte offsets.
+
+        Returns:
+            list: List of text chunks, as in iter_chunks.
+        """
+        return list(self.iter_chunks(paragraphs))
+
+    def iter_chunks(self, paragraphs: Iterable, batch_size: int = 256) -> Iterator[dict]:
+        """
+        Split paragraphs into text chunks, keeping track of token limits, as they are read.
+
+        This function divides a stream of paragraphs into text chunks based on specified conditions.
+        It ensures that chunks do not exceed a maximum token size, and that consecutive chunks
+        share their last paragraphs up to the overlap size.
+        Paragraphs are tokenized exactly once, in batches, and only the paragraphs of the current chunk are kept.
+        Chunk boundaries are placed with the prefix sums of the token counts. Paragraphs that are too big
+        are split into token windows.
 
         Args:
-            paragraphs (list): List of paragraphs.
+            paragraphs (Iterable): Paragraphs, as strings or as book.Paragraph with their byte offsets.
+            batch_size (int): Number of paragraphs tokenized at once.
 
         Returns:
-            list: List of text chunks
+            Iterator[dict]: Text chunks, with the content and the number of tokens of their paragraphs.
+                When the paragraphs have byte offsets, the chunks also have the 'start' and 'end' of their
+                paragraphs in the file (the windows of a split paragraph keep the offsets of the whole paragraph).
         """
-        chunks = []
-        auxiliar_paragraphs = []
-        n_token = 0
-        for paragraph in paragraphs:
-
-            # Calculate the number of tokens in the paragraph
-            n_token_current = self.token_counter.num_tokens_from_string(text=paragraph)
-
-            # If including the new paragraph exceeds the maximum token size, close chunk and start new
-            if n_token + n_token_current >= self.chunk_size:
-
-                if len(auxiliar_paragraphs) > 0:
-                    chunk_content = "\n".join([p for p in auxiliar_paragraphs])
-                    chunks.append(
-                        {
-                            "content": chunk_content,
-                            "tokens": self.token_counter.num_tokens_from_string(chunk_content),
-                        }
-                    )
-
-                    # Overlapping last paragraphs
-                    new_auxiliar_paragraphs = []
-                    last_paragraph = auxiliar_paragraphs.pop()
-                    n_token = self.token_counter.num_tokens_from_string(last_paragraph)
-                    while n_token < self.chunk_overlap and len(auxiliar_paragraphs) > 0:
-                        new_auxiliar_paragraphs = [last_paragraph] + new_auxiliar_paragraphs
-                        last_paragraph = auxiliar_paragraphs.pop() if auxiliar_paragraphs else False
-                        new = self.token_counter.num_tokens_from_string(last_paragraph) if last_paragraph else 0
-                        n_token += new
-                    auxiliar_paragraphs = new_auxiliar_paragraphs
-
-            # If the paragraph itself is too big, split it into smaller chunks
-            if n_token_current >= self.chunk_size:
-                splitted_paragraph = self.text_splitter.split_text(paragraph)
-                for spl in splitted_paragraph:
-                    chunks.append(
-                        {
-                            "content": spl,
-                        }
-                    )
-            # If it fits just append the paragraph
-            else:
-                n_token += n_token_current
-                auxiliar_paragraphs.append(paragraph)
-
-        # If there are paragraphs left, split them into chunks and add them to the list
-        if auxiliar_paragraphs:
-            chunk_content = "\n".join([p for p in auxiliar_paragraphs])
-            chunks.append({"content": chunk_content})
+        # Paragraphs of the current chunk, prefix[i] is the number of tokens before window[i]
+        window = []
+        offsets = []
+        prefix = [0]
+
+        paragraphs = iter(paragraphs)
+        while True:
+            batch = list(islice(paragraphs, batch_size))
+            if len(batch) == 0:
+                break
+
+            texts = [paragraph if isinstance(paragraph, str) else paragraph.text for paragraph in batch]
+            for paragraph, text, tokens in zip(batch, texts, self.token_counter.encode_batch(texts)):
+                i = len(window)
+                window.append(text)
+                offsets.append(None if isinstance(paragraph, str) else (paragraph.start, paragraph.end))
+                prefix.append(prefix[-1] + len(tokens))
+
+                # If including the new paragraph exceeds the maximum token size, close chunk and start new
+                if prefix[i + 1] - prefix[0] >= self.chunk_size:
+
+                    if i > 0:
+                        yield self._make_chunk(window, offsets, prefix, i)
+
+                        # Overlapping last paragraphs: the longest suffix under the overlap size, never the whole chunk
+                        start = bisect.bisect_right(prefix, prefix[i] - self.chunk_overlap, 1, i)
+
+                        # Drop the overlap if the new paragraph would not fit with it
+                        if prefix[i + 1] - prefix[start] >= self.chunk_size:
+                            start = i
+
+                        del window[:start], offsets[:start], prefix[:start]
+                        i -= start
+
+                # If the paragraph itself is too big, split it into smaller chunks
+                if len(tokens) >= self.chunk_size:
+                    for chunk in self.split_tokens(tokens):
+                        if offsets[i] is not None:
+                            chunk["start"], chunk["end"] = offsets[i]
+                        yield chunk
+                    del window[:], offsets[:], prefix[:-1]
+
+        # If there are paragraphs left, add them as the last chunk
+        if len(window) > 0:
+            yield self._make_chunk(window, offsets, prefix, len(window))
+
+    def split_tokens(self, tokens: List[int]) -> List[dict]:
+        """
+        Split the tokens of a paragraph into overlapping windows of the maximum token size.
 
+        Args:
+            tokens (list): Tokens of the paragraph.
+
+        Returns:
+            list: List of text chunks.
+        """
+        chunks = []
+        stride = max(1, self.chunk_size - self.chunk_overlap)
+        for window_start in range(0, len(tokens), stride):
+            window = tokens[window_start : window_start + self.chunk_size]
+            chunks.append(
+                {
+                    "content": self.token_counter.encoding.decode(window),
+                    "tokens": len(window),
+                }
+            )
+            if window_start + self.chunk_size >= len(tokens):
+                break
         return chunks
+
+    @staticmethod
+    def _make_chunk(paragraphs: List[str], offsets: List[tuple], prefix: List[int], end: int) -> dict:
+        """Creates the chunk of the first paragraphs of the window, until end."""
+        chunk = {
+            "content": "\n".join(paragraphs[:end]),
+            "tokens": prefix[end] - prefix[0],
+        }
+        if offsets[0] is not None:
+            chunk["start"] = offsets[0][0]
+            chunk["end"] = offsets[end - 1][1]
+        return chunk
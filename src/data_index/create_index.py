@@ -46,6 +46,9 @@ fields = [
         filterable=True,
         facetable=True,
     ),
+    # Byte range of the chunk in the book
+    SimpleField(name="start", type=SearchFieldDataType.Int64, filterable=True, sortable=True),
+    SimpleField(name="end", type=SearchFieldDataType.Int64, filterable=True, sortable=True),
     SearchField(
         name="vector",
         type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
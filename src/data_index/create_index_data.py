@@ -1,27 +1,48 @@
 import sys
-import json
 
 sys.path.append("..")
 sys.path.append(".")
 
 from chunker import Chunker
 from models.embedding_model import AzureAIEmbedding
+from models.embedding_cache import EmbeddingCache
 from book_indexer import BookIndexer
-
-chunker = Chunker()
-
-endpoint = ...
-token = ...
-model_name = "cohere-v3-multilingual-01"
-embeddings_model = AzureAIEmbedding(endpoint=endpoint, token=token, model_name=model_name)
-
-book_indexer = BookIndexer("/......./data/books", chunker, embeddings_model)
-
-book_indexer.load_data()
-book_indexer.generate_chunks()
-book_indexer.generate_final_data()
-
-final_data_index = book_indexer.final_data_index
-
-with open("/......../data/generated/final_data_index.json", "w") as f:
-    json.dump(final_data_index, f)
+from local_search import LocalSearchClient
+from index_data import IndexDataWriter, IndexDataReader
+from lexical_index import BM25Index
+from index_pipeline import IndexPipeline
+
+INDEX_DATA_PATH = "/......../data/generated/final_data_index"
+
+# The chunking worker processes import this module when they are spawned, so the script only runs as main
+if __name__ == "__main__":
+    chunker = Chunker()
+
+    endpoint = ...
+    token = ...
+    model_name = "cohere-v3-multilingual-01"
+    # Re-runs only embed the chunks that changed
+    embedding_cache = EmbeddingCache("/......../data/generated/embedding_cache.sqlite")
+    embeddings_model = AzureAIEmbedding(
+        endpoint=endpoint,
+        token=token,
+        model_name=model_name,
+        cache=embedding_cache,
+        max_batch_tokens=40000,
+        token_counter=chunker.token_counter,
+        max_workers=4,
+    )
+
+    book_indexer = BookIndexer("/......./data/books", chunker, embeddings_model, n_workers=4)
+
+    # Chunks and embeddings are streamed to disk as they are generated
+    with IndexDataWriter(INDEX_DATA_PATH, dtype="float32") as writer:
+        IndexPipeline(book_indexer, writer.write).run()
+
+    # Local copy of the index, usable by the chat instead of Azure Cognitive Search
+    LocalSearchClient.create_from_index_data("/......../data/generated/local_index", INDEX_DATA_PATH)
+
+    # Lexical index of the same chunks, for hybrid search
+    BM25Index.build(IndexDataReader(INDEX_DATA_PATH).read_documents(vectors=False)).save(
+        "/......../data/generated/lexical_index.json"
+    )
@@ -0,0 +1,87 @@
+import sys
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+
+sys.path.append("..")
+sys.path.append(".")
+
+from chunker import Chunker
+from models.embedding_model import AzureAIEmbedding
+from models.embedding_cache import EmbeddingCache
+from book_indexer import BookIndexer
+from index_pipeline import IndexPipeline
+from index_manifest import IndexManifest
+from near_duplicates import NearDuplicateDetector
+from uploader import IndexUploader
+
+# Streams the books directly to the search index: chunk, embed and upload run at the same time.
+# Only run as a script, importing the module (e.g. from spawned chunking workers) does not index anything
+if __name__ == "__main__":
+    chunker = Chunker()
+
+    endpoint = ...
+    token = ...
+    model_name = "cohere-v3-multilingual-01"
+    embedding_cache = EmbeddingCache("/......../data/generated/embedding_cache.sqlite")
+    embeddings_model = AzureAIEmbedding(
+        endpoint=endpoint,
+        token=token,
+        model_name=model_name,
+        cache=embedding_cache,
+        max_batch_tokens=40000,
+        token_counter=chunker.token_counter,
+        max_workers=4,
+    )
+
+    # CREDENTIALS AZURE COGNITIVE SEARCH
+    AZURE_SEARCH_SERVICE_ENDPOINT = ...
+    AZURE_SEARCH_ADMIN_KEY = ...
+    AZURE_SEARCH_INDEX_NAME = "cosmere"
+
+    cogs_credential = AzureKeyCredential(AZURE_SEARCH_ADMIN_KEY)
+    search_client = SearchClient(
+        endpoint=AZURE_SEARCH_SERVICE_ENDPOINT,
+        index_name=AZURE_SEARCH_INDEX_NAME,
+        credential=cogs_credential,
+    )
+
+    # Record of the indexed books, later runs only index the new and changed books. None to index everything
+    MANIFEST_PATH = "/......../data/generated/index_manifest.json"
+
+    # Repeated epigraphs, excerpts and editions are embedded and indexed once
+    near_duplicates = NearDuplicateDetector(threshold=0.85)
+    book_indexer = BookIndexer("/......./data/books", chunker, embeddings_model, near_duplicates=near_duplicates)
+
+    manifest = None
+    if MANIFEST_PATH is not None:
+        manifest = IndexManifest(MANIFEST_PATH)
+        delta = book_indexer.load_changed_data(manifest)
+        print(
+            f"{len(delta['new'])} new, {len(delta['changed'])} changed, {len(delta['deleted'])} deleted "
+            f"and {len(delta['unchanged'])} unchanged books"
+        )
+
+    # Updated chunks replace the previous ones, a failed upload stops the run before the manifest is committed
+    uploader = IndexUploader(search_client, max_workers=4, action="merge_or_upload")
+
+    def upload(documents):
+        stats = uploader.upload(documents)
+        if len(stats["failed"]) > 0:
+            raise Exception(f"{len(stats['failed'])} documents could not be uploaded")
+
+    n_documents = 0
+    if manifest is None or len(book_indexer.files_mapping) > 0:
+        n_documents = IndexPipeline(book_indexer, upload).run()
+    print(f"Indexed {n_documents} documents")
+
+    if manifest is not None:
+        # Chunks of the changed and deleted books that no longer exist
+        stale_ids = manifest.stale_chunk_ids(delta, book_indexer.files_mapping)
+        if len(stale_ids) > 0:
+            stats = IndexUploader(search_client, action="delete").upload([{"id": chunk_id} for chunk_id in stale_ids])
+            print(f"Deleted {stats['uploaded']} stale documents, failed {len(stats['failed'])}")
+            if len(stats["failed"]) > 0:
+                raise Exception("Stale documents could not be deleted, the manifest is not updated")
+        manifest.commit(delta)
+
+    print(near_duplicates.report(vector_bytes=1024 * 4))
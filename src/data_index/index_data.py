@@ -0,0 +1,210 @@
+import os
+import json
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"
+METADATA_COLUMNS = ["id", "document", "path", "content", "start", "end"]
+
+
+class IndexDataWriter:
+    """
+    Streaming writer of the generated index data.
+    Vectors are stored as a raw float32 (or float16) block that can be memory-mapped,
+    every metadata column as JSON lines with the byte offset of each row, and a small manifest.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        """
+        Initializes the IndexDataWriter.
+
+        Args:
+            path (str): Output directory.
+            dtype (str): Storage type of the vectors, "float32" or "float16".
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        self.path = path
+        self.dtype = dtype
+        self.n_rows = 0
+        self.dim = None
+
+        os.makedirs(path, exist_ok=True)
+        # The files of a previous run are overwritten, its manifest is removed until this run is complete
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            os.remove(os.path.join(path, MANIFEST_FILE))
+        self.vectors_file = open(os.path.join(path, VECTORS_FILE), "wb")
+        self.column_files = {col: open(os.path.join(path, f"{col}.jsonl"), "wb") for col in METADATA_COLUMNS}
+        self.column_offsets = {col: [0] for col in METADATA_COLUMNS}
+
+    def write(self, documents: List[Dict]):
+        """
+        Appends a batch of documents with the index fields (id, document, path, content, start, end and vector).
+        Missing metadata fields are stored as null.
+
+        Args:
+            documents (list): Documents to write.
+        """
+        if len(documents) == 0:
+            return
+
+        vectors = np.asarray([doc["vector"] for doc in documents], dtype=self.dtype)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+        self.vectors_file.write(vectors.tobytes())
+
+        for col in METADATA_COLUMNS:
+            f = self.column_files[col]
+            offsets = self.column_offsets[col]
+            for doc in documents:
+                f.write(json.dumps(doc.get(col)).encode("utf-8") + b"\n")
+                offsets.append(f.tell())
+
+        self.n_rows += len(documents)
+
+    def close(self):
+        """Writes the row offsets and the manifest, and closes the files."""
+        self._close_files()
+        for col in METADATA_COLUMNS:
+            offsets = np.asarray(self.column_offsets[col], dtype=np.uint64)
+            np.save(os.path.join(self.path, f"{col}.offsets.npy"), offsets)
+
+        manifest = {
+            "n_rows": self.n_rows,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "vectors": VECTORS_FILE,
+            "columns": METADATA_COLUMNS,
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+
+    def abort(self):
+        """Closes the files without writing the manifest, so the incomplete data cannot be read."""
+        self._close_files()
+
+    def _close_files(self):
+        self.vectors_file.close()
+        for col in METADATA_COLUMNS:
+            self.column_files[col].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class IndexDataReader:
+    """
+    Lazy reader of the index data written by IndexDataWriter.
+    Vectors are memory-mapped and metadata rows are read by range, so nothing is loaded up front.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the IndexDataReader.
+
+        Args:
+            path (str): Directory written by IndexDataWriter.
+        """
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+            self.manifest = json.load(f)
+
+        self.n_rows = self.manifest["n_rows"]
+        self.dim = self.manifest["dim"]
+        self.vectors = None
+        if self.n_rows > 0:
+            self.vectors = np.memmap(
+                os.path.join(path, self.manifest["vectors"]),
+                dtype=self.manifest["dtype"],
+                mode="r",
+                shape=(self.n_rows, self.dim),
+            )
+        self.column_offsets = {
+            col: np.load(os.path.join(path, f"{col}.offsets.npy"), mmap_mode="r") for col in self.manifest["columns"]
+        }
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def read_vectors(self, start: int = 0, end: int = None) -> np.array:
+        """
+        Reads the vectors of a row range as float32.
+
+        Args:
+            start (int): First row.
+            end (int): Row after the last one, until the end if None.
+
+        Returns:
+            np.array: Vectors, shape (end - start, dim).
+        """
+        end = self.n_rows if end is None else min(end, self.n_rows)
+        if self.vectors is None or start >= end:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.array(self.vectors[start:end], dtype=np.float32)
+
+    def read_column(self, col: str, start: int = 0, end: int = None) -> List:
+        """
+        Reads the values of a metadata column for a row range.
+
+        Args:
+            col (str): Column name.
+            start (int): First row.
+            end (int): Row after the last one, until the end if None.
+
+        Returns:
+            list: Values of the column.
+        """
+        end = self.n_rows if end is None else min(end, self.n_rows)
+        if start >= end:
+            return []
+
+        offsets = self.column_offsets[col]
+        with open(os.path.join(self.path, f"{col}.jsonl"), "rb") as f:
+            f.seek(int(offsets[start]))
+            data = f.read(int(offsets[end]) - int(offsets[start]))
+        return [json.loads(line) for line in data.splitlines()]
+
+    def read_documents(self, start: int = 0, end: int = None, vectors: bool = True) -> List[Dict]:
+        """
+        Reads the documents of a row range, in the format of the search index.
+
+        Args:
+            start (int): First row.
+            end (int): Row after the last one, until the end if None.
+            vectors (bool): Whether to include the vector field.
+
+        Returns:
+            list: Documents.
+        """
+        columns = {col: self.read_column(col, start, end) for col in self.manifest["columns"]}
+        documents = [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+        if vectors:
+            for doc, vector in zip(documents, self.read_vectors(start, end)):
+                doc["vector"] = vector.tolist()
+        return documents
+
+    def iter_documents(self, batch_size: int = 1000, vectors: bool = True) -> Iterator[List[Dict]]:
+        """
+        Yields all the documents in batches.
+
+        Args:
+            batch_size (int): Number of documents per batch.
+            vectors (bool): Whether to include the vector field.
+
+        Returns:
+            Iterator[list]: Batches of documents.
+        """
+        for start in range(0, self.n_rows, batch_size):
+            yield self.read_documents(start, start + batch_size, vectors=vectors)
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+from typing import Dict, List
+
+
+class IndexManifest:
+    """
+    Record of the indexed books: size, modification time, content hash and ids of the indexed chunks, and the
+    MinHash signatures of the chunks checked for near duplicates.
+
+    Later runs compare the books directory with it, so only the new and changed books are chunked, embedded and
+    uploaded, and the chunks of the changed and deleted books that no longer exist are deleted from the index.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initializes the IndexManifest, loading it if the file exists.
+
+        Args:
+            path (str): JSON file of the manifest.
+        """
+        self.path = path
+        self.files = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.files = json.load(f)["files"]
+
+    @staticmethod
+    def file_hash(path: str, block_size: int = 1024 * 1024) -> str:
+        """Returns the SHA-256 of the content of a file."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def diff(self, files_mapping: List[Dict]) -> Dict:
+        """
+        Compares the files with the manifest. Files with the same size and modification time are not read,
+        the others are hashed so a touched but identical file is not indexed again.
+
+        Args:
+            files_mapping (list): Files found by BookIndexer.load_data, their size, mtime and sha256 are added.
+
+        Returns:
+            dict: The 'new', 'changed' and 'unchanged' file mappings, and the 'deleted' paths.
+        """
+        delta = {"new": [], "changed": [], "unchanged": [], "deleted": []}
+        current_paths = set()
+
+        for fmap in files_mapping:
+            path = fmap["path_file"]
+            current_paths.add(path)
+            stat = os.stat(path)
+            fmap["size"] = stat.st_size
+            fmap["mtime"] = stat.st_mtime
+
+            entry = self.files.get(path)
+            if entry is not None and entry["size"] == fmap["size"] and entry["mtime"] == fmap["mtime"]:
+                fmap["sha256"] = entry["sha256"]
+                delta["unchanged"].append(fmap)
+                continue
+
+            fmap["sha256"] = self.file_hash(path)
+            if entry is None:
+                delta["new"].append(fmap)
+            elif entry["sha256"] == fmap["sha256"]:
+                delta["unchanged"].append(fmap)
+            else:
+                delta["changed"].append(fmap)
+
+        delta["deleted"] = [path for path in self.files if path not in current_paths]
+
+        # Books with duplicate chunks collapsed into a changed or deleted book are indexed again,
+        # otherwise their content could disappear from the index
+        affected = {fmap["path_file"] for fmap in delta["changed"]} | set(delta["deleted"])
+        while True:
+            dependents = [
+                fmap
+                for fmap in delta["unchanged"]
+                if affected.intersection(self.files[fmap["path_file"]].get("depends_on", []))
+            ]
+            if len(dependents) == 0:
+                break
+            for fmap in dependents:
+                delta["unchanged"].remove(fmap)
+                delta["changed"].append(fmap)
+                affected.add(fmap["path_file"])
+
+        return delta
+
+    def stale_chunk_ids(self, delta: Dict, indexed_files: List[Dict]) -> List[str]:
+        """
+        Returns the ids of the chunks to delete from the index after indexing the delta.
+
+        Args:
+            delta (dict): Result of diff.
+            indexed_files (list): File mappings indexed in this run, with their 'chunk_ids'.
+
+        Returns:
+            list: Ids of the chunks of the changed and deleted files that were not indexed again.
+        """
+        indexed_ids = {chunk_id for fmap in indexed_files for chunk_id in fmap.get("chunk_ids", [])}
+        old_paths = [fmap["path_file"] for fmap in delta["changed"]] + delta["deleted"]
+        old_ids = {chunk_id for path in old_paths for chunk_id in self.files[path]["chunk_ids"]}
+        return sorted(old_ids - indexed_ids)
+
+    def seed_near_duplicates(self, near_duplicates, files_mapping: List[Dict]):
+        """
+        Registers the chunks of books that are not indexed again as originals, so the new and changed books are
+        checked against them as in a full run.
+
+        Args:
+            near_duplicates (NearDuplicateDetector): Detector used to index the delta.
+            files_mapping (list): File mappings not indexed in this run, e.g. the 'unchanged' ones of the delta.
+        """
+        for fmap in files_mapping:
+            path = fmap["path_file"]
+            for chunk_id, signature in self.files[path].get("signatures", {}).items():
+                near_duplicates.add_original(chunk_id, path, signature)
+
+    def commit(self, delta: Dict):
+        """
+        Records the delta once it is indexed, and saves the manifest.
+
+        Args:
+            delta (dict): Result of diff, the new and changed file mappings with the 'chunk_ids' they were indexed with.
+        """
+        for fmap in delta["new"] + delta["changed"] + delta["unchanged"]:
+            entry = self.files.get(fmap["path_file"], {})
+            self.files[fmap["path_file"]] = {
+                "size": fmap["size"],
+                "mtime": fmap["mtime"],
+                "sha256": fmap["sha256"],
+                "chunk_ids": fmap.get("chunk_ids", entry.get("chunk_ids", [])),
+                "depends_on": fmap.get("depends_on", entry.get("depends_on", [])),
+                "signatures": fmap.get("signatures", entry.get("signatures", {})),
+            }
+        for path in delta["deleted"]:
+            self.files.pop(path, None)
+
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f)
+        # Atomic replace, so an interrupted run keeps the previous manifest
+        os.replace(tmp_path, self.path)
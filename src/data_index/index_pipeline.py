@@ -0,0 +1,146 @@
+import queue
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterator, List
+
+import sys
+
+sys.path.append("..")
+sys.path.append(".")
+
+from book_indexer import BookIndexer
+
+
+class IndexPipeline:
+    """
+    Streaming indexing pipeline from the books to the search index.
+    The chunk, embed and upload stages run concurrently, connected by bounded queues,
+    so memory does not grow with the corpus and uploads start while later books are still being embedded.
+    """
+
+    # Marks the end of the stream in the queues
+    _END = object()
+
+    def __init__(
+        self,
+        book_indexer: BookIndexer,
+        upload: Callable[[List[Dict]], object],
+        embed_batch_size: int = 96,
+        upload_batch_size: int = 1000,
+        queue_size: int = 4,
+    ):
+        """
+        Initializes the IndexPipeline.
+
+        Args:
+            book_indexer (BookIndexer): Indexer with the files, chunker and embedding model.
+            upload (Callable): Receives every batch of final documents, e.g. search_client.upload_documents.
+            embed_batch_size (int): Number of chunks embedded at once.
+            upload_batch_size (int): Number of documents per upload.
+            queue_size (int): Maximum number of batches waiting between two stages.
+        """
+        self.book_indexer = book_indexer
+        self.upload = upload
+        self.embed_batch_size = embed_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.queue_size = queue_size
+
+        self.n_documents = 0
+        self.errors = []
+
+    def run(self) -> int:
+        """
+        Runs the pipeline until all the books are uploaded.
+
+        Returns:
+            int: Number of uploaded documents.
+        """
+        if len(self.book_indexer.files_mapping) == 0:
+            self.book_indexer.load_data()
+
+        chunks_queue = queue.Queue(maxsize=self.queue_size)
+        documents_queue = queue.Queue(maxsize=self.queue_size)
+        self.errors = []
+        self.n_documents = 0
+
+        stages = [
+            threading.Thread(target=self._stage, args=(self._chunk_stage, None, chunks_queue)),
+            threading.Thread(target=self._stage, args=(self._embed_stage, chunks_queue, documents_queue)),
+            threading.Thread(target=self._stage, args=(self._upload_stage, documents_queue, None)),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+        return self.n_documents
+
+    def _stage(self, func: Callable, in_queue: queue.Queue, out_queue: queue.Queue):
+        """Runs a stage, always closing its output and draining its input, so a failure cannot block the others"""
+        try:
+            func(self._iter_queue(in_queue) if in_queue is not None else None, out_queue)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            if out_queue is not None:
+                out_queue.put(self._END)
+            if in_queue is not None:
+                for _ in self._iter_queue(in_queue):
+                    pass
+
+    def _iter_queue(self, in_queue: queue.Queue) -> Iterator:
+        """Yields the items of a queue until the end of the stream"""
+        while True:
+            item = in_queue.get()
+            if item is self._END:
+                # Leave the end mark for other readers of the same queue
+                in_queue.put(self._END)
+                return
+            yield item
+
+    def _chunk_stage(self, _, out_queue: queue.Queue):
+        """Chunks the books and sends the records in batches"""
+        records = self.book_indexer.iter_chunk_records()
+        while len(self.errors) == 0:
+            batch = list(islice(records, self.embed_batch_size))
+            if len(batch) == 0:
+                break
+            out_queue.put(batch)
+
+    def _embed_stage(self, batches: Iterator[List[Dict]], out_queue: queue.Queue):
+        """Adds the embeddings to every batch of records"""
+        for batch in batches:
+            if len(self.errors) > 0:
+                break
+            # The token counts are not index fields, they only spare tokenizing the chunks again
+            token_counts = [record.pop("tokens", None) for record in batch]
+            vectors = self.book_indexer.embedding_model.predict(
+                [record["content"] for record in batch],
+                token_counts=token_counts if None not in token_counts else None,
+            )
+            for record, vector in zip(batch, vectors):
+                record["vector"] = vector.tolist()
+            out_queue.put(batch)
+
+    def _upload_stage(self, batches: Iterator[List[Dict]], _):
+        """Groups the documents in upload batches and uploads them"""
+        documents = []
+        for batch in batches:
+            if len(self.errors) > 0:
+                return
+            documents += batch
+            while len(documents) >= self.upload_batch_size:
+                self._upload(documents[: self.upload_batch_size])
+                documents = documents[self.upload_batch_size :]
+
+        if len(documents) > 0 and len(self.errors) == 0:
+            self._upload(documents)
+
+    def _upload(self, documents: List[Dict]):
+        """Uploads a batch of documents"""
+        self.upload(documents)
+        self.n_documents += len(documents)
+        print(f"Uploaded {len(documents)} documents ({self.n_documents} in total)")
@@ -0,0 +1,135 @@
+import re
+import math
+import json
+import heapq
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+class BM25Index:
+    """
+    In-memory inverted index with BM25 ranking, built from the same chunks as the vector index.
+    """
+
+    STOPWORDS = {
+        "a", "al", "como", "con", "cual", "cuando", "de", "del", "donde", "el", "en", "es", "esta", "este", "fue",
+        "la", "las", "le", "lo", "los", "me", "mi", "no", "o", "para", "pero", "por", "que", "quien", "se", "si",
+        "sobre", "su", "sus", "te", "tu", "un", "una", "y", "ya",
+    }  # fmt: skip
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initializes an empty BM25Index.
+
+        Args:
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+
+        self.ids = []
+        self.contents = []
+        self.doc_lengths = []
+        self.postings = {}
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """
+        Splits a text into lowercase terms without accents, dropping stopwords.
+
+        Args:
+            text (str): Text to split.
+
+        Returns:
+            list: Terms.
+        """
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join([c for c in text if not unicodedata.combining(c)])
+        return [term for term in re.findall(r"\w+", text) if term not in cls.STOPWORDS]
+
+    @classmethod
+    def build(cls, documents: List[Dict], **kwargs) -> "BM25Index":
+        """
+        Builds the index from documents with the `id` and `content` fields.
+
+        Args:
+            documents (list): Documents to index.
+
+        Returns:
+            BM25Index: The index.
+        """
+        index = cls(**kwargs)
+        for doc in documents:
+            index.add(doc["id"], doc["content"])
+        return index
+
+    def add(self, doc_id: str, content: str):
+        """Adds a document to the index."""
+        doc_idx = len(self.ids)
+        terms = self.tokenize(content)
+        self.ids.append(doc_id)
+        self.contents.append(content)
+        self.doc_lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, []).append((doc_idx, tf))
+
+    def search(self, query: str, top: int = 5) -> List[Tuple[int, float]]:
+        """
+        Ranks the documents for a query with BM25.
+
+        Args:
+            query (str): Query text.
+            top (int): Number of results.
+
+        Returns:
+            list: (document index, score) pairs sorted by score.
+        """
+        n_docs = len(self.ids)
+        if n_docs == 0:
+            return []
+        avg_length = sum(self.doc_lengths) / n_docs
+
+        # Accumulate the scores of the documents in the postings of the query terms
+        scores = {}
+        for term in set(self.tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_idx] / avg_length)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(top, scores.items(), key=lambda x: x[1])
+
+    def get_result(self, doc_idx: int, score: float) -> Dict:
+        """Returns a search result in the format of search_utils."""
+        return {"id": self.ids[doc_idx], "score": score, "content": self.contents[doc_idx]}
+
+    def save(self, path: str):
+        """Writes the index to a JSON file."""
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "contents": self.contents,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Reads an index written with save."""
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.contents = data["contents"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in data["postings"].items()}
+        return index
@@ -0,0 +1,186 @@
+import os
+import json
+from typing import List, Dict
+
+import numpy as np
+
+from index_data import IndexDataReader
+
+
+class LocalSearchClient:
+    """
+    In-process exact vector search over the generated index data.
+    It mimics the subset of azure.search.documents.SearchClient used by the chat,
+    so both can be used interchangeably.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, index_path: str, block_size: int = 65536):
+        """
+        Initializes the LocalSearchClient from an index directory created with `create`.
+
+        Args:
+            index_path (str): Directory with the vectors and metadata files.
+            block_size (int): Number of index rows scored at once, bounds the memory used per search.
+        """
+        self.index_path = index_path
+        self.block_size = block_size
+
+        # Vectors are memory-mapped, only the pages touched by the searches are read
+        self.vectors = np.load(os.path.join(index_path, self.VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(index_path, self.METADATA_FILE), "r") as f:
+            self.metadata = json.load(f)
+
+    @classmethod
+    def create(cls, index_path: str, final_data_index: List[Dict]) -> "LocalSearchClient":
+        """
+        Writes the index data as a float32 matrix of normalized vectors plus the metadata.
+
+        Args:
+            index_path (str): Output directory.
+            final_data_index (list): Documents with the `vector` field, as generated by BookIndexer.
+
+        Returns:
+            LocalSearchClient: Client over the created index.
+        """
+        os.makedirs(index_path, exist_ok=True)
+
+        # Normalized vectors so the cosine similarity is a dot product
+        vectors = np.asarray([doc["vector"] for doc in final_data_index], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        np.save(os.path.join(index_path, cls.VECTORS_FILE), vectors)
+
+        metadata = [{k: v for k, v in doc.items() if k != "vector"} for doc in final_data_index]
+        with open(os.path.join(index_path, cls.METADATA_FILE), "w") as f:
+            json.dump(metadata, f)
+
+        return cls(index_path)
+
+    @classmethod
+    def create_from_index_data(
+        cls,
+        index_path: str,
+        index_data_path: str,
+        block_size: int = 65536,
+    ) -> "LocalSearchClient":
+        """
+        Writes the index from the generated index data directory, normalizing the vectors by blocks.
+
+        Args:
+            index_path (str): Output directory.
+            index_data_path (str): Directory written by IndexDataWriter.
+            block_size (int): Number of vectors normalized at once.
+
+        Returns:
+            LocalSearchClient: Client over the created index.
+        """
+        os.makedirs(index_path, exist_ok=True)
+        reader = IndexDataReader(index_data_path)
+
+        # Normalized vectors so the cosine similarity is a dot product
+        vectors = np.lib.format.open_memmap(
+            os.path.join(index_path, cls.VECTORS_FILE),
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(reader), reader.dim),
+        )
+        for start in range(0, len(reader), block_size):
+            block = reader.read_vectors(start, start + block_size)
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            vectors[start : start + len(block)] = block
+        vectors.flush()
+        del vectors
+
+        metadata = reader.read_documents(vectors=False)
+        with open(os.path.join(index_path, cls.METADATA_FILE), "w") as f:
+            json.dump(metadata, f)
+
+        return cls(index_path)
+
+    def get_document_count(self) -> int:
+        """Returns the number of documents in the index."""
+        return len(self.metadata)
+
+    def search_vectors(self, vectors: np.array, top: int = 5) -> List[List[tuple]]:
+        """
+        Exact top-k cosine search for several query vectors at once.
+
+        Args:
+            vectors (np.array): Query vectors, shape (n_queries, dim).
+            top (int): Number of results per query.
+
+        Returns:
+            list: For every query, the (index, score) pairs of the results sorted by score.
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        n_docs = self.vectors.shape[0]
+        top = min(top, n_docs)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+
+        # Score the index by blocks, keeping the running top-k of every query
+        for start in range(0, n_docs, self.block_size):
+            block_scores = queries @ self.vectors[start : start + self.block_size].T
+            scores = np.hstack([best_scores, block_scores])
+            block_indices = np.broadcast_to(np.arange(start, start + block_scores.shape[1]), block_scores.shape)
+            indices = np.hstack([best_indices, block_indices])
+
+            # The first blocks may hold fewer candidates than top if block_size < top
+            kth = min(top, scores.shape[1]) - 1
+            partition = np.argpartition(-scores, kth, axis=1)[:, : kth + 1]
+            best_scores = np.take_along_axis(scores, partition, axis=1)
+            best_indices = np.take_along_axis(indices, partition, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_indices = np.take_along_axis(best_indices, order, axis=1)
+
+        return [list(zip(idx.tolist(), sc.tolist())) for idx, sc in zip(best_indices, best_scores)]
+
+    def search(
+        self,
+        search_text: str = None,
+        vector_queries: List = None,
+        select: List[str] = None,
+        top: int = 5,
+        **kwargs,
+    ):
+        """
+        Searches the index with the same arguments as SearchClient.search.
+        Only vector queries are supported, several vector queries are merged keeping the best score of each document.
+
+        Args:
+            search_text (str): Not supported, must be None.
+            vector_queries (list): List of VectorizedQuery.
+            select (list): Fields to return, all the metadata fields if None.
+            top (int): Number of results.
+
+        Returns:
+            list: Result documents, with the `@search.score` field as in Azure Cognitive Search.
+        """
+        if search_text is not None:
+            raise ValueError("LocalSearchClient only supports vector queries")
+
+        vector_queries = vector_queries or []
+        k = max([top] + [vq.k_nearest_neighbors or top for vq in vector_queries])
+        all_hits = self.search_vectors([vq.vector for vq in vector_queries], top=k) if vector_queries else []
+
+        # Merge the hits of all vector queries
+        merged = {}
+        for hits in all_hits:
+            for idx, score in hits:
+                merged[idx] = max(score, merged.get(idx, -np.inf))
+        ranked = sorted(merged.items(), key=lambda x: -x[1])[:top]
+
+        return [self._result(idx, score, select) for idx, score in ranked]
+
+    def _result(self, idx: int, score: float, select: List[str] = None) -> Dict:
+        """Builds a result document, with Azure's cosine score 1 / (1 + cosine distance)."""
+        doc = self.metadata[idx]
+        result = {k: v for k, v in doc.items() if select is None or k in select}
+        result["@search.score"] = 1 / (2 - score)
+        return result
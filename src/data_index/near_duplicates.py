@@ -0,0 +1,160 @@
+import re
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+
+class NearDuplicateDetector:
+    """
+    Finds near-duplicate chunks (repeated epigraphs, excerpts, other editions of a book) before they are embedded.
+
+    Every chunk gets a MinHash signature of its word shingles, whose matching positions estimate the Jaccard
+    similarity of two chunks. Signatures are split in bands stored in LSH buckets, so a chunk is only compared
+    with the chunks sharing a band. The first chunk of a group is the original, later ones are duplicates of it.
+    """
+
+    # Prime over 2^32, so (a * hash + b) mod PRIME fits in 64 bits for 32 bit hashes
+    PRIME = 4294967311
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        collapse: bool = True,
+        seed: int = 0,
+    ):
+        """
+        Initializes the NearDuplicateDetector.
+
+        Args:
+            threshold (float): Minimum estimated Jaccard similarity of the shingles of two duplicates.
+            num_perm (int): Number of hash functions of the signatures.
+            bands (int): Number of LSH bands, num_perm must be a multiple. More bands find pairs of lower similarity.
+            shingle_size (int): Number of words of every shingle.
+            collapse (bool): Whether duplicates are dropped (not embedded nor indexed), or only reported.
+            seed (int): Seed of the hash functions.
+        """
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.collapse = collapse
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+        self.originals = []
+        self.buckets = [{} for _ in range(bands)]
+        self.n_chunks = 0
+        self.duplicates = []
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def signature(self, text: str) -> np.array:
+        """
+        Computes the MinHash signature of a text.
+
+        Args:
+            text (str): Text of the chunk.
+
+        Returns:
+            np.array: Minimum of every hash function over the shingles.
+        """
+        words = re.findall(r"\w+", text.lower())
+        n_shingles = max(1, len(words) - self.shingle_size + 1)
+        shingles = [" ".join(words[i : i + self.shingle_size]) for i in range(n_shingles)]
+
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % self.PRIME).min(axis=1)
+
+    def add(self, key: str, text: str, source: str = None, tokens: int = None, signature: np.array = None) -> Dict:
+        """
+        Registers a chunk, as an original or as a duplicate of a previous one.
+
+        Args:
+            key (str): Id of the chunk.
+            text (str): Text of the chunk.
+            source (str): Where the chunk comes from, e.g. the path of the book.
+            tokens (int): Number of tokens of the chunk, for the report.
+            signature (np.array): Signature of the text if already computed.
+
+        Returns:
+            dict: The 'key', 'source' and estimated 'similarity' of the original, None if the chunk is new.
+        """
+        if signature is None:
+            signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+        self.n_chunks += 1
+
+        # Verify the candidates sharing a band, the most similar one is the original
+        candidates = {idx for band, band_key in enumerate(band_keys) for idx in self.buckets[band].get(band_key, [])}
+        best_idx, best_similarity = None, 0.0
+        for idx in sorted(candidates):
+            similarity = float(np.mean(self.originals[idx]["signature"] == signature))
+            if similarity > best_similarity:
+                best_idx, best_similarity = idx, similarity
+
+        if best_idx is not None and best_similarity >= self.threshold:
+            original = self.originals[best_idx]
+            self.duplicates.append({"key": key, "source": source, "original": original["key"]})
+            self.bytes_saved += len(text.encode("utf-8"))
+            self.tokens_saved += tokens or 0
+            return {"key": original["key"], "source": original["source"], "similarity": best_similarity}
+
+        self._add_original(key, source, signature, band_keys)
+        return None
+
+    def add_original(self, key: str, source: str, signature: List[int]):
+        """
+        Registers a chunk indexed by a previous run as an original, e.g. from the signatures kept in the IndexManifest.
+        It is not counted in the report.
+
+        Args:
+            key (str): Id of the chunk.
+            source (str): Where the chunk comes from, e.g. the path of the book.
+            signature (list): Signature of the chunk, computed with the same num_perm, shingle_size and seed.
+        """
+        signature = np.asarray(signature, dtype=np.uint64)
+        if len(signature) != self.num_perm:
+            raise ValueError(f"The signature of {key} has {len(signature)} values, expected {self.num_perm}")
+        self._add_original(key, source, signature, self._band_keys(signature))
+
+    def _band_keys(self, signature: np.array) -> List[bytes]:
+        """Returns the LSH bucket key of every band of a signature"""
+        return [signature[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _add_original(self, key: str, source: str, signature: np.array, band_keys: List[bytes]):
+        """Stores an original and adds it to the buckets of its bands"""
+        for band, band_key in enumerate(band_keys):
+            self.buckets[band].setdefault(band_key, []).append(len(self.originals))
+        self.originals.append({"key": key, "source": source, "signature": signature})
+
+    def report(self, vector_bytes: int = 0) -> Dict:
+        """
+        Summarizes the duplicates found and what collapsing them saves.
+
+        Args:
+            vector_bytes (int): Size of a stored vector, e.g. 4 * dimensions for float32.
+
+        Returns:
+            dict: Number of chunks and duplicates, and the embeddings, tokens and index bytes saved
+                (what would be saved if collapse is False).
+        """
+        n_duplicates = len(self.duplicates)
+        return {
+            "chunks": self.n_chunks,
+            "duplicates": n_duplicates,
+            "duplicate_ratio": n_duplicates / self.n_chunks if self.n_chunks > 0 else 0.0,
+            "collapsed": self.collapse,
+            "embeddings_saved": n_duplicates,
+            "tokens_saved": self.tokens_saved,
+            "index_bytes_saved": self.bytes_saved + n_duplicates * vector_bytes,
+        }
@@ -1,5 +1,4 @@
 import sys
-import json
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
@@ -7,9 +6,11 @@ from azure.search.documents.indexes import SearchIndexClient
 sys.path.append("..")
 sys.path.append(".")
 
+from index_data import IndexDataReader
+from uploader import IndexUploader
 
-with open("/......../data/generated/final_data_index.json", "r") as f:
-    final_data_index = json.load(f)
+# Documents are read lazily, one batch at a time
+index_data = IndexDataReader("/......../data/generated/final_data_index")
 
 # CREDENTIALS AZURE COGNITIVE SEARCH
 AZURE_SEARCH_SERVICE_ENDPOINT = ...
@@ -25,7 +26,12 @@ search_client = SearchClient(
     credential=cogs_credential,
 )
 
-# Upload documents to the search index
-for i in range(0, len(final_data_index), 1000):
-    result = search_client.upload_documents(documents=final_data_index[i : i + 1000])
-    print(f"Uploaded {len(result)} documents")
+# Upload documents to the search index, a restarted run skips the batches already uploaded
+uploader = IndexUploader(
+    search_client,
+    max_workers=4,
+    checkpoint_path="/......../data/generated/upload_checkpoint.txt",
+)
+documents = (doc for batch in index_data.iter_documents(batch_size=1000) for doc in batch)
+stats = uploader.upload(documents)
+print(f"Uploaded {stats['uploaded']} documents, skipped {stats['skipped']}, failed {len(stats['failed'])}")
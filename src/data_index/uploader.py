@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List
+
+
+class IndexUploader:
+    """
+    Uploads documents to the search index in batches sized by their serialized payload.
+    Several batches are in flight at once, documents that fail individually are retried with backoff,
+    and a checkpoint file lets a restarted run skip the batches that already succeeded. The checkpoint is
+    removed once every document is uploaded, so the next run uploads everything again.
+    The action selects the method of the search client, e.g. "merge_or_upload" to update an index
+    or "delete" with documents holding only the id.
+    """
+
+    def __init__(
+        self,
+        search_client,
+        max_batch_bytes: int = 8 * 1024 * 1024,
+        max_batch_documents: int = 1000,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        checkpoint_path: str = None,
+        action: str = "upload",
+    ):
+        """
+        Initializes the IndexUploader.
+
+        Args:
+            search_client: Search client with the <action>_documents method.
+            max_batch_bytes (int): Maximum serialized size of a batch (the service rejects requests over 16MB).
+            max_batch_documents (int): Maximum number of documents of a batch.
+            max_workers (int): Maximum number of batches in flight at the same time.
+            max_retries (int): Maximum number of retries of the failed documents of a batch.
+            backoff (float): Initial wait between retries in seconds, doubled after every retry.
+            checkpoint_path (str): File where the uploaded batches are recorded, no resume if None.
+            action (str): "upload", "merge", "merge_or_upload" or "delete", the <action>_documents method is called.
+        """
+        if action not in ("upload", "merge", "merge_or_upload", "delete"):
+            raise ValueError(f"Unsupported action: {action}")
+
+        self.search_client = search_client
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_documents = max_batch_documents
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.checkpoint_path = checkpoint_path
+        self.action = action
+
+        self.lock = threading.Lock()
+        self.completed_batches = self._load_checkpoint()
+
+    def upload(self, documents: Iterable[Dict]) -> Dict:
+        """
+        Uploads all the documents.
+
+        Args:
+            documents (Iterable[Dict]): Documents to upload, read lazily.
+
+        Returns:
+            dict: Number of uploaded and skipped documents, and the keys of the documents that failed.
+        """
+        stats = {"uploaded": 0, "skipped": 0, "failed": []}
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_key, batch in self.make_batches(documents):
+                if batch_key in self.completed_batches:
+                    stats["skipped"] += len(batch)
+                    continue
+
+                # Keep a bounded number of batches in memory
+                if len(in_flight) >= self.max_workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(done, in_flight, stats)
+                in_flight[executor.submit(self.upload_batch, batch_key, batch)] = len(batch)
+
+            self._collect(wait(in_flight).done, in_flight, stats)
+
+        if len(stats["failed"]) == 0:
+            self._remove_checkpoint()
+
+        return stats
+
+    def make_batches(self, documents: Iterable[Dict]) -> Iterator[tuple]:
+        """
+        Groups the documents in batches limited by serialized bytes and number of documents.
+
+        Args:
+            documents (Iterable[Dict]): Documents to upload.
+
+        Returns:
+            Iterator[tuple]: Key and documents of every batch. The key is a hash of the action and the serialized
+                documents, so a batch whose content changed is uploaded again.
+        """
+        batch = []
+        batch_bytes = 0
+        batch_hash = self._new_batch_hash()
+        for doc in documents:
+            doc_json = json.dumps(doc, sort_keys=True).encode("utf-8")
+            if len(batch) > 0 and (
+                batch_bytes + len(doc_json) > self.max_batch_bytes or len(batch) >= self.max_batch_documents
+            ):
+                yield batch_hash.hexdigest(), batch
+                batch = []
+                batch_bytes = 0
+                batch_hash = self._new_batch_hash()
+            batch.append(doc)
+            batch_bytes += len(doc_json)
+            batch_hash.update(doc_json + b"\n")
+
+        if len(batch) > 0:
+            yield batch_hash.hexdigest(), batch
+
+    def batch_key(self, batch: List[Dict]) -> str:
+        """Returns the checkpoint key of a batch"""
+        batch_hash = self._new_batch_hash()
+        for doc in batch:
+            batch_hash.update(json.dumps(doc, sort_keys=True).encode("utf-8") + b"\n")
+        return batch_hash.hexdigest()
+
+    def _new_batch_hash(self):
+        return hashlib.sha256(f"{self.action}\n".encode("utf-8"))
+
+    def upload_batch(self, batch_key: str, batch: List[Dict]) -> List[str]:
+        """
+        Uploads a batch, retrying with backoff the documents that failed (or the whole batch if the request failed).
+
+        Args:
+            batch_key (str): Checkpoint key of the batch.
+            batch (list): Documents of the batch.
+
+        Returns:
+            list: Keys of the documents that could not be uploaded.
+        """
+        pending = batch
+        wait_time = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                results = getattr(self.search_client, f"{self.action}_documents")(documents=pending)
+                failed_keys = {result.key for result in results if not result.succeeded}
+            except Exception as e:
+                print(f"Upload of {len(pending)} documents failed: {e}")
+                failed_keys = {doc["id"] for doc in pending}
+
+            pending = [doc for doc in pending if doc["id"] in failed_keys]
+            if len(pending) == 0:
+                self._save_checkpoint(batch_key)
+                return []
+
+            # Exponential backoff with jitter before retrying the failed documents
+            if attempt < self.max_retries:
+                time.sleep(wait_time * (0.5 + random.random()))
+                wait_time *= 2
+
+        return [doc["id"] for doc in pending]
+
+    def _collect(self, futures, in_flight: Dict, stats: Dict):
+        """Adds the results of finished batches to the stats"""
+        for future in futures:
+            n_documents = in_flight.pop(future)
+            failed = future.result()
+            stats["uploaded"] += n_documents - len(failed)
+            stats["failed"] += failed
+            print(f"Uploaded {n_documents - len(failed)} documents")
+
+    def _load_checkpoint(self) -> set:
+        """Reads the keys of the batches already uploaded"""
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, "r") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _remove_checkpoint(self):
+        """Forgets the uploaded batches once the upload is complete"""
+        with self.lock:
+            self.completed_batches = set()
+            if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+
+    def _save_checkpoint(self, batch_key: str):
+        """Records an uploaded batch"""
+        with self.lock:
+            self.completed_batches.add(batch_key)
+            if self.checkpoint_path is not None:
+                with open(self.checkpoint_path, "a") as f:
+                    f.write(batch_key + "\n")
@@ -1,64 +1,190 @@
 import sys
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+import asyncio
+import argparse
 
 sys.path.append("./src")
 sys.path.append("./src/models")
 sys.path.append("./src/chat")
+sys.path.append("./src/data_index")
 
-from chat.chatbot import ChatBot
-from models.embedding_model import AzureAIEmbedding
-from models.chatcomplete_model import AzureAIChatComplete
-from models.imagegen_model import StabilityAIImageGen
+from models.telemetry import tracer, JSONLinesExporter
 
-endpoint = ...
-token = ...
-model_name = "cohere-v3-multilingual-01"
+# Clients are built in build_chatbot, and the Azure SDK, PIL and tiktoken are imported on first use,
+# so importing this module and starting the chatbot stay fast
 
-embeddings_model = AzureAIEmbedding(endpoint=endpoint, token=token, model_name=model_name)
+EMBEDDING_ENDPOINT = ...
+EMBEDDING_TOKEN = ...
+EMBEDDING_MODEL_NAME = "cohere-v3-multilingual-01"
 
-endpoint = ...
-token = ...
-model_name = "Meta-Llama-3-8B-Instruct-abzad"
+# Quotas of the deployments (arguments of RateLimiter), None for no limit. Requests over them wait,
+# and throttled ones are retried after their Retry-After while the concurrency adapts
+EMBEDDING_RATE_LIMIT = {"requests_per_second": None, "tokens_per_minute": None, "max_concurrency": 8}
+CHATCOMPLETE_RATE_LIMIT = {"requests_per_second": None, "tokens_per_minute": None, "max_concurrency": 16}
+IMAGEGEN_RATE_LIMIT = {"requests_per_second": None, "max_concurrency": 2}
 
-endpoint = ...
-token = ...
-model_name = "Meta-Llama-3-70B-Instruct-wcukf"
+CHATCOMPLETE_ENDPOINT = ...
+CHATCOMPLETE_TOKEN = ...
+CHATCOMPLETE_MODEL_NAME = "Meta-Llama-3-70B-Instruct-wcukf"
+# CHATCOMPLETE_MODEL_NAME = "Meta-Llama-3-8B-Instruct-abzad"
 
+IMAGEGEN_ENDPOINT = ...
+IMAGEGEN_TOKEN = ...
+IMAGEGEN_MODEL_NAME = "sd3-turbo"
 
-chatcomplete_model = AzureAIChatComplete(endpoint=endpoint, token=token, model_name=model_name)
-
-
-endpoint = ...
-# endpoint = ...
-token = ...
-model_name = "sd3-turbo"
-
-imagegen_model = StabilityAIImageGen(endpoint=endpoint, token=token, model_name=model_name)
-
+# Images are generated in the background and stored by a hash of model, prompt and style
+IMAGES_PATH = "./data/images"
+# Seconds to wait for the images being generated on shutdown
+IMAGE_JOBS_CLOSE_TIMEOUT = 10
 
 AZURE_SEARCH_SERVICE_ENDPOINT = ...
 AZURE_SEARCH_ADMIN_KEY = ...
 AZURE_SEARCH_INDEX_NAME = "cosmere"
 
-cogs_credential = AzureKeyCredential(AZURE_SEARCH_ADMIN_KEY)
-search_client = SearchClient(
-    endpoint=AZURE_SEARCH_SERVICE_ENDPOINT,
-    index_name=AZURE_SEARCH_INDEX_NAME,
-    credential=cogs_credential,
-)
+# Directory generated by create_index_data.py, set it to search locally instead of Azure Cognitive Search
+LOCAL_INDEX_PATH = None
+
+# Lexical index generated by create_index_data.py, set it to combine BM25 and vector search
+LEXICAL_INDEX_PATH = None
+
+# Answers of previous similar questions, kept across restarts
+ANSWER_CACHE_PATH = "./data/generated/answer_cache.json"
+# Manifest written by the index build (manifest.json of the index data, or the manifest of index_books.py),
+# the cached answers are discarded when it changes
+INDEX_MANIFEST_PATH = None
+
+# Spans of every model, search and tool call, None to disable tracing
+TRACES_PATH = None
+METRICS_PATH = "./data/generated/metrics.prom"
+
+# Clear-cut turns skip the tool selection call, decisions are logged to tune the threshold
+ROUTING_LOG_PATH = "./data/generated/routing_log.jsonl"
+
+
+def build_search_client():
+    if LOCAL_INDEX_PATH is not None:
+        from data_index.local_search import LocalSearchClient
+
+        return LocalSearchClient(LOCAL_INDEX_PATH)
+
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+
+    cogs_credential = AzureKeyCredential(AZURE_SEARCH_ADMIN_KEY)
+    return SearchClient(
+        endpoint=AZURE_SEARCH_SERVICE_ENDPOINT,
+        index_name=AZURE_SEARCH_INDEX_NAME,
+        credential=cogs_credential,
+    )
+
+
+def build_lexical_index():
+    from data_index.lexical_index import BM25Index
+
+    return BM25Index.load(LEXICAL_INDEX_PATH)
+
+
+def build_chatbot():
+    """
+    Builds the chatbot and its clients. The search client and the lexical index are created on the first search.
+
+    Returns:
+        ChatBot: The chatbot.
+    """
+    from chat.chatbot import ChatBot
+    from chat.answer_cache import SemanticAnswerCache
+    from chat.context_window import ContextWindow
+    from chat.router import KeywordRouter
+    from models.embedding_model import AzureAIEmbedding
+    from models.embedding_cache import EmbeddingCache
+    from models.chatcomplete_model import AzureAIChatComplete
+    from models.imagegen_model import StabilityAIImageGen
+    from models.image_jobs import ImageJobQueue
+    from models.http_transport import HTTPTransport
+    from models.lazy_client import LazyClient
+    from data_index.chunker import TokenCounter
+
+    if TRACES_PATH is not None:
+        tracer.enable([JSONLinesExporter(TRACES_PATH)])
+
+    # Keep-alive connections shared by all the model clients
+    transport = HTTPTransport(pool_maxsize=32)
+
+    # Repeated queries are embedded only once
+    embeddings_model = AzureAIEmbedding(
+        endpoint=EMBEDDING_ENDPOINT,
+        token=EMBEDDING_TOKEN,
+        model_name=EMBEDDING_MODEL_NAME,
+        cache=EmbeddingCache(),
+        transport=transport,
+        rate_limit=EMBEDDING_RATE_LIMIT,
+    )
+    chatcomplete_model = AzureAIChatComplete(
+        endpoint=CHATCOMPLETE_ENDPOINT,
+        token=CHATCOMPLETE_TOKEN,
+        model_name=CHATCOMPLETE_MODEL_NAME,
+        transport=transport,
+        rate_limit=CHATCOMPLETE_RATE_LIMIT,
+    )
+    imagegen_model = StabilityAIImageGen(
+        endpoint=IMAGEGEN_ENDPOINT,
+        token=IMAGEGEN_TOKEN,
+        model_name=IMAGEGEN_MODEL_NAME,
+        transport=transport,
+        rate_limit=IMAGEGEN_RATE_LIMIT,
+    )
+
+    return ChatBot(
+        embeddings_model,
+        chatcomplete_model,
+        imagegen_model,
+        LazyClient(build_search_client),
+        lexical_index=LazyClient(build_lexical_index) if LEXICAL_INDEX_PATH is not None else None,
+        answer_cache=SemanticAnswerCache(
+            threshold=0.95,
+            path=ANSWER_CACHE_PATH,
+            index_version=SemanticAnswerCache.manifest_version(INDEX_MANIFEST_PATH),
+        ),
+        # History sent to the model, fitted to the context of Llama 3 (8k tokens) leaving room for the answer
+        context_window=ContextWindow(TokenCounter("cl100k_base"), max_tokens=6000),
+        router=KeywordRouter(log_path=ROUTING_LOG_PATH),
+        image_jobs=ImageJobQueue(imagegen_model, IMAGES_PATH, n_workers=2),
+    )
 
 
 if __name__ == "__main__":
 
-    messages = []
-    chatbot = ChatBot(embeddings_model, chatcomplete_model, imagegen_model, search_client)
-
-    while True:
-        text = input("Insert Message: ")
-        messages.append({"role": "user", "content": text})
-        generated_messages = chatbot.chat(messages)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true", help="Serve many users over HTTP instead of the console")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
 
-        response_text = generated_messages[-1]["content"]
-        messages += generated_messages
-        print(response_text)
+    messages = []
+    chatbot = build_chatbot()
+
+    try:
+        if args.serve:
+            # Every HTTP session keeps its own history
+            from chat.server import ChatServer
+
+            server = ChatServer(chatbot, host=args.host, port=args.port, max_concurrent_turns=8)
+            asyncio.run(server.serve())
+        else:
+            while True:
+                text = input("Insert Message: ")
+                messages.append({"role": "user", "content": text})
+
+                # Print the answer as it is generated
+                generated_messages = []
+                for response_text in chatbot.chat_stream(messages, generated_messages):
+                    print(response_text, end="", flush=True)
+                print()
+
+                messages += generated_messages
+    finally:
+        # Queued images are not generated on shutdown, and a slow one does not hold the exit
+        chatbot.image_jobs.close(cancel_pending=True, timeout=IMAGE_JOBS_CLOSE_TIMEOUT)
+        chatbot.answer_cache.save()
+        print(chatbot.answer_cache.stats())
+        if tracer.enabled:
+            tracer.write_prometheus(METRICS_PATH)
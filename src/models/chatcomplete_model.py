@@ -1,44 +1,152 @@
-import requests
-
-from typing import List, Dict
+from typing import List, Dict, Iterator
 import json
+import time
+
+from models.http_transport import HTTPTransport, default_transport
+from models.telemetry import tracer
+from models.single_flight import SingleFlight, default_single_flight
+from models.rate_limiter import estimate_tokens
 
 
 class AzureAIChatComplete:
     """Loads or create chat complete models"""
 
+    # Requests up to this temperature are treated as deterministic, so identical concurrent ones are coalesced
+    DETERMINISTIC_TEMPERATURE = 0.01
+
     def __init__(
         self,
         endpoint: str = "",
         token: str = "",
         model_name: str = "",
+        transport: HTTPTransport = None,
+        single_flight: SingleFlight = None,
+        rate_limit: Dict = None,
     ) -> None:
         """ """
         self.endpoint = endpoint
         self.token = token
         self.model_name = model_name
+        self.transport = transport or default_transport
+        self.single_flight = single_flight or default_single_flight
+        self.rate_limit = rate_limit
+
+    def predict(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs) -> Dict:
+        """Generate the next message of a conversation using model.
+
+        Args:
+            messages (List[Dict[str, str]]): list of messages.
+            stream (bool): Whether to return a generator of content deltas instead of the full response.
+
+        Returns:
+            Dict: Response of the model, or a generator of str if stream is True.
+        """
+        if stream:
+            return self.predict_stream(messages, **kwargs)
+
+        data = {
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0),
+            "max_tokens": kwargs.get("max_tokens", 512),
+        }
 
-    def predict(self, messages: List[Dict[str, str]], **kwargs) -> Dict:
-        """Transform a list of strings into embeddings using model.
+        if data["temperature"] > self.DETERMINISTIC_TEMPERATURE:
+            return self._post(data)
+
+        # Identical deterministic requests in flight (e.g. the same filter call from several sessions) share one
+        key = SingleFlight.key(self.endpoint, self.model_name, data)
+        return self.single_flight.do(key, self._post, data)
+
+    def _post(self, data: Dict) -> Dict:
+        """Sends a (not streamed) chat completion request"""
+        chatcomplete_endpoint = f"{self.endpoint}/chat/completions"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": ("Bearer " + self.token),
+        }
+
+        with tracer.span("chat_complete", model=self.model_name, max_tokens=data["max_tokens"]) as span:
+            response = self.transport.post(
+                chatcomplete_endpoint,
+                n_tokens=self._estimate_tokens(data),
+                rate_limit=self.rate_limit,
+                headers=headers,
+                json=data,
+            )
+            response_json = json.loads(response.text)
+
+            usage = response_json.get("usage") or {}
+            span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+
+        return response_json
+
+    def predict_stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """Generate the next message of a conversation using model, yielding the content as it arrives.
 
         Args:
-            input_data (List[str]): list of strings.
+            messages (List[Dict[str, str]]): list of messages.
 
         Returns:
-            np.array: Array with the embeddings.
+            Iterator[str]: Content deltas parsed from the server-sent events.
         """
         data = {
             "messages": messages,
             "temperature": kwargs.get("temperature", 0),
             "max_tokens": kwargs.get("max_tokens", 512),
+            "stream": True,
         }
 
         chatcomplete_endpoint = f"{self.endpoint}/chat/completions"
         headers = {
             "Content-Type": "application/json",
+            "Accept": "text/event-stream",
             "Authorization": ("Bearer " + self.token),
         }
 
-        response = requests.post(chatcomplete_endpoint, headers=headers, json=data)
+        with (
+            tracer.span("chat_complete.stream", model=self.model_name, max_tokens=data["max_tokens"]) as span,
+            self.transport.post(
+                chatcomplete_endpoint,
+                n_tokens=self._estimate_tokens(data),
+                rate_limit=self.rate_limit,
+                headers=headers,
+                json=data,
+                stream=True,
+            ) as response,
+        ):
+            if response.status_code != 200:
+                raise Exception(response.text)
+
+            # text/event-stream is always UTF-8, but requests falls back to ISO-8859-1 for text/* without charset
+            response.encoding = "utf-8"
+
+            start = time.perf_counter()
+            n_deltas = 0
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                # Only data fields carry deltas, the rest are comments or keep-alives
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:") :].strip()
+                if payload == "[DONE]":
+                    break
+
+                event = json.loads(payload)
+                if event.get("usage"):
+                    span.set(
+                        prompt_tokens=event["usage"].get("prompt_tokens"),
+                        completion_tokens=event["usage"].get("completion_tokens"),
+                    )
+                for choice in event.get("choices", []):
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if n_deltas == 0:
+                            span.set(first_token_seconds=time.perf_counter() - start)
+                        n_deltas += 1
+                        yield content
+
+            span.set(deltas=n_deltas)
 
-        return json.loads(response.text)
+    @staticmethod
+    def _estimate_tokens(data: Dict) -> int:
+        """Tokens a request counts against the quota: the prompt and the maximum completion"""
+        return estimate_tokens(str(message.get("content") or "") for message in data["messages"]) + data["max_tokens"]
@@ -0,0 +1,131 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed cache of embeddings,
+    with an in-memory LRU in front of an optional SQLite store"""
+
+    def __init__(
+        self,
+        path: str = None,
+        max_memory_items: int = 10000,
+        max_disk_items: int = 1000000,
+    ) -> None:
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            path (str): SQLite file for the persistent store, memory only if None.
+            max_memory_items (int): Maximum number of embeddings kept in memory.
+            max_disk_items (int): Maximum number of embeddings kept on disk, least recently used are evicted.
+        """
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_access REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+            self.connection.commit()
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        """Returns the cache key of a text for a model."""
+        return model_name + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[np.array]:
+        """
+        Looks up several keys.
+
+        Args:
+            keys (List[str]): Cache keys.
+
+        Returns:
+            list: Embedding of every key, None for the misses.
+        """
+        results = [None] * len(keys)
+        disk_keys = []
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    results[i] = self.memory[key]
+                else:
+                    disk_keys.append(key)
+
+            # Look up the memory misses on disk and promote the hits
+            if self.connection is not None and len(disk_keys) > 0:
+                found = {}
+                for start in range(0, len(disk_keys), 500):
+                    batch = disk_keys[start : start + 500]
+                    rows = self.connection.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    found.update({key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows})
+
+                if len(found) > 0:
+                    now = time.time()
+                    self.connection.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+                    self.connection.commit()
+                    for key, vector in found.items():
+                        self._put_memory(key, vector)
+
+                for i, key in enumerate(keys):
+                    if results[i] is None and key in found:
+                        results[i] = found[key]
+
+        return results
+
+    def put_many(self, keys: List[str], embeddings: np.array) -> None:
+        """
+        Stores several embeddings.
+
+        Args:
+            keys (List[str]): Cache keys.
+            embeddings (np.array): Embedding of every key.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            for key, vector in zip(keys, vectors):
+                self._put_memory(key, vector)
+
+            if self.connection is not None:
+                now = time.time()
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in zip(keys, vectors)],
+                )
+                self._evict_disk()
+                self.connection.commit()
+
+    def _put_memory(self, key: str, vector: np.array) -> None:
+        """Stores an embedding in the memory LRU, evicting the least recently used."""
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """Deletes the least recently used embeddings over the disk limit."""
+        n_items = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if n_items > self.max_disk_items:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                (n_items - self.max_disk_items,),
+            )
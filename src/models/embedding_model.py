@@ -1,10 +1,16 @@
-import requests
-
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, TYPE_CHECKING
 import numpy as np
 import json
 
-from tenacity import retry, wait_fixed, stop_after_attempt
+from models.embedding_cache import EmbeddingCache
+from models.http_transport import HTTPTransport, default_transport
+from models.telemetry import tracer
+from models.single_flight import SingleFlight, default_single_flight
+from models.rate_limiter import estimate_tokens
+
+if TYPE_CHECKING:
+    from data_index.chunker import TokenCounter
 
 
 class AzureAIEmbedding:
@@ -16,13 +22,37 @@ class AzureAIEmbedding:
         endpoint: str = "",
         token: str = "",
         model_name: str = "",
+        cache: EmbeddingCache = None,
+        max_batch_size: int = 96,
+        max_batch_tokens: int = None,
+        token_counter: "TokenCounter" = None,
+        max_workers: int = 1,
+        transport: HTTPTransport = None,
+        single_flight: SingleFlight = None,
+        rate_limit: Dict = None,
     ) -> None:
-        """ """
+        """
+        Args:
+            cache (EmbeddingCache): Optional cache, only the texts not cached are sent to the endpoint.
+            max_batch_size (int): Maximum number of strings per request.
+            max_batch_tokens (int): Maximum number of tokens per request, requires a token_counter.
+            token_counter (TokenCounter): Token counter used to pack the requests by tokens.
+            max_workers (int): Maximum number of requests in flight at the same time.
+            single_flight (SingleFlight): Coalesces identical concurrent calls, shared by default.
+            rate_limit (dict): Quotas of the endpoint, arguments of RateLimiter.
+        """
         self.endpoint = endpoint
         self.token = token
         self.model_name = model_name
+        self.transport = transport or default_transport
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.token_counter = token_counter
+        self.max_workers = max_workers
+        self.single_flight = single_flight or default_single_flight
+        self.rate_limit = rate_limit
 
-    @retry(wait=wait_fixed(60), stop=stop_after_attempt(3))
     def raw_predict(self, input_data: List[str], **kwargs) -> np.array:
         """Transform a list of strings into embeddings using model.
 
@@ -40,25 +70,133 @@ class AzureAIEmbedding:
             "Authorization": ("Bearer " + self.token),
         }
 
-        response = requests.post(embeddings_endpoint, headers=headers, json=data)
-
-        embeddings = np.array([e["embedding"] for e in json.loads(response.text)["data"]])
+        with tracer.span("embedding.request", model=self.model_name, n_texts=len(input_data)) as span:
+            # Throttled requests are retried by the transport, honoring Retry-After
+            response = self.transport.post(
+                embeddings_endpoint,
+                n_tokens=estimate_tokens(input_data),
+                rate_limit=self.rate_limit,
+                headers=headers,
+                json=data,
+            )
+            if response.status_code != 200:
+                raise Exception(response.text)
+            response_json = json.loads(response.text)
+            span.set(prompt_tokens=response_json.get("usage", {}).get("prompt_tokens"))
+
+        embeddings = np.array([e["embedding"] for e in response_json["data"]])
 
         return embeddings
 
-    def predict(self, input_data: List[str], **kwargs) -> np.array:
+    def predict(self, input_data: List[str], token_counts: List[int] = None, **kwargs) -> np.array:
         """Transform a list of strings into embeddings using model.
 
         Args:
             input_data (List[str]): list of strings.
+            token_counts (List[int]): Number of tokens of every string if already known (e.g. chunks),
+                so they are not tokenized again to pack the requests.
+
+        Returns:
+            np.array: Array with the embeddings.
+        """
+        # Identical concurrent calls (e.g. the same question from several sessions) share one request
+        key = SingleFlight.key(self.endpoint, self.model_name, input_data)
+        with tracer.span("embedding", model=self.model_name, n_texts=len(input_data)):
+            return self.single_flight.do(key, self._predict, input_data, token_counts)
+
+    def _predict(self, input_data: List[str], token_counts: List[int] = None) -> np.array:
+        """Transform a list of strings into embeddings, only sending the ones not in the cache"""
+        if self.cache is None:
+            return self.predict_batches(input_data, token_counts)
+
+        keys = [EmbeddingCache.key(self.model_name, text) for text in input_data]
+        embeddings_list = self.cache.get_many(keys)
+
+        # Embed only the misses, once per distinct text
+        missing = {}
+        missing_counts = {}
+        for i, (key, text, embedding) in enumerate(zip(keys, input_data, embeddings_list)):
+            if embedding is None and key not in missing:
+                missing[key] = text
+                missing_counts[key] = token_counts[i] if token_counts is not None else None
+
+        tracer.current_span().set(cache_misses=len(missing))
+
+        if len(missing) > 0:
+            new_embeddings = self.predict_batches(
+                list(missing.values()), list(missing_counts.values()) if token_counts is not None else None
+            )
+            self.cache.put_many(list(missing.keys()), new_embeddings)
+
+            # Merge back in input order
+            new_embeddings_map = dict(zip(missing.keys(), new_embeddings))
+            embeddings_list = [
+                embedding if embedding is not None else new_embeddings_map[key]
+                for key, embedding in zip(keys, embeddings_list)
+            ]
+
+        embeddings = np.vstack(embeddings_list)
+
+        return embeddings
+
+    def predict_batches(self, input_data: List[str], token_counts: List[int] = None) -> np.array:
+        """Transform a list of strings into embeddings using model, sending them in batches.
+
+        Args:
+            input_data (List[str]): list of strings.
+            token_counts (List[int]): Number of tokens of every string, counted with the token_counter if None.
 
         Returns:
             np.array: Array with the embeddings.
         """
-        embeddings_raw_list = []
-        for i in range(0, len(input_data), 96):
-            embeddings_raw_list += [self.raw_predict(input_data[i : i + 96])]
+        batches = self.make_batches(input_data, token_counts)
+
+        # Send the batches, several at once if configured. Results keep the order of the batches
+        if self.max_workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                embeddings_raw_list = list(
+                    executor.map(tracer.bind(lambda batch: self.raw_predict(input_data[batch[0] : batch[1]])), batches)
+                )
+        else:
+            embeddings_raw_list = [self.raw_predict(input_data[start:end]) for start, end in batches]
 
         embeddings = np.vstack(embeddings_raw_list)
 
         return embeddings
+
+    def make_batches(self, input_data: List[str], token_counts: List[int] = None) -> List[Tuple[int, int]]:
+        """Split the strings into consecutive batches limited by number of strings and tokens.
+
+        Args:
+            input_data (List[str]): list of strings.
+            token_counts (List[int]): Number of tokens of every string, counted with the token_counter if None.
+
+        Returns:
+            list: (start, end) positions of every batch.
+        """
+        if self.max_batch_tokens is None or (self.token_counter is None and token_counts is None):
+            return [
+                (i, min(i + self.max_batch_size, len(input_data)))
+                for i in range(0, len(input_data), self.max_batch_size)
+            ]
+
+        batches = []
+        start = 0
+        n_tokens = 0
+        for i, text in enumerate(input_data):
+            if token_counts is not None:
+                n_tokens_current = token_counts[i]
+            else:
+                n_tokens_current = self.token_counter.num_tokens_from_string(text)
+
+            # Close the batch if the string does not fit, a string over the budget goes alone
+            if i > start and (n_tokens + n_tokens_current > self.max_batch_tokens or i - start >= self.max_batch_size):
+                batches.append((start, i))
+                start = i
+                n_tokens = 0
+            n_tokens += n_tokens_current
+
+        if start < len(input_data):
+            batches.append((start, len(input_data)))
+
+        return batches
@@ -0,0 +1,151 @@
+import time
+import asyncio
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from models.telemetry import tracer
+from models.rate_limiter import RateLimiter, RETRY_STATUSES, THROTTLE_STATUSES, parse_retry_after
+
+
+class HTTPTransport:
+    """Shared HTTP transport with keep-alive connection pools per endpoint,
+    so the model clients do not pay a new TCP+TLS handshake on every request.
+    Requests to an endpoint share a RateLimiter, and throttled or failed ones are retried."""
+
+    def __init__(
+        self,
+        pool_maxsize: int = 16,
+        timeout: float = 120,
+        connect_timeout: float = 10,
+    ) -> None:
+        """
+        Initializes the HTTPTransport.
+
+        Args:
+            pool_maxsize (int): Maximum number of connections kept open per endpoint.
+            timeout (float): Read timeout of the requests, in seconds.
+            connect_timeout (float): Connect timeout of the requests, in seconds.
+        """
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+
+        self.sessions = {}
+        self.rate_limiters = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Returns the session of the endpoint of an URL, creating it on first use.
+
+        Args:
+            url (str): Request URL.
+
+        Returns:
+            requests.Session: Session with its own connection pool.
+        """
+        endpoint = self._endpoint(url)
+
+        with self.lock:
+            if endpoint not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(endpoint, adapter)
+                self.sessions[endpoint] = session
+            return self.sessions[endpoint]
+
+    def get_rate_limiter(self, url: str, rate_limit: Dict = None) -> RateLimiter:
+        """
+        Returns the rate limiter of the endpoint of an URL, creating it on first use.
+
+        Args:
+            url (str): Request URL.
+            rate_limit (dict): Arguments of RateLimiter (quotas, concurrency, retries), used on creation.
+
+        Returns:
+            RateLimiter: Limiter shared by all the requests to the endpoint.
+        """
+        endpoint = self._endpoint(url)
+
+        with self.lock:
+            if endpoint not in self.rate_limiters:
+                self.rate_limiters[endpoint] = RateLimiter(**(rate_limit or {}))
+            return self.rate_limiters[endpoint]
+
+    def post(self, url: str, n_tokens: int = 0, rate_limit: Dict = None, **kwargs) -> requests.Response:
+        """
+        Sends a POST request through the pooled session of the endpoint.
+
+        The request waits for the rate limiter of the endpoint. Throttled (429, 503) and failed (5xx, connection
+        errors) requests are retried with exponential backoff, waiting at least the Retry-After of the response.
+
+        Args:
+            url (str): Request URL.
+            n_tokens (int): Estimated tokens of the request, for the tokens/min quota.
+            rate_limit (dict): Arguments of the RateLimiter of the endpoint, used when it is created.
+            **kwargs: Arguments of requests.post (headers, json, data, files...).
+
+        Returns:
+            requests.Response: Response of the request, the last one if all the retries failed.
+        """
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeout))
+        session = self.get_session(url)
+        limiter = self.get_rate_limiter(url, rate_limit)
+
+        attempt = 0
+        while True:
+            sent_at = limiter.acquire(n_tokens)
+            try:
+                response = session.post(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                limiter.release(sent_at)
+                if attempt >= limiter.max_retries:
+                    raise
+                delay = limiter.backoff(attempt)
+            else:
+                tracer.current_span().set(http_status=response.status_code)
+                throttled = response.status_code in THROTTLE_STATUSES
+                retry_after = parse_retry_after(response.headers) if throttled else None
+                limiter.release(sent_at, throttled=throttled, retry_after=retry_after)
+
+                if response.status_code not in RETRY_STATUSES or attempt >= limiter.max_retries:
+                    return response
+                response.close()
+                delay = max(retry_after or 0.0, limiter.backoff(attempt))
+
+            tracer.current_span().add("retries")
+            time.sleep(delay)
+            attempt += 1
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        """
+        Async variant of post, the request runs in a worker thread sharing the same connection pools.
+
+        Args:
+            url (str): Request URL.
+            **kwargs: Arguments of requests.post (headers, json, data, files...).
+
+        Returns:
+            requests.Response: Response of the request.
+        """
+        return await asyncio.to_thread(self.post, url, **kwargs)
+
+    def close(self) -> None:
+        """Closes all the open connections."""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+# Transport shared by all the model clients unless another one is given
+default_transport = HTTPTransport()
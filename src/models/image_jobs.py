@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import queue
+import hashlib
+import threading
+from typing import Dict
+
+from models.imagegen_model import StabilityAIImageGen
+
+
+def image_key(model_name: str, prompt: str, style_preset: str = None) -> str:
+    """Returns the name of the image of a request, a hash of model, prompt and style."""
+    key = "\n".join([model_name, prompt, style_preset or ""])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ImageJobQueue:
+    """
+    Generates images in background workers, so the chat does not wait for them.
+    Images are stored by a hash of model, prompt and style, and repeated requests are served from disk.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        imagegen_model: StabilityAIImageGen,
+        output_path: str,
+        n_workers: int = 2,
+        max_queue_size: int = 16,
+    ):
+        """
+        Initializes the ImageJobQueue and starts its workers.
+
+        Args:
+            imagegen_model (StabilityAIImageGen): Image generation model.
+            output_path (str): Folder where the images are stored.
+            n_workers (int): Number of images generated at the same time.
+            max_queue_size (int): Maximum number of pending jobs, new jobs are rejected when full.
+        """
+        self.imagegen_model = imagegen_model
+        self.output_path = output_path
+        self.n_workers = n_workers
+
+        os.makedirs(output_path, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def job_id(self, prompt: str, style_preset: str = None) -> str:
+        """Returns the id of the job of a request, a hash of model, prompt and style."""
+        return image_key(self.imagegen_model.model_name, prompt, style_preset)
+
+    def submit(self, prompt: str, style_preset: str = None) -> str:
+        """
+        Queues the generation of an image, unless it is cached or already in progress.
+
+        Args:
+            prompt (str): Image description.
+            style_preset (str): Style of the image.
+
+        Returns:
+            str: Id of the job.
+        """
+        job_id = self.job_id(prompt, style_preset)
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] != self.FAILED:
+                return job_id
+
+            path = self._find_image(job_id)
+            if path is not None:
+                self.jobs[job_id] = {"status": self.DONE, "path": path, "error": None, "event": threading.Event()}
+                self.jobs[job_id]["event"].set()
+                return job_id
+
+            job = {"status": self.QUEUED, "path": None, "error": None, "event": threading.Event()}
+            try:
+                self.queue.put_nowait((job_id, prompt, style_preset))
+            except queue.Full:
+                raise Exception("Too many images are being generated, try again later")
+            self.jobs[job_id] = job
+
+        return job_id
+
+    def status(self, job_id: str) -> Dict:
+        """
+        Returns the state of a job.
+
+        Args:
+            job_id (str): Id of the job.
+
+        Returns:
+            dict: 'status', 'path' of the image when done and 'error' when failed. None for unknown jobs.
+                Images generated before a restart are found on disk.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return {"status": job["status"], "path": job["path"], "error": job["error"]}
+
+        # Only ids shaped like a job id, they become file names
+        path = self._find_image(job_id) if re.fullmatch(r"[0-9a-f]{64}", job_id) else None
+        if path is None:
+            return None
+        return {"status": self.DONE, "path": path, "error": None}
+
+    def wait(self, job_id: str, timeout: float = None) -> Dict:
+        """Blocks until a job finishes (or the timeout expires) and returns its state."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            job["event"].wait(timeout)
+        return self.status(job_id)
+
+    def close(self, cancel_pending: bool = False, timeout: float = None):
+        """
+        Stops the workers.
+
+        Args:
+            cancel_pending (bool): Whether the queued jobs fail instead of being generated, running ones still finish.
+            timeout (float): Maximum seconds to wait for the workers, they are daemon threads and die with the process.
+        """
+        if cancel_pending:
+            while True:
+                try:
+                    job_id, _, _ = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                with self.lock:
+                    job = self.jobs[job_id]
+                    job["status"] = self.FAILED
+                    job["error"] = "Cancelled on shutdown"
+                job["event"].set()
+
+        for _ in self.workers:
+            self.queue.put(None)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for worker in self.workers:
+            worker.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+
+    def _find_image(self, job_id: str) -> str:
+        """Returns the path of a stored image, None if not generated yet."""
+        for extension in ["png", "jpeg", "webp"]:
+            path = os.path.join(self.output_path, f"{job_id}.{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _work(self):
+        """Generates the images of the queue until a None is received"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            job_id, prompt, style_preset = item
+            with self.lock:
+                job = self.jobs[job_id]
+                job["status"] = self.RUNNING
+
+            try:
+                # Bytes are written as returned, without decoding and encoding the image again
+                image = self.imagegen_model.predict_bytes(prompt=prompt, style_preset=style_preset)
+                path = os.path.join(self.output_path, f"{job_id}.{self._extension(image)}")
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(image)
+                os.replace(tmp_path, path)
+
+                with self.lock:
+                    job["status"] = self.DONE
+                    job["path"] = path
+            except Exception as e:
+                print(e)
+                with self.lock:
+                    job["status"] = self.FAILED
+                    job["error"] = str(e)
+
+            job["event"].set()
+
+    @staticmethod
+    def _extension(image: bytes) -> str:
+        """Guesses the file extension from the signature of the image"""
+        if image.startswith(b"\xff\xd8"):
+            return "jpeg"
+        if image.startswith(b"RIFF") and image[8:12] == b"WEBP":
+            return "webp"
+        return "png"
@@ -1,8 +1,9 @@
-import requests
-
 import io
 import base64
-from PIL import Image
+from typing import Dict
+
+from models.http_transport import HTTPTransport, default_transport
+from models.telemetry import tracer
 
 
 class StabilityAIImageGen:
@@ -13,13 +14,17 @@ class StabilityAIImageGen:
         endpoint: str = "",
         token: str = "",
         model_name: str = "sd3-turbo",
+        transport: HTTPTransport = None,
+        rate_limit: Dict = None,
     ) -> None:
         """ """
         self.endpoint = endpoint
         self.token = token
         self.model_name = model_name
+        self.transport = transport or default_transport
+        self.rate_limit = rate_limit
 
-    def predict(self, prompt: str, **kwargs) -> Image:
+    def predict(self, prompt: str, **kwargs) -> "Image.Image":
         """Generate an image from a prompt description using AI model.
 
         Args:
@@ -28,6 +33,19 @@ class StabilityAIImageGen:
         Returns:
             Image: Array with the image.
         """
+        from PIL import Image
+
+        return Image.open(io.BytesIO(self.predict_bytes(prompt, **kwargs)))
+
+    def predict_bytes(self, prompt: str, **kwargs) -> bytes:
+        """Generate an image from a prompt description using AI model, without decoding it.
+
+        Args:
+            prompt (str): Image description.
+
+        Returns:
+            bytes: Encoded image as returned by the service.
+        """
         data = {
             "prompt": prompt,
             "model": self.model_name,
@@ -42,10 +60,14 @@ class StabilityAIImageGen:
         }
         files = {"none": ""}
 
-        response = requests.post(imagegen_endpoint, headers=headers, data=data, files=files)
+        with tracer.span("image.generate", model=self.model_name, style_preset=data["style_preset"]) as span:
+            response = self.transport.post(
+                imagegen_endpoint, rate_limit=self.rate_limit, headers=headers, data=data, files=files
+            )
 
-        if response.status_code == 200:
-            img = Image.open(io.BytesIO(base64.b64decode(response.json()["image"])))
-            return img
-        else:
-            raise Exception(str(response.json()))
+            if response.status_code == 200:
+                image = base64.b64decode(response.json()["image"])
+                span.set(image_bytes=len(image))
+                return image
+            else:
+                raise Exception(str(response.json()))
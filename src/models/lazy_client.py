@@ -0,0 +1,28 @@
+import threading
+from typing import Callable
+
+
+class LazyClient:
+    """Proxy that creates a client on its first use, so clients that are never used cost nothing at startup"""
+
+    def __init__(self, factory: Callable):
+        """
+        Initializes the LazyClient.
+
+        Args:
+            factory (Callable): Function without arguments that creates the client.
+        """
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Returns the client, creating it on the first call."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
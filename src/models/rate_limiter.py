@@ -0,0 +1,203 @@
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Mapping
+
+# Rough number of characters per token, used to estimate the tokens of a request before sending it
+CHARS_PER_TOKEN = 4
+
+# Statuses worth retrying, the throttling ones also pause the endpoint and reduce its concurrency
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+
+def estimate_tokens(texts: Iterable[str]) -> int:
+    """
+    Estimates the number of tokens of some texts from their length.
+
+    Args:
+        texts (Iterable[str]): Texts of the request.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float:
+    """
+    Reads the delay requested by a throttled response.
+
+    Args:
+        headers (Mapping[str, str]): Response headers.
+
+    Returns:
+        float: Seconds to wait, None if the response does not say.
+    """
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Bucket refilled at a constant rate, requests take from it and wait while it is in debt"""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initializes the TokenBucket.
+
+        Args:
+            rate (float): Units added per second.
+            capacity (float): Maximum units kept, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Takes units from the bucket.
+
+        Args:
+            amount (float): Units taken, capped to the capacity.
+            now (float): Current time.monotonic().
+
+        Returns:
+            float: Seconds to wait until the units are available.
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+
+class RateLimiter:
+    """
+    Limits the requests sent to an endpoint, shared by all the clients of the endpoint.
+
+    Requests wait for a concurrency slot and for the requests/s and tokens/min buckets. Throttled responses
+    pause the whole endpoint for their Retry-After and halve the concurrency, successful ones raise it again
+    by one slot per round of requests (AIMD), so the clients settle just below the quota.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = None,
+        tokens_per_minute: float = None,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+    ):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            requests_per_second (float): Quota of requests per second, None for no limit.
+            tokens_per_minute (float): Quota of tokens per minute, None for no limit.
+            max_concurrency (int): Maximum number of requests in flight.
+            min_concurrency (int): Concurrency kept however many requests are throttled.
+            max_retries (int): Retries of a throttled or failed request before giving up.
+            base_delay (float): Backoff of the first retry, in seconds, doubled on every retry.
+            max_delay (float): Maximum backoff, in seconds.
+        """
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.n_throttled = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, n_tokens: int = 0) -> float:
+        """
+        Blocks until a request can be sent.
+
+        Args:
+            n_tokens (int): Estimated tokens of the request.
+
+        Returns:
+            float: Time the request was allowed, to be given back to release.
+        """
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.concurrency):
+                    self.condition.wait()
+                else:
+                    break
+
+            self.in_flight += 1
+            wait = 0.0
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None and n_tokens > 0:
+                wait = max(wait, self.tokens.reserve(n_tokens, now))
+
+        if wait > 0:
+            time.sleep(wait)
+        return now + wait
+
+    def release(self, sent_at: float, throttled: bool = False, retry_after: float = None):
+        """
+        Frees the slot of a finished request and adapts the concurrency.
+
+        Args:
+            sent_at (float): Value returned by acquire.
+            throttled (bool): Whether the endpoint throttled the request.
+            retry_after (float): Seconds the endpoint asked to wait, if any.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.n_throttled += 1
+                # Requests sent before the last decrease saw the old concurrency, they do not decrease it again
+                if sent_at >= self.last_decrease:
+                    self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+                    self.last_decrease = now
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            self.condition.notify_all()
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter, in seconds, of a retry (0 for the first one)."""
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "throttled": self.n_throttled,
+            }
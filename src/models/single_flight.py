@@ -0,0 +1,101 @@
+import json
+import hashlib
+import threading
+from typing import Callable
+
+from models.telemetry import tracer
+
+
+class _Call:
+    """A call in flight, with the result or error shared by every caller"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls in flight: concurrent callers with the same key wait for a single call
+    and all receive its result (or its exception). Nothing is kept once the call finishes, so it is not a cache.
+
+    Only deterministic calls must go through it (embeddings, searches, temperature ≈ 0 completions),
+    and the callers must not modify the shared result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.n_calls = 0
+        self.n_coalesced = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        """
+        Builds the key of a call from its parts.
+
+        Args:
+            *parts: JSON serializable values or arrays (anything with a tobytes method, e.g. numpy arrays).
+
+        Returns:
+            str: SHA-256 of the parts.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if hasattr(part, "tobytes"):
+                digest.update(part.tobytes())
+            else:
+                digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def do(self, key: str, func: Callable, *args, **kwargs):
+        """
+        Runs func, or waits for the identical call already in flight.
+
+        Args:
+            key (str): Key of the call, see SingleFlight.key.
+            func (Callable): Function to run.
+            *args, **kwargs: Arguments of func.
+
+        Returns:
+            The result of the call.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                self.n_calls += 1
+                leader = True
+            else:
+                self.n_coalesced += 1
+                leader = False
+
+        if not leader:
+            tracer.current_span().set(coalesced=True)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"calls": self.n_calls, "coalesced": self.n_coalesced, "in_flight": len(self.calls)}
+
+
+# Coalescing layer shared by the model clients and the search helpers unless another one is given
+default_single_flight = SingleFlight()
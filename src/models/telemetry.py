@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from typing import Callable, Dict, List
+
+
+# Upper bounds of the duration histograms, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Span attributes summed into counters
+COUNTED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "retries")
+
+
+class Span:
+    """A timed operation of a trace, with its attributes (HTTP status, retries, tokens...)"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attributes", "start", "duration", "error")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: "Span", attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Sets attributes of the span."""
+        self.attributes.update(attributes)
+
+    def add(self, attribute: str, value: float = 1):
+        """Adds a value to a numeric attribute of the span."""
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + value
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "status": "error" if self.error is not None else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span returned while tracing is disabled, every operation does nothing"""
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, attribute: str, value: float = 1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+    """Context manager that starts a span, makes it current and finishes it on exit"""
+
+    __slots__ = ("tracer", "name", "attributes", "span", "token", "perf_start")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.tracer, self.name, self.tracer._current.get(), self.attributes)
+        self.token = self.tracer._current.set(self.span)
+        self.perf_start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration = time.perf_counter() - self.perf_start
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        try:
+            self.tracer._current.reset(self.token)
+        except ValueError:
+            # A generator span closed from another context, the context it was set in is gone anyway
+            pass
+        self.tracer._finish(self.span)
+        return False
+
+
+class Histogram:
+    """Cumulative histogram of durations, in the Prometheus bucket layout"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket where it falls."""
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count > 0 else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets], self.counts)),
+        }
+
+
+class JSONLinesExporter:
+    """Appends every finished span to a JSON lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "a")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Tracer:
+    """
+    Collects spans of the model, search and tool calls, and aggregates them in histograms and counters.
+    While disabled, span() returns a shared no-op span, so the instrumented code pays one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False, exporters: List = None, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the Tracer.
+
+        Args:
+            enabled (bool): Whether spans are recorded.
+            exporters (list): Objects with an export(span) method called for every finished span.
+            buckets (tuple): Upper bounds of the duration histograms, in seconds.
+        """
+        self.enabled = enabled
+        self.exporters = exporters or []
+        self.buckets = buckets
+
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.errors = {}
+        self._current = contextvars.ContextVar("current_span", default=None)
+
+    def enable(self, exporters: List = None):
+        """Starts recording spans, adding the given exporters."""
+        self.exporters += exporters or []
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name: str, **attributes):
+        """
+        Returns a context manager that records a span, child of the current one.
+
+        Args:
+            name (str): Name of the operation, spans with the same name share a histogram.
+            **attributes: Initial attributes of the span.
+
+        Returns:
+            Context manager yielding the Span.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _SpanContext(self, name, attributes)
+
+    def current_span(self):
+        """Returns the current span, a no-op span if there is none."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._current.get() or _NOOP_SPAN
+
+    def bind(self, func: Callable) -> Callable:
+        """
+        Binds a function to the current span, so the spans it opens in a worker thread keep their parent.
+
+        Args:
+            func (Callable): Function that will run in another thread.
+
+        Returns:
+            Callable: The function, running under the current span.
+        """
+        if not self.enabled:
+            return func
+        parent = self._current.get()
+
+        def bound(*args, **kwargs):
+            token = self._current.set(parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._current.reset(token)
+
+        return bound
+
+    def _finish(self, span: Span):
+        with self.lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram(self.buckets)
+            histogram.observe(span.duration)
+
+            if span.error is not None:
+                self.errors[span.name] = self.errors.get(span.name, 0) + 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    key = (span.name, attribute)
+                    self.counters[key] = self.counters.get(key, 0) + value
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(e)
+
+    def stats(self) -> Dict:
+        """Returns the histograms, errors and counters of every span name."""
+        with self.lock:
+            stats = {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+            for name in stats:
+                stats[name]["errors"] = self.errors.get(name, 0)
+            for (name, attribute), value in self.counters.items():
+                stats[name][attribute] = value
+            return stats
+
+    def prometheus_text(self, prefix: str = "cosmere") -> str:
+        """
+        Renders the aggregated metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix of the metric names.
+
+        Returns:
+            str: Metrics text.
+        """
+        lines = [
+            f"# HELP {prefix}_span_duration_seconds Duration of the traced operations.",
+            f"# TYPE {prefix}_span_duration_seconds histogram",
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_span_duration_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_span_duration_seconds_sum{{span="{name}"}} {histogram.sum}')
+                lines.append(f'{prefix}_span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+
+            lines += [
+                f"# HELP {prefix}_span_errors_total Traced operations that raised.",
+                f"# TYPE {prefix}_span_errors_total counter",
+            ]
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'{prefix}_span_errors_total{{span="{name}"}} {count}')
+
+            for attribute in COUNTED_ATTRIBUTES:
+                lines += [
+                    f"# HELP {prefix}_{attribute}_total Sum of the {attribute} of the traced operations.",
+                    f"# TYPE {prefix}_{attribute}_total counter",
+                ]
+                for (name, counted), value in sorted(self.counters.items()):
+                    if counted == attribute:
+                        lines.append(f'{prefix}_{attribute}_total{{span="{name}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "cosmere"):
+        """Writes the metrics to a file, e.g. for the textfile collector of the node exporter."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text(prefix))
+        # Atomic replace, so a scrape never reads a partial file
+        os.replace(tmp_path, path)
+
+
+# Tracer shared by the model clients, the search helpers and the chatbot, disabled until enable() is called
+tracer = Tracer()
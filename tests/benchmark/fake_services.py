@@ -0,0 +1,245 @@
+import re
+import sys
+import json
+import time
+import zlib
+import base64
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import numpy as np
+
+
+WORDS = (
+    "el la de que y a en un ser se no haber por con su para como estar tener le lo todo pero mas hacer o poder "
+    "decir este ir otro ese si me ya ver porque dar cuando muy sin vez mucho saber sobre tambien hasta alto "
+    "tormenta esquirlada puente luz radiante spren caballero juramento viento piedra"
+).split()
+
+
+def lorem(n_words: int, seed: int = 0) -> str:
+    """Returns n_words of pseudo Spanish text, the same for the same seed"""
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients close streamed responses and idle pooled connections at will
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeService:
+    """
+    Local HTTP stand-in for a remote API, with configurable latency and errors.
+    Subclasses implement handle, which returns the status and the JSON body of a request.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500):
+        """
+        Args:
+            latency (float): Mean seconds before answering.
+            jitter (float): Standard deviation of the latency.
+            error_rate (float): Fraction of the requests answered with error_status.
+            error_status (int): Status of the failed requests (500, 503, 429...).
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+        self.n_requests = 0
+        self.n_errors = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeService":
+        """Starts serving in a background thread on a free local port"""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                service._serve(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> Dict:
+        return {"requests": self.n_requests, "errors": self.n_errors}
+
+    def handle(self, path: str, body: Dict, request: BaseHTTPRequestHandler) -> tuple:
+        raise NotImplementedError
+
+    def _serve(self, request: BaseHTTPRequestHandler):
+        length = int(request.headers.get("Content-Length", 0))
+        raw = request.rfile.read(length)
+        content_type = request.headers.get("Content-Type", "")
+        body = json.loads(raw) if "json" in content_type and len(raw) > 0 else {"raw": raw}
+
+        with self.lock:
+            self.n_requests += 1
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter)) if self.jitter > 0 else self.latency
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.n_errors += 1
+        time.sleep(delay)
+
+        if failed:
+            self._send_json(request, self.error_status, {"error": {"code": "Injected", "message": "Injected error"}})
+            return
+
+        result = self.handle(request.path, body, request)
+        if result is not None:
+            self._send_json(request, *result)
+
+    @staticmethod
+    def _send_json(request: BaseHTTPRequestHandler, status: int, data: Dict):
+        payload = json.dumps(data).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            request.send_header("Retry-After", "1")
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+class FakeEmbeddings(FakeService):
+    """Embeddings API, vectors are deterministic per text"""
+
+    def __init__(self, dimensions: int = 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.dimensions = dimensions
+
+    def handle(self, path, body, request):
+        data = []
+        for i, text in enumerate(body["input"]):
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            data.append({"index": i, "embedding": rng.standard_normal(self.dimensions).round(6).tolist()})
+        usage = {"prompt_tokens": sum(len(text.split()) for text in body["input"])}
+        return 200, {"data": data, "usage": usage}
+
+
+class FakeChatCompletions(FakeService):
+    """
+    Chat completions API. The answer depends on the prompt, so the chatbot follows its usual path:
+    the tool selection asks for ask_data, the filters keep every passage and the rest gets plain text.
+    """
+
+    def __init__(self, answer_words: int = 150, token_latency: float = 0.0, **kwargs):
+        """
+        Args:
+            answer_words (int): Number of words of the plain text answers.
+            token_latency (float): Seconds between two streamed words.
+        """
+        super().__init__(**kwargs)
+        self.answer_words = answer_words
+        self.token_latency = token_latency
+
+    def answer(self, messages) -> str:
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        last = messages[-1]["content"]
+        if system.startswith("You are an assistant with access"):
+            return json.dumps({"function_name": "ask_data", "parameters": {"search_queries": [last]}})
+        if last.endswith("¿Es útil o relevante?:"):
+            return "SI"
+        if last.endswith("Fragmentos útiles o relevantes:"):
+            n_fragments = len(re.findall(r"^\s*\[\d+\]", last, flags=re.MULTILINE))
+            return ", ".join(str(i + 1) for i in range(max(n_fragments, 1)))
+        return lorem(self.answer_words, seed=len(messages))
+
+    def handle(self, path, body, request):
+        content = self.answer(body["messages"])
+        usage = {
+            "prompt_tokens": sum(len(message["content"].split()) for message in body["messages"]),
+            "completion_tokens": len(content.split()),
+        }
+        if not body.get("stream"):
+            choices = [{"index": 0, "message": {"role": "assistant", "content": content}}]
+            return 200, {"choices": choices, "usage": usage}
+
+        # Server-sent events, one word per event
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Transfer-Encoding", "chunked")
+        request.end_headers()
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            delta = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self._send_chunk(request, f"data: {json.dumps(delta)}\n\n")
+            time.sleep(self.token_latency)
+        self._send_chunk(request, f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+        self._send_chunk(request, "data: [DONE]\n\n")
+        request.wfile.write(b"0\r\n\r\n")
+        return None
+
+    @staticmethod
+    def _send_chunk(request, text: str):
+        payload = text.encode("utf-8")
+        request.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        request.wfile.flush()
+
+
+class FakeImageGen(FakeService):
+    """Image generation API, returns a PNG-signed payload of image_bytes"""
+
+    def __init__(self, image_bytes: int = 500000, **kwargs):
+        super().__init__(**kwargs)
+        self.image = base64.b64encode(b"\x89PNG\r\n\x1a\n" + bytes(max(image_bytes - 8, 0))).decode("ascii")
+
+    def handle(self, path, body, request):
+        return 200, {"image": self.image}
+
+
+class FakeSearch(FakeService):
+    """Azure AI Search documents API (search and index operations)"""
+
+    def __init__(self, results: int = 5, content_words: int = 300, **kwargs):
+        """
+        Args:
+            results (int): Maximum number of results of a search.
+            content_words (int): Number of words of the content of every result.
+        """
+        super().__init__(**kwargs)
+        self.results = results
+        self.content_words = content_words
+        self.n_documents = 0
+
+    def handle(self, path, body, request):
+        if "search.index" in path:
+            with self.lock:
+                self.n_documents += len(body["value"])
+            value = [
+                {"key": doc["id"], "status": True, "errorMessage": None, "statusCode": 201} for doc in body["value"]
+            ]
+            return 200, {"value": value}
+
+        top = min(body.get("top") or self.results, self.results)
+        value = [
+            {"@search.score": 1.0 / (i + 1), "id": f"doc_{i}", "content": lorem(self.content_words, seed=i)}
+            for i in range(top)
+        ]
+        return 200, {"value": value}
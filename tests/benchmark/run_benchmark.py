@@ -0,0 +1,389 @@
+"""
+End-to-end latency benchmark against local stand-ins of the embeddings, chat completions, image and search APIs.
+
+Usage (from the repository root):
+    python tests/benchmark/run_benchmark.py --output bench_output.json
+    python tests/benchmark/run_benchmark.py --config my_config.json --scenarios chat_turn ask_data
+
+The configuration is DEFAULT_CONFIG updated with the optional JSON file, so only the changed values are needed.
+Results are JSON: per scenario the end-to-end and per-stage latency percentiles (seconds), the throughput and
+the requests received by the fake services. Compare two outputs to spot regressions between commits.
+"""
+
+import os
+import sys
+import copy
+import contextlib
+import json
+import time
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(os.path.join(ROOT, "src", "chat"))
+sys.path.append(os.path.join(ROOT, "src", "data_index"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+
+import search_utils
+from chatbot import ChatBot
+from models.embedding_model import AzureAIEmbedding
+from models.chatcomplete_model import AzureAIChatComplete
+from models.imagegen_model import StabilityAIImageGen
+from models.image_jobs import ImageJobQueue
+from models.http_transport import HTTPTransport
+from chunker import Chunker
+from book_indexer import BookIndexer
+from index_pipeline import IndexPipeline
+from index_data import IndexDataWriter
+from uploader import IndexUploader
+
+from fake_services import FakeEmbeddings, FakeChatCompletions, FakeImageGen, FakeSearch, lorem
+
+
+DEFAULT_CONFIG = {
+    "services": {
+        "embeddings": {"latency": 0.05, "jitter": 0.01, "error_rate": 0.0, "dimensions": 1024},
+        "chat": {"latency": 0.3, "jitter": 0.05, "error_rate": 0.0, "answer_words": 150, "token_latency": 0.005},
+        "search": {"latency": 0.03, "jitter": 0.01, "error_rate": 0.0, "results": 5, "content_words": 300},
+        "image": {"latency": 2.0, "jitter": 0.2, "error_rate": 0.0, "image_bytes": 500000},
+    },
+    "scenarios": {
+        "chat_turn": {"iterations": 10, "concurrency": 1, "concurrent": True, "batch_filter": False},
+        "ask_data": {"iterations": 20, "concurrency": 4, "queries": 3, "concurrent": True, "batch_search": False},
+        "create_image": {"iterations": 5, "n_workers": 2},
+        "indexing": {"books": 4, "paragraphs": 2000, "paragraph_words": 60, "embed_max_workers": 4},
+        "upload": {"documents": 5000, "content_words": 300, "max_workers": 4},
+    },
+}
+
+
+class StageTimer:
+    """Records the latency of the stages of a scenario by wrapping the methods that implement them"""
+
+    def __init__(self):
+        self.durations = {}
+        self.errors = {}
+        self.patched = []
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, failed: bool = False):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(seconds)
+            if failed:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def wrap(self, obj, attr: str, stage: str):
+        """Replaces obj.attr by a timed version until restore is called"""
+        func = getattr(obj, attr)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.record(stage, time.perf_counter() - start, failed)
+
+        self.patched.append((obj, attr, obj.__dict__.get(attr) if hasattr(obj, "__dict__") else None))
+        setattr(obj, attr, timed)
+
+    def restore(self):
+        for obj, attr, original in reversed(self.patched):
+            if original is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+        self.patched = []
+
+    def summary(self) -> Dict:
+        return {
+            stage: dict(latency_stats(durations), errors=self.errors.get(stage, 0))
+            for stage, durations in self.durations.items()
+        }
+
+
+def latency_stats(durations: List[float]) -> Dict:
+    """Count, mean and percentiles of a list of durations in seconds"""
+    if len(durations) == 0:
+        return {"count": 0}
+    values = np.asarray(durations)
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        "count": len(values),
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(values.max()),
+    }
+
+
+def run_iterations(func: Callable[[int], None], iterations: int, concurrency: int, timer: StageTimer) -> Dict:
+    """Runs func(i) iterations times with up to concurrency calls at once, timing each one end to end"""
+
+    def run(i):
+        start = time.perf_counter()
+        failed = True
+        try:
+            func(i)
+            failed = False
+        except Exception as e:
+            print(e, file=sys.stderr)
+        finally:
+            timer.record("end_to_end", time.perf_counter() - start, failed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, range(iterations)))
+    wall_time = time.perf_counter() - start
+
+    return {"wall_time": wall_time, "throughput": iterations / wall_time}
+
+
+class Benchmark:
+    """Starts the fake services, builds the clients against them and runs the scenarios"""
+
+    def __init__(self, config: Dict, work_path: str):
+        self.config = config
+        self.work_path = work_path
+
+        services = config["services"]
+        self.services = {
+            "embeddings": FakeEmbeddings(**services["embeddings"]).start(),
+            "chat": FakeChatCompletions(**services["chat"]).start(),
+            "search": FakeSearch(**services["search"]).start(),
+            "image": FakeImageGen(**services["image"]).start(),
+        }
+
+        self.transport = HTTPTransport(pool_maxsize=32)
+        self.chunker = Chunker()
+        self.embedding_model = AzureAIEmbedding(
+            endpoint=self.services["embeddings"].url, token="token", model_name="fake", transport=self.transport
+        )
+        self.chatcomplete_model = AzureAIChatComplete(
+            endpoint=self.services["chat"].url, token="token", model_name="fake", transport=self.transport
+        )
+        self.imagegen_model = StabilityAIImageGen(
+            endpoint=self.services["image"].url, token="token", model_name="fake", transport=self.transport
+        )
+        self.search_client = SearchClient(
+            endpoint=self.services["search"].url, index_name="cosmere", credential=AzureKeyCredential("key")
+        )
+
+    def close(self):
+        for service in self.services.values():
+            service.stop()
+        self.transport.close()
+
+    def run(self, scenarios: List[str]) -> Dict:
+        results = {}
+        for name in scenarios:
+            print(f"Running {name}", file=sys.stderr)
+            requests_before = {key: service.stats() for key, service in self.services.items()}
+            timer = StageTimer()
+
+            # The debug prints of the chatbot and the indexer are not part of the results
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                try:
+                    result = getattr(self, f"scenario_{name}")(self.config["scenarios"][name], timer)
+                finally:
+                    timer.restore()
+
+            stages = timer.summary()
+            result["end_to_end"] = stages.pop("end_to_end", {"count": 0})
+            result["stages"] = stages
+            result["service_requests"] = {
+                key: {
+                    stat: value - requests_before[key][stat] for stat, value in service.stats().items()
+                }
+                for key, service in self.services.items()
+            }
+            results[name] = result
+        return results
+
+    def _chatbot(self, timer: StageTimer, **kwargs) -> ChatBot:
+        """ChatBot with its model calls timed"""
+        chatbot = ChatBot(
+            self.embedding_model, self.chatcomplete_model, self.imagegen_model, self.search_client, **kwargs
+        )
+        timer.wrap(self.embedding_model, "raw_predict", "embedding")
+        timer.wrap(self.chatcomplete_model, "predict", "chat_complete")
+        timer.wrap(search_utils, "search_vector", "search")
+        timer.wrap(chatbot, "ask_data", "ask_data")
+        timer.wrap(chatbot, "_filter_passage", "filter")
+        timer.wrap(chatbot, "_filter_passages_batch", "filter_batch")
+        return chatbot
+
+    def scenario_chat_turn(self, config: Dict, timer: StageTimer) -> Dict:
+        """A full streamed turn: tool selection, ask_data and the streamed final answer"""
+        chatbot = self._chatbot(timer, concurrent=config["concurrent"], batch_filter=config["batch_filter"])
+
+        def turn(i):
+            start = time.perf_counter()
+            messages = [{"role": "user", "content": f"¿Quién es el personaje {i}?"}]
+            first = True
+            for _ in chatbot.chat_stream(messages, []):
+                if first:
+                    timer.record("first_token", time.perf_counter() - start)
+                    first = False
+
+        return run_iterations(turn, config["iterations"], config["concurrency"], timer)
+
+    def scenario_ask_data(self, config: Dict, timer: StageTimer) -> Dict:
+        """ask_data alone: embed, search and filter several queries"""
+        chatbot = self._chatbot(timer, concurrent=config["concurrent"], batch_search=config["batch_search"])
+
+        def ask(i):
+            chatbot.ask_data([f"Pregunta {i} número {j}" for j in range(config["queries"])])
+
+        return run_iterations(ask, config["iterations"], config["concurrency"], timer)
+
+    def scenario_create_image(self, config: Dict, timer: StageTimer) -> Dict:
+        """create_image through the job queue: the chat returns at once, the job completes in the background"""
+        image_jobs = ImageJobQueue(
+            self.imagegen_model, os.path.join(self.work_path, "images"), n_workers=config["n_workers"]
+        )
+        chatbot = self._chatbot(timer, image_jobs=image_jobs)
+        timer.wrap(self.imagegen_model, "predict_bytes", "image_generation")
+        job_ids = []
+
+        def create(i):
+            start = time.perf_counter()
+            chatbot.create_image(f"A knight with a shardblade number {i}", "fantasy-art")
+            timer.record("chat_return", time.perf_counter() - start)
+            job_id = image_jobs.job_id(f"A knight with a shardblade number {i}", "fantasy-art")
+            job_ids.append(job_id)
+            if image_jobs.wait(job_id)["status"] != ImageJobQueue.DONE:
+                raise Exception(f"Image job {job_id} failed")
+
+        result = run_iterations(create, config["iterations"], config["iterations"], timer)
+        image_jobs.close()
+        return result
+
+    def scenario_indexing(self, config: Dict, timer: StageTimer) -> Dict:
+        """Chunk, embed and store synthetic books with the streaming pipeline"""
+        books_path = os.path.join(self.work_path, "books")
+        os.makedirs(books_path, exist_ok=True)
+        for b in range(config["books"]):
+            with open(os.path.join(books_path, f"book_{b}.txt"), "w") as f:
+                for p in range(config["paragraphs"]):
+                    f.write(lorem(config["paragraph_words"], seed=b * config["paragraphs"] + p) + "\n")
+
+        embedding_model = AzureAIEmbedding(
+            endpoint=self.services["embeddings"].url,
+            token="token",
+            model_name="fake",
+            max_workers=config["embed_max_workers"],
+            transport=self.transport,
+        )
+        book_indexer = BookIndexer(books_path, self.chunker, embedding_model)
+        timer.wrap(book_indexer, "chunk_single_book", "chunk")
+        timer.wrap(embedding_model, "raw_predict", "embedding")
+        n_documents = []
+
+        def index(i):
+            with IndexDataWriter(os.path.join(self.work_path, f"index_data_{i}")) as writer:
+                timer.wrap(writer, "write", "write")
+                n_documents.append(IndexPipeline(book_indexer, writer.write).run())
+
+        result = run_iterations(index, 1, 1, timer)
+        result["documents"] = sum(n_documents)
+        result["documents_per_second"] = result["documents"] / result["wall_time"]
+        return result
+
+    def scenario_upload(self, config: Dict, timer: StageTimer) -> Dict:
+        """Upload synthetic documents with vectors to the search service"""
+        dimensions = self.config["services"]["embeddings"]["dimensions"]
+        rng = np.random.default_rng(0)
+        documents = [
+            {
+                "id": f"doc_{i}",
+                "document": "book.txt",
+                "path": "book.txt",
+                "content": lorem(config["content_words"], seed=i),
+                "vector": rng.standard_normal(dimensions).round(6).tolist(),
+            }
+            for i in range(config["documents"])
+        ]
+
+        uploader = IndexUploader(self.search_client, max_workers=config["max_workers"])
+        timer.wrap(uploader, "upload_batch", "upload_batch")
+        stats = []
+
+        result = run_iterations(lambda i: stats.append(uploader.upload(documents)), 1, 1, timer)
+        result["documents"] = stats[0]["uploaded"] if len(stats) > 0 else 0
+        result["failed"] = len(stats[0]["failed"]) if len(stats) > 0 else config["documents"]
+        result["documents_per_second"] = result["documents"] / result["wall_time"]
+        return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def update_config(config: Dict, overrides: Dict) -> Dict:
+    """Recursively updates a copy of config with overrides"""
+    config = copy.deepcopy(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = update_config(config[key], value)
+        else:
+            config[key] = value
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="JSON file with the values of DEFAULT_CONFIG to change")
+    parser.add_argument("--scenarios", nargs="+", default=list(DEFAULT_CONFIG["scenarios"]))
+    parser.add_argument("--output", help="JSON file for the results, printed if not given")
+    args = parser.parse_args()
+
+    config = DEFAULT_CONFIG
+    if args.config is not None:
+        with open(args.config, "r") as f:
+            config = update_config(config, json.load(f))
+
+    with tempfile.TemporaryDirectory() as work_path:
+        benchmark = Benchmark(config, work_path)
+        try:
+            scenarios = benchmark.run(args.scenarios)
+        finally:
+            benchmark.close()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": config,
+        "scenarios": scenarios,
+    }
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+from chatbot import ChatBot
+from lexical_index import BM25Index
+
+
+class FakeEmbedding:
+    """Local stand-in for the embedding model, records the embedded texts"""
+
+    def __init__(self):
+        self.texts = []
+
+    def predict(self, texts):
+        self.texts += texts
+        return np.asarray([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_cache_of_another_index_build_is_discarded(tmp_path):
+    path = str(tmp_path / "answer_cache.json")
+    manifest_path = str(tmp_path / "manifest.json")
+    with open(manifest_path, "w") as f:
+        f.write('{"n_rows": 10}')
+
+    cache = SemanticAnswerCache(path=path, index_version=SemanticAnswerCache.manifest_version(manifest_path))
+    cache.put("¿Quién es Kaladin?", [1.0, 0.0], "Kaladin es un Corredor del Viento")
+    cache.save()
+
+    same_build = SemanticAnswerCache(path=path, index_version=SemanticAnswerCache.manifest_version(manifest_path))
+    assert same_build.get([1.0, 0.0]) == "Kaladin es un Corredor del Viento"
+
+    with open(manifest_path, "w") as f:
+        f.write('{"n_rows": 12}')
+    new_build = SemanticAnswerCache(path=path, index_version=SemanticAnswerCache.manifest_version(manifest_path))
+    assert new_build.get([1.0, 0.0]) is None
+    assert new_build.stats()["size"] == 0
+
+
+def test_lexical_fast_path_queries_are_not_embedded_for_the_cache():
+    documents = [{"id": f"filler_{i}", "content": f"The storm passed over the plains on day {i}."} for i in range(200)]
+    documents += [
+        {"id": "szeth", "content": "Szeth-son-son-Vallano, Truthless of Shinovar, wore white on the day of the kill"},
+        {"id": "szeth_2", "content": "The assassin in white crossed the storm."},
+    ]
+    embedding_model = FakeEmbedding()
+    chatbot = ChatBot(
+        embedding_model,
+        None,
+        None,
+        None,
+        lexical_index=BM25Index.build(documents),
+        answer_cache=SemanticAnswerCache(),
+    )
+    chatbot._ask_data_queries = lambda search_queries, **kwargs: [f"data of {query}" for query in search_queries]
+
+    answer = chatbot.ask_data(["Szeth Truthless of Shinovar", "¿Quién es Kaladin?"])
+
+    assert answer == "data of Szeth Truthless of Shinovar\n\ndata of ¿Quién es Kaladin?"
+    assert embedding_model.texts == ["¿Quién es Kaladin?"]
+    assert chatbot.answer_cache.stats()["size"] == 1
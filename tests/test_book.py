@@ -0,0 +1,105 @@
+import os
+import sys
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import pytest
+
+import chunker as chunker_module
+from book import Book, Paragraph
+from book_indexer import BookIndexer
+from chunker import Chunker
+
+
+class WordEncoding:
+    """Local stand-in for the tiktoken encoding, one token per word"""
+
+    def __init__(self):
+        self.words = []
+
+    def encode_batch(self, texts):
+        return [[self._token(word) for word in text.split(" ")] for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(self.words[token] for token in tokens)
+
+    def _token(self, word):
+        self.words.append(word)
+        return len(self.words) - 1
+
+
+def word_chunker(chunk_size, chunk_overlap):
+    chunker = Chunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunker.token_counter._encoding = WordEncoding()
+    return chunker
+
+
+def write_book(tmp_path, data: bytes) -> str:
+    path = str(tmp_path / "book.txt")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_paragraphs_have_byte_offsets(tmp_path):
+    data = "﻿La Vía\r\n\r\nKaladin ñ\n\nFin".encode("utf-8")
+    path = write_book(tmp_path, data)
+
+    paragraphs = list(Book(path).iter_paragraphs())
+
+    assert [p.text for p in paragraphs] == ["La Vía", "Kaladin ñ", "Fin"]
+    assert all(data[p.start : p.end].decode("utf-8") == p.text for p in paragraphs)
+    assert Book(path).paragraphs == ["La Vía", "Kaladin ñ", "Fin"]
+
+
+def test_encoding_errors(tmp_path):
+    path = write_book(tmp_path, b"ok\n\xff bad\n")
+
+    with pytest.raises(ValueError, match="bytes 3-4"):
+        list(Book(path).iter_paragraphs())
+    assert Book(path, errors="replace").paragraphs == ["ok", "� bad"]
+    assert Book(path, encoding="latin-1").paragraphs == ["ok", "ÿ bad"]
+
+
+def test_chunks_keep_the_positions_of_their_paragraphs(tmp_path):
+    data = b"one two\nthree four\nfive six\nseven eight nine ten eleven\n"
+    path = write_book(tmp_path, data)
+
+    chunks = word_chunker(chunk_size=5, chunk_overlap=3).split_paragraphs(Book(path).iter_paragraphs())
+
+    assert [chunk["content"] for chunk in chunks] == [
+        "one two\nthree four",
+        "three four\nfive six",
+        "seven eight nine ten eleven",
+    ]
+    for chunk in chunks:
+        assert data[chunk["start"] : chunk["end"]].decode() == chunk["content"]
+
+
+def test_streamed_and_listed_paragraphs_give_the_same_chunks():
+    paragraphs = [" ".join(f"w{i}_{j}" for j in range(i % 7 + 1)) for i in range(200)]
+    offsets = [Paragraph(text, i * 100, i * 100 + len(text)) for i, text in enumerate(paragraphs)]
+
+    listed = word_chunker(chunk_size=12, chunk_overlap=4).split_paragraphs(paragraphs)
+    streamed = list(word_chunker(chunk_size=12, chunk_overlap=4).iter_chunks(iter(offsets), batch_size=7))
+
+    assert [chunk["content"] for chunk in streamed] == [chunk["content"] for chunk in listed]
+    assert all("start" not in chunk for chunk in listed)
+    assert all(chunk["start"] < chunk["end"] for chunk in streamed)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="workers must inherit the word encoding")
+def test_parallel_chunk_records_match_the_sequential_ones(tmp_path, monkeypatch):
+    monkeypatch.setitem(chunker_module._encodings, "cl100k_base", WordEncoding())
+    for i in range(7):
+        with open(tmp_path / f"book_{i}.txt", "w") as f:
+            f.write("\n".join(" ".join(f"w{i}_{j}_{k}" for k in range(j % 5 + 1)) for j in range(40)))
+
+    def records(n_workers):
+        indexer = BookIndexer(str(tmp_path), Chunker(chunk_size=12, chunk_overlap=4), None, n_workers=n_workers)
+        indexer.load_data()
+        return list(indexer.iter_chunk_records()), [fmap["chunk_ids"] for fmap in indexer.files_mapping]
+
+    assert records(n_workers=3) == records(n_workers=1)
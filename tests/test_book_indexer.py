@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import numpy as np
+
+from book_indexer import BookIndexer
+
+
+class FakeEmbedding:
+    """Local stand-in for the embedding model, the vector of a text is its length"""
+
+    def predict(self, texts, **kwargs):
+        return np.asarray([[float(len(text)), 1.0] for text in texts])
+
+
+def test_chunks_with_and_without_offsets_get_all_the_index_columns():
+    indexer = BookIndexer("books", None, FakeEmbedding())
+    with_offsets = [{"content": "Kaladin", "tokens": 1, "start": 0, "end": 7}]
+    without_offsets = [{"content": "Syl", "tokens": 1}, {"content": "Bridge four", "tokens": 2}]
+
+    df_with = indexer._create_df_chunks(with_offsets, "a.txt", "books/a.txt")
+    df_without = indexer._create_df_chunks(without_offsets, "b.txt", "books/b.txt")
+
+    assert list(df_with.columns) == indexer.index_column_names
+    assert list(df_without.columns) == indexer.index_column_names
+    assert df_with.to_dict(orient="records")[0] == {
+        "id": "atxt_0",
+        "document": "a.txt",
+        "content": "Kaladin",
+        "path": "books/a.txt",
+        "start": 0,
+        "end": 7,
+        "vector": [7.0, 1.0],
+    }
+    assert df_without["id"].to_list() == ["btxt_0", "btxt_1"]
+    assert df_without["start"].isna().all() and df_without["end"].isna().all()
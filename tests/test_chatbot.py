@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import numpy as np
+import pytest
+
+import chatbot as chatbot_module
+from chatbot import ChatBot
+from lexical_index import BM25Index
+from answer_cache import SemanticAnswerCache
+from models.telemetry import Tracer
+
+
+class FakeEmbedding:
+    """Local stand-in for the embedding model, the vector of a query is its position"""
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.texts = []
+
+    def predict(self, texts, **kwargs):
+        self.texts += texts
+        return np.asarray([[float(self.queries.index(text)), 1.0] for text in texts])
+
+
+class FakeSearchClient:
+    """Local stand-in for the search client, returns the passages of the query of the vector"""
+
+    def __init__(self, passages_by_query):
+        self.passages_by_query = passages_by_query
+
+    def search(self, search_text=None, vector_queries=None, select=None, top=5, **kwargs):
+        passages = self.passages_by_query[int(vector_queries[0].vector[0])]
+        return [{"id": passage, "content": passage, "@search.score": 1.0} for passage in passages]
+
+
+class FakeChatComplete:
+    """Local stand-in for the chat model, a passage is relevant if it starts with the query"""
+
+    def __init__(self, delays=None, batch_answer=None):
+        self.delays = delays or {}
+        self.batch_answer = batch_answer
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def predict(self, messages, **kwargs):
+        content = messages[-1]["content"]
+        query = re.search(r"Pregunta: (.*)", content).group(1)
+        time.sleep(self.delays.get(query, 0.0))
+
+        if "Fragmentos a filtrar" in content:
+            with self.lock:
+                self.calls.append(("batch", query, None))
+            answer = self.batch_answer
+        else:
+            context = re.search(r"Información a filtrar:\s*(.*?)\s*¿Es útil", content, re.S).group(1)
+            with self.lock:
+                self.calls.append(("single", query, context))
+            answer = "SI" if context.startswith(query) else "NO"
+        return {"choices": [{"message": {"content": answer}}]}
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+
+def make_chatbot(passages_by_query, queries, chatcomplete_model, **kwargs):
+    return ChatBot(FakeEmbedding(queries), chatcomplete_model, None, FakeSearchClient(passages_by_query), **kwargs)
+
+
+def test_concurrent_answers_keep_the_order_of_the_queries():
+    queries = ["q0", "q1", "q2"]
+    passages = [[f"{query} passage", "other"] for query in queries]
+    # The first query finishes last
+    chatcomplete_model = FakeChatComplete(delays={"q0": 0.1, "q1": 0.05})
+    chatbot = make_chatbot(passages, queries, chatcomplete_model, concurrent=True, max_concurrency=4)
+
+    answer = chatbot.ask_data(queries)
+
+    assert answer == "q0 passage\n\nq1 passage\n\nq2 passage"
+
+
+def test_filtering_stops_at_the_first_batch_with_relevant_passages():
+    passages = [[f"other {i}" for i in range(12)]]
+    passages[0][6] = "q0 first"
+    passages[0][11] = "q0 second"
+    chatcomplete_model = FakeChatComplete()
+    chatbot = make_chatbot(passages, ["q0"], chatcomplete_model)
+
+    answer = chatbot.ask_data(["q0"])
+
+    # The second batch has a relevant passage, the third one is never judged
+    assert answer == "q0 first"
+    assert [context for _, _, context in chatcomplete_model.calls] == passages[0][:10]
+
+
+@pytest.mark.parametrize(
+    "response_message, expected",
+    [
+        ("1, 3", {0, 2}),
+        ("[2] y [5].", {1, 4}),
+        ("NINGUNO", set()),
+        ("ninguno.", set()),
+        # Repeated indices are kept once
+        ("2, 2, 3", {1, 2}),
+        # Out of range
+        ("0", None),
+        ("1, 6", None),
+        # Malformed
+        ("", None),
+        ("El fragmento 1", None),
+        ("SI", None),
+    ],
+)
+def test_parse_relevant_indices(response_message, expected):
+    assert ChatBot._parse_relevant_indices(response_message, 5) == expected
+
+
+def test_batch_filter_judges_all_passages_in_one_call():
+    passages = [["q0 a", "other", "q0 b"]]
+    chatcomplete_model = FakeChatComplete(batch_answer="1, 3")
+    chatbot = make_chatbot(passages, ["q0"], chatcomplete_model, batch_filter=True)
+
+    assert chatbot.ask_data(["q0"]) == "q0 aq0 b"
+    assert chatcomplete_model.calls == [("batch", "q0", None)]
+
+
+def test_malformed_batch_answer_falls_back_to_one_call_per_passage():
+    passages = [["q0 a", "other", "q0 b"]]
+    chatcomplete_model = FakeChatComplete(batch_answer="Los fragmentos 1 y 3")
+    chatbot = make_chatbot(passages, ["q0"], chatcomplete_model, batch_filter=True)
+
+    assert chatbot.ask_data(["q0"]) == "q0 aq0 b"
+    assert [kind for kind, _, _ in chatcomplete_model.calls] == ["batch", "single", "single", "single"]
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_batch_search_judges_a_shared_passage_once(concurrent):
+    queries = ["q0", "q1", "q2"]
+    passages = [["q0 a", "other"], ["q0 a", "q1 b"], ["other", "q0 a"]]
+    # The query that first judges the shared passages finishes last
+    chatcomplete_model = FakeChatComplete(delays={"q0": 0.1})
+    chatbot = make_chatbot(passages, queries, chatcomplete_model, batch_search=True, concurrent=concurrent)
+
+    answer = chatbot.ask_data(queries)
+
+    # The verdict is reused, the passage is kept for every query that found it
+    assert answer == "q0 a\n\nq0 aq1 b\n\nq0 a"
+    contexts = [context for _, _, context in chatcomplete_model.calls]
+    assert sorted(contexts) == ["other", "q0 a", "q1 b"]
+
+
+def test_queries_without_relevant_data_are_left_out_of_the_answer():
+    queries = ["q0", "q1", "q2"]
+    passages = [["q0 a"], ["other"], ["q2 a"]]
+    chatbot = make_chatbot(passages, queries, FakeChatComplete(), batch_search=True)
+
+    assert chatbot.ask_data(queries) == "q0 a\n\nq2 a"
+
+
+def test_batch_search_skips_the_embedding_of_confident_lexical_queries():
+    documents = [{"id": f"filler_{i}", "content": f"The storm passed over the plains on day {i}."} for i in range(200)]
+    documents.append({"id": "szeth", "content": "Szeth Truthless of Shinovar wore white on the day of the kill"})
+    queries = ["Szeth Truthless of Shinovar", "q1"]
+    chatbot = make_chatbot(
+        [[], ["q1 a"]], queries, FakeChatComplete(), batch_search=True, lexical_index=BM25Index.build(documents)
+    )
+
+    answer = chatbot.ask_data(queries)
+
+    assert answer == "Szeth Truthless of Shinovar wore white on the day of the kill\n\nq1 a"
+    assert chatbot.embedding_model.texts == ["q1"]
+
+
+class CountingIndex:
+    """Wraps a BM25Index and records the searched queries"""
+
+    def __init__(self, lexical_index):
+        self.lexical_index = lexical_index
+        self.queries = []
+
+    def search(self, search_query, top=5):
+        self.queries.append(search_query)
+        return self.lexical_index.search(search_query, top=top)
+
+    def get_result(self, doc_idx, score):
+        return self.lexical_index.get_result(doc_idx, score)
+
+
+@pytest.mark.parametrize("batch_search", [False, True])
+def test_cache_misses_reuse_the_embedding_and_the_lexical_search(batch_search):
+    documents = [{"id": f"filler_{i}", "content": f"The storm passed over the plains on day {i}."} for i in range(200)]
+    lexical_index = CountingIndex(BM25Index.build(documents))
+    queries = ["q0", "q1"]
+    chatbot = make_chatbot(
+        [["q0 a"], ["q1 a"]],
+        queries,
+        FakeChatComplete(),
+        batch_search=batch_search,
+        lexical_index=lexical_index,
+        answer_cache=SemanticAnswerCache(),
+    )
+
+    assert chatbot.ask_data(queries) == "q0 a\n\nq1 a"
+    assert chatbot.embedding_model.texts == queries
+    assert lexical_index.queries == queries
+
+
+class FakeContextWindow:
+    """Local stand-in for the ContextWindow, keeps the last two messages"""
+
+    def fit(self, messages, reserved_messages=None):
+        self.last_usage = {"prompt_tokens": 42, "dropped_messages": len(messages) - 2}
+        return messages[-2:]
+
+
+def test_history_usage_is_recorded_on_the_current_span(monkeypatch):
+    exporter = ListExporter()
+    monkeypatch.setattr(chatbot_module, "tracer", Tracer(enabled=True, exporters=[exporter]))
+    chatbot = ChatBot(None, None, None, None, context_window=FakeContextWindow())
+    messages = [{"role": "user", "content": f"m{i}"} for i in range(5)]
+
+    with chatbot_module.tracer.span("chat.turn"):
+        assert chatbot._history(messages, []) == messages[-2:]
+
+    assert exporter.spans[0]["attributes"] == {"prompt_tokens": 42, "dropped_messages": 3}
+
+
+def test_cancelled_turns_stop_before_the_next_model_call():
+    cancelled = threading.Event()
+    passages = [[f"other {i}" for i in range(10)]]
+    chatcomplete_model = FakeChatComplete()
+    chatbot = make_chatbot(passages, ["q0"], chatcomplete_model)
+
+    # The client leaves while the first passage is judged
+    predict = chatcomplete_model.predict
+    chatcomplete_model.predict = lambda messages, **kwargs: (cancelled.set(), predict(messages, **kwargs))[1]
+
+    with pytest.raises(Exception):
+        chatbot.ask_data(["q0"], cancelled=cancelled)
+    assert len(chatcomplete_model.calls) == 1
+
+    # Nothing is answered nor added to the history
+    generated_messages = []
+    assert list(chatbot.chat_stream([{"role": "user", "content": "q0"}], generated_messages, cancelled)) == []
+    assert generated_messages == []
+    assert len(chatcomplete_model.calls) == 1
@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from models.chatcomplete_model import AzureAIChatComplete
+
+DELTAS = ["¿Quién ", "es Kaladin? ", "Él es un ", "Corredor del Viento ", "⚡"]
+
+
+class EventStreamHandler(BaseHTTPRequestHandler):
+    """Streams the deltas as server-sent events without charset, splitting multi-byte characters between writes"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        events = [{"choices": [{"delta": {"content": delta}}]} for delta in DELTAS]
+        body = "".join(f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events) + "data: [DONE]\n\n"
+        data = body.encode("utf-8")
+        for start in range(0, len(data), 7):
+            self.wfile.write(data[start : start + 7])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_stream_decodes_utf8_deltas():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EventStreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        model = AzureAIChatComplete(endpoint=f"http://127.0.0.1:{server.server_port}", token="token", model_name="gpt")
+        deltas = list(model.predict([{"role": "user", "content": "¿Quién es Kaladin?"}], stream=True))
+    finally:
+        server.shutdown()
+
+    assert deltas == DELTAS
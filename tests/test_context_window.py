@@ -0,0 +1,68 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+
+from context_window import ContextWindow
+
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+class WordCounter:
+    """Local stand-in for the TokenCounter, one token per word"""
+
+    encoding = WordEncoding()
+
+    def num_tokens_from_string(self, text):
+        return len(text.split(" "))
+
+
+def message(role, n_words, tag=""):
+    return {"role": role, "content": " ".join(f"{tag}w{i}" for i in range(n_words))}
+
+
+def test_tool_outputs_are_compacted_then_old_messages_dropped():
+    window = ContextWindow(WordCounter(), max_tokens=100, compacted_tool_tokens=10, message_overhead=0)
+    history = [
+        message("user", 30, "a"),
+        message("tool", 60, "b"),
+        message("assistant", 30, "c"),
+        message("user", 20, "d"),
+    ]
+
+    # Compacting the tool output (to 10 words plus the mark) is enough
+    fitted = window.fit(history, reserved_messages=[message("system", 9)])
+
+    assert [m["role"] for m in fitted] == ["user", "tool", "assistant", "user"]
+    assert fitted[1]["content"].endswith("[...]")
+    assert window.last_usage["prompt_tokens"] == 9 + 30 + 11 + 30 + 20
+
+    # Then the tool output is dropped, and then the oldest messages
+    fitted = window.fit(history, reserved_messages=[message("system", 40)])
+
+    assert [m["role"] for m in fitted] == ["assistant", "user"]
+    assert window.last_usage["prompt_tokens"] == 40 + 30 + 20
+    assert window.last_usage["compacted_messages"] == 1
+    assert window.last_usage["dropped_messages"] == 2
+
+
+def test_caches_are_shared_by_concurrent_sessions():
+    window = ContextWindow(WordCounter(), max_tokens=200, compacted_tool_tokens=5, max_cached_messages=8)
+
+    def session(i):
+        history = [message(["user", "tool", "assistant"][j % 3], 20 + j % 7, f"s{i % 5}_{j}") for j in range(30)]
+        return window.fit(history)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(session, range(400)))
+
+    assert all(len(fitted) > 0 for fitted in results)
+    assert len(window.token_cache) <= 8
+    assert len(window.compacted_cache) <= 8
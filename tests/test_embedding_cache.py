@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from models.embedding_cache import EmbeddingCache
+from models.embedding_model import AzureAIEmbedding
+from models.single_flight import SingleFlight
+
+
+class FakeEmbedding(AzureAIEmbedding):
+    """Embedding model answering locally, the vector of a text is its length"""
+
+    def __init__(self, cache):
+        super().__init__(model_name="fake", cache=cache, single_flight=SingleFlight())
+        self.requests = []
+
+    def raw_predict(self, input_data, **kwargs):
+        self.requests.append(list(input_data))
+        return np.asarray([[len(text), 1.0] for text in input_data])
+
+
+def vector(value):
+    return np.asarray([value, 1.0], dtype=np.float32)
+
+
+def test_hits_and_misses_are_merged_in_input_order():
+    model = FakeEmbedding(EmbeddingCache())
+    model.predict(["bb", "dddd"])
+
+    embeddings = model.predict(["a", "bb", "ccc", "dddd", "a"])
+
+    # Only the misses are sent, once per distinct text
+    assert model.requests == [["bb", "dddd"], ["a", "ccc"]]
+    assert embeddings[:, 0].tolist() == [1, 2, 3, 4, 1]
+
+
+def test_memory_keeps_the_least_recently_used_out():
+    cache = EmbeddingCache(max_memory_items=2)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [vector(3)])
+
+    assert list(cache.memory) == ["a", "c"]
+    assert cache.get_many(["b"]) == [None]
+
+
+def test_embeddings_persist_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+
+    # A new instance reads them from disk, and keeps them in memory afterwards
+    cache = EmbeddingCache(path)
+    hits = cache.get_many(["b", "missing", "a"])
+
+    assert hits[0].tolist() == [2.0, 1.0]
+    assert hits[1] is None
+    assert hits[2].tolist() == [1.0, 1.0]
+    assert set(cache.memory) == {"a", "b"}
+
+
+def test_disk_keeps_the_least_recently_used_out(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_memory_items=1, max_disk_items=2)
+    cache.put_many(["a"], [vector(1)])
+    time.sleep(0.01)
+    cache.put_many(["b"], [vector(2)])
+    time.sleep(0.01)
+    # Reading "a" from disk makes "b" the least recently used
+    cache.get_many(["a"])
+    time.sleep(0.01)
+    cache.put_many(["c"], [vector(3)])
+
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    assert [hit is not None for hit in cache.get_many(["a", "b", "c"])] == [True, False, True]
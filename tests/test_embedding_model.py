@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from models.embedding_model import AzureAIEmbedding
+from models.single_flight import SingleFlight
+
+
+class WordCounter:
+    """Local stand-in for the TokenCounter, one token per word"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def num_tokens_from_string(self, text):
+        self.calls += 1
+        return len(text.split(" "))
+
+
+class FakeEmbedding(AzureAIEmbedding):
+    """Embedding model answering locally, records the batches sent"""
+
+    def __init__(self, **kwargs):
+        super().__init__(model_name="fake", single_flight=SingleFlight(), **kwargs)
+        self.requests = []
+
+    def raw_predict(self, input_data, **kwargs):
+        self.requests.append(list(input_data))
+        return np.asarray([[len(text), 1.0] for text in input_data])
+
+
+def words(n):
+    return " ".join(["w"] * n)
+
+
+def test_batches_are_packed_by_tokens():
+    model = FakeEmbedding(max_batch_tokens=10, max_batch_size=3, token_counter=WordCounter())
+
+    # 4 + 6 fill the budget, 1 does not fit, then the batch size closes the next batch
+    texts = [words(4), words(6), words(1), words(1), words(1), words(1)]
+
+    assert model.make_batches(texts) == [(0, 2), (2, 5), (5, 6)]
+
+
+def test_text_over_the_budget_goes_alone():
+    model = FakeEmbedding(max_batch_tokens=10, token_counter=WordCounter())
+
+    texts = [words(3), words(25), words(3), words(3)]
+
+    assert model.make_batches(texts) == [(0, 1), (1, 2), (2, 4)]
+
+
+def test_precomputed_token_counts_are_not_counted_again():
+    counter = WordCounter()
+    model = FakeEmbedding(max_batch_tokens=10, token_counter=counter)
+    texts = ["a", "b", "c", "d"]
+
+    embeddings = model.predict(texts, token_counts=[6, 4, 9, 1])
+
+    assert counter.calls == 0
+    assert model.requests == [["a", "b"], ["c", "d"]]
+    assert embeddings.shape == (4, 2)
+
+
+def test_batches_by_size_without_token_budget():
+    model = FakeEmbedding(max_batch_size=2)
+
+    assert model.make_batches(["a", "b", "c", "d", "e"]) == [(0, 2), (2, 4), (4, 5)]
@@ -0,0 +1,140 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from models.image_jobs import ImageJobQueue
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+class FakeImageGen:
+    """Local stand-in for the image generation model"""
+
+    model_name = "fake-model"
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def predict_bytes(self, prompt, **kwargs):
+        self.release.wait()
+        self.calls.append((prompt, kwargs.get("style_preset")))
+        if self.fail:
+            raise Exception("Service unavailable")
+        return PNG
+
+
+def test_image_is_written_as_returned(tmp_path):
+    jobs = ImageJobQueue(FakeImageGen(), str(tmp_path))
+
+    job_id = jobs.submit("a knight", "anime")
+    job = jobs.wait(job_id, timeout=5)
+    jobs.close()
+
+    assert job["status"] == ImageJobQueue.DONE
+    assert job["path"] == os.path.join(str(tmp_path), f"{job_id}.png")
+    with open(job["path"], "rb") as f:
+        assert f.read() == PNG
+
+
+def test_repeated_requests_are_served_from_the_cache(tmp_path):
+    model = FakeImageGen()
+    jobs = ImageJobQueue(model, str(tmp_path))
+    job_id = jobs.submit("a knight", "anime")
+    jobs.wait(job_id, timeout=5)
+    jobs.close()
+
+    # A new queue finds the stored image without calling the model
+    jobs = ImageJobQueue(model, str(tmp_path))
+    assert jobs.submit("a knight", "anime") == job_id
+    assert jobs.status(job_id)["status"] == ImageJobQueue.DONE
+    assert jobs.submit("a knight", "comic-book") != job_id
+    jobs.close()
+
+    assert model.calls == [("a knight", "anime"), ("a knight", "comic-book")]
+
+
+def test_status_of_images_generated_before_a_restart(tmp_path):
+    jobs = ImageJobQueue(FakeImageGen(), str(tmp_path))
+    job_id = jobs.submit("a knight", "anime")
+    jobs.wait(job_id, timeout=5)
+    jobs.close()
+
+    jobs = ImageJobQueue(FakeImageGen(), str(tmp_path))
+    path = os.path.join(str(tmp_path), f"{job_id}.png")
+    assert jobs.status(job_id) == {"status": ImageJobQueue.DONE, "path": path, "error": None}
+    assert jobs.status("0" * 64) is None
+    assert jobs.status("../" + job_id) is None
+    jobs.close()
+
+
+def test_in_progress_requests_are_not_duplicated(tmp_path):
+    model = FakeImageGen()
+    model.release.clear()
+    jobs = ImageJobQueue(model, str(tmp_path), n_workers=2)
+
+    job_ids = [jobs.submit("a knight") for _ in range(3)]
+    model.release.set()
+    jobs.close()
+
+    assert len(set(job_ids)) == 1
+    assert len(model.calls) == 1
+
+
+def test_full_queue_rejects_new_jobs(tmp_path):
+    model = FakeImageGen()
+    model.release.clear()
+    jobs = ImageJobQueue(model, str(tmp_path), n_workers=1, max_queue_size=1)
+
+    # The worker takes the first job and the queue holds the second one
+    first = jobs.submit("first")
+    while jobs.status(first)["status"] != ImageJobQueue.RUNNING:
+        time.sleep(0.001)
+    jobs.submit("second")
+    with pytest.raises(Exception):
+        jobs.submit("third")
+
+    model.release.set()
+    jobs.close()
+
+
+def test_failed_jobs_report_the_error(tmp_path):
+    jobs = ImageJobQueue(FakeImageGen(fail=True), str(tmp_path))
+
+    job = jobs.wait(jobs.submit("a knight"), timeout=5)
+    jobs.close()
+
+    assert job["status"] == ImageJobQueue.FAILED
+    assert job["error"] == "Service unavailable"
+
+
+def test_close_cancels_the_queued_jobs_without_waiting_for_the_running_one(tmp_path):
+    model = FakeImageGen()
+    model.release.clear()
+    jobs = ImageJobQueue(model, str(tmp_path), n_workers=1)
+
+    running = jobs.submit("running")
+    while jobs.status(running)["status"] != ImageJobQueue.RUNNING:
+        time.sleep(0.001)
+    queued = [jobs.submit(f"queued {i}") for i in range(3)]
+
+    start = time.monotonic()
+    jobs.close(cancel_pending=True, timeout=0.1)
+
+    assert time.monotonic() - start < 1
+    assert all(jobs.wait(job_id, timeout=0)["status"] == ImageJobQueue.FAILED for job_id in queued)
+    assert jobs.status(running)["status"] == ImageJobQueue.RUNNING
+
+    # The running job still finishes, and nothing else is generated
+    model.release.set()
+    assert jobs.wait(running, timeout=5)["status"] == ImageJobQueue.DONE
+    jobs.workers[0].join(5)
+    assert model.calls == [("running", None)]
@@ -0,0 +1,111 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+from book_indexer import BookIndexer
+from index_manifest import IndexManifest
+from near_duplicates import NearDuplicateDetector
+
+EPIGRAPH = "Life before death, strength before weakness, journey before destination. These are the words."
+
+
+class ParagraphChunker:
+    """Local stand-in for the chunker, one chunk per paragraph"""
+
+    def split_paragraphs(self, paragraphs):
+        return [{"content": p.text, "tokens": len(p.text.split()), "start": p.start, "end": p.end} for p in paragraphs]
+
+
+def write(path, paragraphs, mtime=None):
+    with open(path, "w") as f:
+        f.write("\n".join(paragraphs))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def run(books_path, manifest_path, near_duplicates=None):
+    """Runs an incremental indexing, returns the indexed records, the stale ids and the delta"""
+    manifest = IndexManifest(manifest_path)
+    indexer = BookIndexer(books_path, ParagraphChunker(), None, near_duplicates=near_duplicates)
+    delta = indexer.load_changed_data(manifest)
+    records = list(indexer.iter_chunk_records())
+    stale_ids = manifest.stale_chunk_ids(delta, indexer.files_mapping)
+    manifest.commit(delta)
+    return records, stale_ids, delta
+
+
+def test_only_new_and_changed_books_are_indexed(tmp_path):
+    books_path = str(tmp_path / "books")
+    manifest_path = str(tmp_path / "manifest.json")
+    os.makedirs(books_path)
+    write(os.path.join(books_path, "a.txt"), ["Kaladin", "Syl", "Bridge four"], mtime=1000)
+    write(os.path.join(books_path, "b.txt"), ["Vin", "Elend"], mtime=1000)
+    write(os.path.join(books_path, "c.txt"), ["Hoid"], mtime=1000)
+
+    records, stale_ids, _ = run(books_path, manifest_path)
+    assert len(records) == 6 and stale_ids == []
+
+    # Nothing changed, and a touched but identical file is not indexed again
+    os.utime(os.path.join(books_path, "c.txt"), (2000, 2000))
+    records, stale_ids, delta = run(books_path, manifest_path)
+    assert records == [] and stale_ids == []
+    assert len(delta["unchanged"]) == 3
+
+    # a.txt loses a paragraph, b.txt is deleted and d.txt is added
+    write(os.path.join(books_path, "a.txt"), ["Kaladin", "Syl and Kaladin"], mtime=3000)
+    os.remove(os.path.join(books_path, "b.txt"))
+    write(os.path.join(books_path, "d.txt"), ["Shallan"], mtime=3000)
+    records, stale_ids, delta = run(books_path, manifest_path)
+
+    assert sorted(record["id"] for record in records) == ["atxt_0", "atxt_1", "dtxt_0"]
+    assert stale_ids == ["atxt_2", "btxt_0", "btxt_1"]
+    assert [os.path.basename(path) for path in delta["deleted"]] == ["b.txt"]
+    assert IndexManifest(manifest_path).files[os.path.join(books_path, "a.txt")]["chunk_ids"] == ["atxt_0", "atxt_1"]
+
+
+def test_duplicates_are_collapsed_and_reindexed_with_their_original(tmp_path):
+    books_path = str(tmp_path / "books")
+    manifest_path = str(tmp_path / "manifest.json")
+    os.makedirs(books_path)
+    write(os.path.join(books_path, "a.txt"), [EPIGRAPH, "Kaladin"], mtime=1000)
+    write(os.path.join(books_path, "b.txt"), [EPIGRAPH + " ", "Dalinar"], mtime=1000)
+
+    near_duplicates = NearDuplicateDetector()
+    records, _, _ = run(books_path, manifest_path, near_duplicates)
+
+    assert [record["id"] for record in records] == ["atxt_0", "atxt_1", "btxt_1"]
+    assert near_duplicates.report()["embeddings_saved"] == 1
+
+    # The original is gone, so the book holding the duplicate is indexed again
+    write(os.path.join(books_path, "a.txt"), ["Kaladin"], mtime=2000)
+    records, stale_ids, delta = run(books_path, manifest_path, NearDuplicateDetector())
+
+    assert len(delta["changed"]) == 2
+    assert sorted(record["id"] for record in records) == ["atxt_0", "btxt_0", "btxt_1"]
+    assert stale_ids == ["atxt_1"]
+
+
+def test_new_books_are_checked_against_the_unchanged_ones(tmp_path):
+    books_path = str(tmp_path / "books")
+    os.makedirs(books_path)
+    write(os.path.join(books_path, "a.txt"), [EPIGRAPH, "Kaladin"], mtime=1000)
+    manifest_path = str(tmp_path / "manifest.json")
+    first_records, _, _ = run(books_path, manifest_path, NearDuplicateDetector())
+
+    # A later run with a new book, whose detector has never seen a.txt
+    write(os.path.join(books_path, "b.txt"), [EPIGRAPH + " ", "Dalinar"], mtime=2000)
+    near_duplicates = NearDuplicateDetector()
+    records, _, delta = run(books_path, manifest_path, near_duplicates)
+
+    assert [os.path.basename(fmap["path_file"]) for fmap in delta["unchanged"]] == ["a.txt"]
+    assert [record["id"] for record in records] == ["btxt_1"]
+    assert near_duplicates.report()["embeddings_saved"] == 1
+    manifest = IndexManifest(manifest_path)
+    assert manifest.files[os.path.join(books_path, "b.txt")]["depends_on"] == [os.path.join(books_path, "a.txt")]
+    assert list(manifest.files[os.path.join(books_path, "a.txt")]["signatures"]) == ["atxt_0", "atxt_1"]
+
+    # The same chunks as a full run
+    full_records, _, _ = run(books_path, str(tmp_path / "full_manifest.json"), NearDuplicateDetector())
+    assert first_records + records == full_records
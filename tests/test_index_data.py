@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import pytest
+
+from index_data import IndexDataWriter, IndexDataReader
+
+
+def documents(n, start=0):
+    return [{"id": f"doc_{i}", "content": f"chunk {i}", "vector": [float(i), 1.0]} for i in range(start, start + n)]
+
+
+def test_written_data_is_read_back(tmp_path):
+    with IndexDataWriter(str(tmp_path)) as writer:
+        writer.write(documents(3))
+        writer.write(documents(2, start=3))
+
+    reader = IndexDataReader(str(tmp_path))
+    assert len(reader) == 5
+    assert [doc["id"] for doc in reader.read_documents(vectors=False)] == [f"doc_{i}" for i in range(5)]
+    assert reader.read_vectors(3, 5).tolist() == [[3.0, 1.0], [4.0, 1.0]]
+
+
+def test_failed_run_leaves_no_manifest(tmp_path):
+    with IndexDataWriter(str(tmp_path)) as writer:
+        writer.write(documents(3))
+
+    # A failed run overwrites the data files, so the manifest of the previous run must not survive either
+    with pytest.raises(RuntimeError):
+        with IndexDataWriter(str(tmp_path)) as writer:
+            writer.write(documents(1))
+            raise RuntimeError("embedding failed")
+
+    assert writer.vectors_file.closed
+    with pytest.raises(FileNotFoundError):
+        IndexDataReader(str(tmp_path))
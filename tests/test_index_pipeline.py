@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import numpy as np
+import pytest
+
+from index_pipeline import IndexPipeline
+
+
+class FakeEmbedding:
+    """Local stand-in for the embedding model, fails on a given call"""
+
+    def __init__(self, fail_on_call=None):
+        self.fail_on_call = fail_on_call
+        self.n_calls = 0
+
+    def predict(self, texts, **kwargs):
+        self.n_calls += 1
+        if self.n_calls == self.fail_on_call:
+            raise ConnectionError("Embedding service unavailable")
+        return np.asarray([[float(text.split("_")[1]), 1.0] for text in texts])
+
+
+class FakeBookIndexer:
+    """Local stand-in for the BookIndexer, counts the records it produced"""
+
+    def __init__(self, n_records, embedding_model):
+        self.n_records = n_records
+        self.embedding_model = embedding_model
+        self.files_mapping = [{"path_file": "book.txt"}]
+        self.produced = 0
+
+    def iter_chunk_records(self):
+        for i in range(self.n_records):
+            self.produced += 1
+            yield {"id": f"chunk_{i}", "content": f"content_{i}", "tokens": 1}
+
+
+def test_documents_are_uploaded_in_order():
+    book_indexer = FakeBookIndexer(25, FakeEmbedding())
+    uploads = []
+
+    n_documents = IndexPipeline(book_indexer, uploads.append, embed_batch_size=4, upload_batch_size=10).run()
+
+    assert n_documents == 25
+    assert [len(batch) for batch in uploads] == [10, 10, 5]
+    documents = [doc for batch in uploads for doc in batch]
+    assert [doc["id"] for doc in documents] == [f"chunk_{i}" for i in range(25)]
+    assert all(doc["vector"] == [float(i), 1.0] for i, doc in enumerate(documents))
+    # The token counts are only used to embed
+    assert all("tokens" not in doc for doc in documents)
+
+
+def test_slow_uploads_hold_back_the_chunking():
+    book_indexer = FakeBookIndexer(200, FakeEmbedding())
+    release = threading.Event()
+    produced_while_blocked = []
+
+    def upload(documents):
+        if not release.is_set():
+            time.sleep(0.2)
+            produced_while_blocked.append(book_indexer.produced)
+            release.set()
+
+    IndexPipeline(book_indexer, upload, embed_batch_size=2, upload_batch_size=2, queue_size=1).run()
+
+    # Only a few batches fit in the bounded queues and the stages while the first upload waits
+    assert produced_while_blocked[0] <= 12
+    assert book_indexer.produced == 200
+
+
+def test_errors_stop_the_pipeline_and_are_raised():
+    book_indexer = FakeBookIndexer(1000, FakeEmbedding(fail_on_call=3))
+    uploads = []
+
+    with pytest.raises(ConnectionError):
+        IndexPipeline(book_indexer, uploads.append, embed_batch_size=10, upload_batch_size=10, queue_size=1).run()
+
+    assert sum(len(batch) for batch in uploads) <= 20
+    assert book_indexer.produced < 1000
@@ -0,0 +1,37 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import numpy as np
+
+from local_search import LocalSearchClient
+
+
+def make_index(tmp_path, n_docs=20, dim=8, block_size=65536):
+    rng = np.random.default_rng(0)
+    documents = [{"id": f"doc_{i}", "vector": rng.normal(size=dim).tolist()} for i in range(n_docs)]
+    LocalSearchClient.create(str(tmp_path), documents)
+    return LocalSearchClient(str(tmp_path), block_size=block_size), np.asarray([d["vector"] for d in documents])
+
+
+def test_blocks_smaller_than_top(tmp_path):
+    client, vectors = make_index(tmp_path, block_size=2)
+    exact, _ = make_index(tmp_path)
+    queries = vectors[:3] + 0.1
+
+    hits = client.search_vectors(queries, top=5)
+
+    assert [[idx for idx, _ in query_hits] for query_hits in hits] == [
+        [idx for idx, _ in query_hits] for query_hits in exact.search_vectors(queries, top=5)
+    ]
+    assert all(len(query_hits) == 5 for query_hits in hits)
+
+
+def test_top_larger_than_the_index(tmp_path):
+    client, vectors = make_index(tmp_path, n_docs=3, block_size=2)
+
+    hits = client.search_vectors(vectors[:1], top=10)
+
+    assert len(hits[0]) == 3
+    assert hits[0][0][0] == 0
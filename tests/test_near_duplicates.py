@@ -0,0 +1,63 @@
+import os
+import sys
+import random
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import pytest
+
+from near_duplicates import NearDuplicateDetector
+
+
+def random_text(rng, n_words=200):
+    return " ".join(f"word{rng.randint(0, 5000)}" for _ in range(n_words))
+
+
+def test_near_duplicates_are_found():
+    rng = random.Random(0)
+    text = random_text(rng)
+    words = text.split()
+    # Another edition: a couple of words changed
+    edition = " ".join(words[:50] + ["Roshar"] + words[51:150] + ["Scadrial"] + words[151:])
+
+    detector = NearDuplicateDetector(threshold=0.8)
+
+    assert detector.add("a_0", text, "a.txt", tokens=200) is None
+    original = detector.add("b_0", edition, "b.txt", tokens=200)
+
+    assert original["key"] == "a_0"
+    assert original["source"] == "a.txt"
+    assert original["similarity"] >= 0.8
+
+
+def test_different_and_overlapping_chunks_are_kept():
+    rng = random.Random(1)
+    texts = [random_text(rng) for _ in range(50)]
+    # Consecutive chunks sharing their last paragraphs are not duplicates
+    overlapping = " ".join(texts[0].split()[-30:] + texts[1].split()[:170])
+
+    detector = NearDuplicateDetector()
+
+    assert all(detector.add(f"doc_{i}", text) is None for i, text in enumerate(texts))
+    assert detector.add("overlap", overlapping) is None
+    assert detector.report()["duplicates"] == 0
+
+
+def test_report_of_savings():
+    detector = NearDuplicateDetector(collapse=False)
+    epigraph = "Life before death, strength before weakness, journey before destination."
+
+    for i in range(4):
+        detector.add(f"doc_{i}", epigraph, tokens=12)
+
+    report = detector.report(vector_bytes=4096)
+    assert report["chunks"] == 4
+    assert report["duplicates"] == 3
+    assert report["collapsed"] is False
+    assert report["tokens_saved"] == 36
+    assert report["index_bytes_saved"] == 3 * (len(epigraph) + 4096)
+
+
+def test_bands_must_divide_the_permutations():
+    with pytest.raises(ValueError):
+        NearDuplicateDetector(num_perm=100, bands=16)
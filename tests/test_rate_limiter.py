@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from models.rate_limiter import RateLimiter, parse_retry_after
+from models.http_transport import HTTPTransport
+from models.telemetry import tracer
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Answers 429 with a short Retry-After to the first requests, then 200"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.n_requests += 1
+        if self.server.n_requests <= self.server.n_throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", "0.1")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(n_throttled):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    server.n_requests = 0
+    server.n_throttled = n_throttled
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after-ms": "250", "retry-after": "3"}) == 0.25
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"retry-after": "soon"}) is None
+
+    date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < parse_retry_after({"retry-after": date}) <= 30
+
+
+def test_requests_per_second_are_limited():
+    limiter = RateLimiter(requests_per_second=20)
+
+    start = time.perf_counter()
+    for _ in range(30):
+        limiter.release(limiter.acquire())
+    elapsed = time.perf_counter() - start
+
+    # A burst of 20, then 10 more at 20 per second
+    assert 0.4 < elapsed < 1.0
+
+
+def test_tokens_per_minute_are_limited():
+    limiter = RateLimiter(tokens_per_minute=600)
+
+    start = time.perf_counter()
+    limiter.release(limiter.acquire(n_tokens=600))
+    limiter.release(limiter.acquire(n_tokens=3))
+    elapsed = time.perf_counter() - start
+
+    assert 0.25 < elapsed < 1.0
+
+
+def test_concurrency_adapts_to_throttling():
+    limiter = RateLimiter(max_concurrency=8)
+    first, second = limiter.acquire(), limiter.acquire()
+
+    # Both were sent before the first decrease, only one halves the concurrency
+    limiter.release(first, throttled=True)
+    limiter.release(second, throttled=True)
+    assert limiter.stats() == {"concurrency": 4, "in_flight": 0, "throttled": 2}
+
+    for _ in range(8):
+        limiter.release(limiter.acquire())
+    assert limiter.stats()["concurrency"] == 5
+
+
+def test_retry_after_pauses_the_endpoint():
+    limiter = RateLimiter()
+    limiter.release(limiter.acquire(), throttled=True, retry_after=0.2)
+
+    start = time.perf_counter()
+    limiter.release(limiter.acquire())
+
+    assert time.perf_counter() - start >= 0.19
+
+
+def test_transport_retries_throttled_requests():
+    server = start_server(n_throttled=2)
+    transport = HTTPTransport()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/embeddings"
+
+    tracer.enable()
+    try:
+        with tracer.span("embedding.request") as span:
+            response = transport.post(url, rate_limit={"base_delay": 0.01}, json={"input": ["hola"]})
+    finally:
+        tracer.disable()
+        transport.close()
+        server.shutdown()
+
+    assert response.status_code == 200
+    assert server.n_requests == 3
+    assert span.attributes["retries"] == 2
+    assert transport.get_rate_limiter(url).stats()["throttled"] == 2
+
+
+def test_transport_gives_up_after_max_retries():
+    server = start_server(n_throttled=10)
+    transport = HTTPTransport()
+    url = f"http://127.0.0.1:{server.server_address[1]}/chat/completions"
+
+    try:
+        response = transport.post(url, rate_limit={"max_retries": 1}, json={})
+    finally:
+        transport.close()
+        server.shutdown()
+
+    assert response.status_code == 429
+    assert server.n_requests == 2
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+
+import pytest
+
+from router import KeywordRouter
+
+
+def route(*contents):
+    roles = ["user", "assistant"]
+    messages = [{"role": roles[i % 2], "content": content} for i, content in enumerate(contents)]
+    return KeywordRouter().route(messages)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "¿Quién es Kaladin?",
+        "¿Quién es Kaladin y qué relación tiene con Syl?",
+        "What happened to Kelsier in Luthadel?",
+    ],
+)
+def test_clear_questions_are_routed_to_ask_data(text):
+    decision = route(text)
+
+    assert decision["routed"]
+    assert decision["function_name"] == "ask_data"
+    assert decision["parameters"] == {"search_queries": [text]}
+
+
+def test_explicit_english_image_requests_are_routed():
+    decision = route("Generate an image of Kaladin on the Shattered Plains, anime")
+
+    assert decision["routed"]
+    assert decision["function_name"] == "create_image"
+    assert decision["parameters"]["style_preset"] == "anime"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # Keywords without a question
+        "Kaladin y Syl",
+        # Image requests without an image noun
+        "¿Puedes dibujar a Kaladin?",
+        "Can you draw Kaladin with the spear?",
+        "Dibújame a Syl",
+        # Names that are also common words
+        "Hola, ¿cómo estás? Me encanta el rock",
+        "What is honor?",
+        # References to something said before
+        "¿Y qué opina Kaladin de eso con Syl?",
+        "What did Kaladin tell her about Syl?",
+    ],
+)
+def test_ambiguous_turns_are_left_to_the_llm(text):
+    decision = route(text)
+
+    assert not decision["routed"]
+    assert decision["confidence"] < 0.9
+
+
+def test_follow_ups_with_explicit_keywords_are_routed():
+    first = "¿Quién es Kaladin y qué relación tiene con Syl?"
+
+    decision = route(first, "Kaladin es un Corredor del Viento...", "¿Y qué opina Kaladin de Dalinar?")
+
+    assert decision["routed"]
+    assert decision["parameters"] == {"search_queries": ["¿Y qué opina Kaladin de Dalinar?"]}
+
+
+def test_follow_ups_with_pronouns_are_left_to_the_llm():
+    first = "¿Quién es Kaladin y qué relación tiene con Syl?"
+
+    decision = route(first, "Kaladin es un Corredor del Viento...", "¿Y qué opina él de Dalinar?")
+
+    assert decision["function_name"] == "ask_data"
+    assert not decision["routed"]
+    assert "context=él" in decision["reason"]
+
+
+def test_decisions_are_only_written_to_the_log(tmp_path, capsys):
+    log_path = str(tmp_path / "routing_log.jsonl")
+    router = KeywordRouter(log_path=log_path)
+
+    router.route([{"role": "user", "content": "¿Quién es Kaladin y qué relación tiene con Syl?"}])
+    KeywordRouter().route([{"role": "user", "content": "Hola"}])
+
+    with open(log_path, "r") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    assert records[0]["routed"] is True
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+from lexical_index import BM25Index
+from search_utils import search_lexical
+
+
+def make_index():
+    documents = [{"id": f"filler_{i}", "content": f"The storm passed over the plains on day {i}."} for i in range(200)]
+    documents += [
+        {"id": "szeth", "content": "Szeth-son-son-Vallano, Truthless of Shinovar, wore white on the day of the kill"},
+        {"id": "szeth_2", "content": "The assassin in white crossed the storm."},
+        {"id": "kaladin", "content": "Kaladin carried the bridge with the other men of Bridge Four."},
+    ]
+    return BM25Index.build(documents)
+
+
+def test_strong_distinctive_match_is_confident():
+    lexical = search_lexical(make_index(), "Szeth Truthless of Shinovar")
+
+    assert lexical["results"][0]["id"] == "szeth"
+    assert lexical["confident"]
+
+
+def test_single_weak_hit_is_not_confident():
+    # Only one chunk matches, but a single word says little about the answer
+    lexical = search_lexical(make_index(), "men")
+    assert len(lexical["results"]) == 1
+    assert not lexical["confident"]
+
+
+def test_single_strong_hit_is_confident():
+    lexical = search_lexical(make_index(), "Truthless Shinovar", min_lexical_score=5.0)
+
+    assert [result["id"] for result in lexical["results"]] == ["szeth"]
+    assert lexical["confident"]
+
+
+def test_weak_top_score_is_not_confident_even_if_it_stands_out():
+    lexical = search_lexical(make_index(), "Szeth Truthless of Shinovar", min_lexical_score=1000.0)
+    assert not lexical["confident"]
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "chat"))
+
+from server import ChatServer
+from models.image_jobs import ImageJobQueue
+
+
+class FakeChatBot:
+    """Local stand-in for the chatbot, answers with the number of user messages in word deltas"""
+
+    def __init__(self, delay=0.0, n_deltas=3, n_tool_calls=0):
+        self.delay = delay
+        self.n_deltas = n_deltas
+        self.n_tool_calls = n_tool_calls
+        self.tool_calls = 0
+        self.histories = []
+        self.closed = 0
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def chat_stream(self, messages, generated_messages, cancelled=None):
+        self.histories.append(list(messages))
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            # Model calls of the tool step, nothing is streamed until they are done
+            for _ in range(self.n_tool_calls):
+                if cancelled is not None and cancelled.is_set():
+                    return
+                time.sleep(self.delay)
+                self.tool_calls += 1
+
+            n_user = len([m for m in messages if m["role"] == "user"])
+            answer = ""
+            for i in range(self.n_deltas):
+                time.sleep(self.delay)
+                delta = f"{n_user}." if i == 0 else f" {i}"
+                answer += delta
+                yield delta
+            generated_messages.append({"role": "assistant", "content": answer})
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.closed += 1
+
+
+class FakeImageGen:
+    """Local stand-in for the image generation model, waits until released"""
+
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def predict_bytes(self, prompt, **kwargs):
+        self.release.wait(5)
+        return PNG
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+async def request(port, method, path, body=None, raw=False):
+    """Sends a request and returns the status, headers and decoded body (bytes if raw)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    if headers.get("Transfer-Encoding") == "chunked":
+        text = b""
+        while content:
+            size, _, rest = content.partition(b"\r\n")
+            size = int(size, 16)
+            text += rest[:size]
+            content = rest[size + 2 :]
+        content = text
+    return status, headers, content if raw else content.decode("utf-8")
+
+
+def run_with_server(test, chatbot, **kwargs):
+    async def main():
+        server = ChatServer(chatbot, port=0, **kwargs)
+        await server.start()
+        try:
+            return await test(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_sessions_keep_their_own_history():
+    chatbot = FakeChatBot()
+
+    async def test(server):
+        status, headers, text = await request(server.port, "POST", "/chat", {"message": "hola"})
+        session_id = headers["X-Session-Id"]
+        _, _, text_second = await request(server.port, "POST", "/chat", {"message": "otra", "session_id": session_id})
+        _, _, text_other = await request(server.port, "POST", "/chat", {"message": "nueva"})
+        return status, text, text_second, text_other
+
+    status, text, text_second, text_other = run_with_server(test, chatbot)
+
+    assert status == 200
+    assert text == "1. 1 2"
+    assert text_second == "2. 1 2"
+    assert text_other == "1. 1 2"
+    assert [m["content"] for m in chatbot.histories[1]] == ["hola", "1. 1 2", "otra"]
+
+
+def test_concurrent_turns_are_limited():
+    chatbot = FakeChatBot(delay=0.02)
+
+    async def test(server):
+        results = await asyncio.gather(
+            *[request(server.port, "POST", "/chat", {"message": f"hola {i}"}) for i in range(6)]
+        )
+        return [status for status, _, _ in results]
+
+    statuses = run_with_server(test, chatbot, max_concurrent_turns=2)
+
+    assert statuses == [200] * 6
+    assert chatbot.peak == 2
+
+
+def test_full_queue_is_rejected():
+    chatbot = FakeChatBot(delay=0.05)
+
+    async def test(server):
+        results = await asyncio.gather(
+            *[request(server.port, "POST", "/chat", {"message": f"hola {i}"}) for i in range(5)]
+        )
+        return sorted(status for status, _, _ in results)
+
+    statuses = run_with_server(test, chatbot, max_concurrent_turns=1, max_queued_turns=2)
+
+    assert statuses.count(503) >= 1
+    assert statuses.count(200) >= 2
+
+
+def test_disconnected_client_cancels_the_turn():
+    chatbot = FakeChatBot(delay=0.05, n_deltas=100)
+
+    async def test(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        payload = json.dumps({"message": "hola", "session_id": "s1"}).encode()
+        writer.write(f"POST /chat HTTP/1.1\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        await writer.drain()
+        await reader.readuntil(b"1.")
+        writer.close()
+
+        # The worker stops at the next delta and the session history is unchanged
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if chatbot.closed == 1:
+                break
+        return server.sessions["s1"]["messages"], server.stats()
+
+    messages, stats = run_with_server(test, chatbot)
+
+    assert chatbot.closed == 1
+    assert messages == []
+    assert stats["running_turns"] == 0
+
+
+def test_disconnect_during_the_tool_step_stops_the_model_calls():
+    chatbot = FakeChatBot(delay=0.05, n_tool_calls=100)
+
+    async def test(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        payload = json.dumps({"message": "hola", "session_id": "s1"}).encode()
+        writer.write(f"POST /chat HTTP/1.1\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        await writer.drain()
+        # Only the headers are sent while the tools run
+        await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if chatbot.closed == 1:
+                break
+        return server.sessions["s1"]["messages"]
+
+    messages = run_with_server(test, chatbot)
+
+    assert chatbot.closed == 1
+    assert chatbot.tool_calls < 100
+    assert messages == []
+
+
+def test_idle_sessions_are_evicted():
+    chatbot = FakeChatBot()
+
+    async def test(server):
+        await request(server.port, "POST", "/chat", {"message": "hola", "session_id": "s1"})
+        assert "s1" in server.sessions
+        await asyncio.sleep(0.3)
+        return server.stats()
+
+    stats = run_with_server(test, chatbot, session_ttl=0.1)
+
+    assert stats["sessions"] == 0
+
+
+def test_bytes_after_the_request_do_not_cancel_the_turn():
+    chatbot = FakeChatBot(delay=0.02)
+
+    async def test(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        payload = json.dumps({"message": "hola"}).encode()
+        request_bytes = f"POST /chat HTTP/1.1\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+        # A pipelined request on the same connection
+        writer.write(request_bytes + b"GET /health HTTP/1.1\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    response = run_with_server(test, chatbot)
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b"0\r\n\r\n")
+    assert chatbot.closed == 1
+
+
+def test_malformed_content_length():
+    async def test(server):
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(b"POST /chat HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    response = run_with_server(test, FakeChatBot())
+
+    assert response.startswith(b"HTTP/1.1 400 Bad Request")
+
+
+def test_bad_requests():
+    async def test(server):
+        missing_message = await request(server.port, "POST", "/chat", {"text": "hola"})
+        bad_session_ids = [
+            (await request(server.port, "POST", "/chat", {"message": "hola", "session_id": session_id}))[0]
+            for session_id in ["s1\r\nSet-Cookie: a=1", ["s1"], "sesión", "", "s" * 65]
+        ]
+        unknown_path = await request(server.port, "GET", "/unknown")
+        health = await request(server.port, "GET", "/health")
+        return missing_message[0], bad_session_ids, unknown_path[0], json.loads(health[2])
+
+    missing_message, bad_session_ids, unknown_path, health = run_with_server(test, FakeChatBot())
+
+    assert missing_message == 400
+    assert bad_session_ids == [400] * 5
+    assert unknown_path == 404
+    assert health == {"sessions": 0, "running_turns": 0, "queued_turns": 0}
+
+
+def test_images_of_jobs_are_served(tmp_path):
+    chatbot = FakeChatBot()
+    image_gen = FakeImageGen()
+    chatbot.image_jobs = ImageJobQueue(image_gen, str(tmp_path))
+    job_id = chatbot.image_jobs.submit("Kaladin with his spear", "anime")
+
+    async def test(server):
+        pending = await request(server.port, "GET", f"/images/{job_id}")
+        image_gen.release.set()
+        chatbot.image_jobs.wait(job_id, timeout=5)
+        done = await request(server.port, "GET", f"/images/{job_id}", raw=True)
+        unknown = await request(server.port, "GET", "/images/" + "0" * 64)
+        return pending, done, unknown
+
+    pending, done, unknown = run_with_server(test, chatbot)
+    chatbot.image_jobs.close()
+
+    assert pending[0] == 200
+    assert json.loads(pending[2])["status"] in (ImageJobQueue.QUEUED, ImageJobQueue.RUNNING)
+    assert done[0] == 200
+    assert done[1]["Content-Type"] == "image/png"
+    assert done[2] == PNG
+    assert unknown[0] == 404
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pytest
+
+from models.single_flight import SingleFlight
+from models.embedding_model import AzureAIEmbedding
+from models.chatcomplete_model import AzureAIChatComplete
+
+
+def run_concurrently(func, n_callers):
+    """Calls func from n_callers threads released at the same time"""
+    barrier = threading.Barrier(n_callers)
+
+    def call(_):
+        barrier.wait()
+        return func()
+
+    with ThreadPoolExecutor(max_workers=n_callers) as executor:
+        return list(executor.map(call, range(n_callers)))
+
+
+def test_identical_calls_in_flight_are_coalesced():
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": 42}
+
+    results = run_concurrently(lambda: single_flight.do("key", slow_call), 8)
+
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert single_flight.stats() == {"calls": 1, "coalesced": 7, "in_flight": 0}
+
+    # Finished calls are not cached
+    single_flight.do("key", slow_call)
+    assert calls == [1, 1]
+
+
+def test_errors_are_shared_by_the_waiting_callers():
+    single_flight = SingleFlight()
+
+    def failing_call():
+        time.sleep(0.1)
+        raise ValueError("bad response")
+
+    def call():
+        with pytest.raises(ValueError):
+            single_flight.do("key", failing_call)
+        return True
+
+    assert run_concurrently(call, 4) == [True] * 4
+    assert single_flight.stats()["in_flight"] == 0
+
+
+def test_keys_distinguish_arrays_and_values():
+    vector = np.array([0.1, 0.2, 0.3])
+
+    assert SingleFlight.key("search", vector) == SingleFlight.key("search", vector.copy())
+    assert SingleFlight.key("search", vector) != SingleFlight.key("search", vector + 1e-9)
+    assert SingleFlight.key({"a": 1, "b": 2}) == SingleFlight.key({"b": 2, "a": 1})
+    assert SingleFlight.key("a", "b") != SingleFlight.key("ab")
+
+
+def test_embeddings_of_the_same_texts_share_a_request():
+    model = AzureAIEmbedding(model_name="test", single_flight=SingleFlight())
+    requests = []
+
+    def raw_predict(input_data):
+        requests.append(input_data)
+        time.sleep(0.1)
+        return np.ones((len(input_data), 3))
+
+    model.raw_predict = raw_predict
+
+    results = run_concurrently(lambda: model.predict(["Who is Kaladin?"]), 6)
+
+    assert len(requests) == 1
+    assert all(result.shape == (1, 3) for result in results)
+
+
+def test_only_deterministic_completions_are_coalesced():
+    model = AzureAIChatComplete(model_name="test", single_flight=SingleFlight())
+    requests = []
+
+    def post(data):
+        requests.append(data["temperature"])
+        time.sleep(0.1)
+        return {"choices": [{"message": {"content": "yes"}}]}
+
+    model._post = post
+    messages = [{"role": "user", "content": "Is it relevant?"}]
+
+    run_concurrently(lambda: model.predict(messages, temperature=0.01), 4)
+    assert requests == [0.01]
+
+    run_concurrently(lambda: model.predict(messages, temperature=0.4), 4)
+    assert requests == [0.01] + [0.4] * 4
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import types
+import hashlib
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+import tiktoken
+
+import chunker
+from models.lazy_client import LazyClient
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Seconds allowed to import main and to build the chatbot, can be raised on slow machines
+IMPORT_BUDGET = float(os.environ.get("STARTUP_IMPORT_BUDGET", 1.0))
+BUILD_BUDGET = float(os.environ.get("STARTUP_BUILD_BUDGET", 3.0))
+
+# Modules that must only be loaded on first use
+DEFERRED_MODULES = ["tiktoken", "PIL", "azure.search.documents"]
+
+STARTUP_SCRIPT = """
+import sys, time, json
+sys.path[:0] = [{src!r}] + [{src!r} + "/" + p for p in ("models", "chat", "data_index")]
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.IMAGES_PATH = "images"
+main.ANSWER_CACHE_PATH = "answer_cache.json"
+main.ROUTING_LOG_PATH = "routing_log.jsonl"
+chatbot = main.build_chatbot()
+built = time.perf_counter()
+chatbot.image_jobs.close()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "build_seconds": built - imported,
+    "loaded": [m for m in {deferred!r} if m in sys.modules],
+}}))
+"""
+
+
+def test_startup_budget(tmp_path):
+    script = STARTUP_SCRIPT.format(src=SRC_PATH, deferred=DEFERRED_MODULES)
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True, check=True)
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert startup["loaded"] == []
+    assert startup["import_seconds"] < IMPORT_BUDGET
+    assert startup["build_seconds"] < BUILD_BUDGET
+
+
+def test_token_counters_share_the_encoding(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: loaded.append(name) or object())
+    monkeypatch.setattr(chunker, "_encodings", {})
+
+    first = chunker.TokenCounter("cl100k_base")
+    second = chunker.Chunker().token_counter
+    assert loaded == []
+
+    assert first.encoding is second.encoding
+    assert loaded == ["cl100k_base"]
+
+
+def test_bundled_encoding_is_copied_to_the_cache(tmp_path):
+    (tmp_path / "cl100k_base.tiktoken").write_bytes(b"IQ== 0\n")
+
+    chunker._use_bundled_encoding(str(tmp_path), "cl100k_base")
+
+    cache_name = hashlib.sha1(chunker.ENCODING_URLS["cl100k_base"].encode()).hexdigest()
+    assert (tmp_path / cache_name).read_bytes() == b"IQ== 0\n"
+
+
+def test_lazy_client_is_built_once_on_first_use():
+    built = []
+
+    def factory():
+        built.append(1)
+        return types.SimpleNamespace(name="search")
+
+    client = LazyClient(factory)
+    assert built == []
+    assert client.name == "search"
+    assert client.name == "search"
+    assert built == [1]
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from models.telemetry import Tracer, JSONLinesExporter
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+
+def test_disabled_tracer_records_nothing():
+    exporter = ListExporter()
+    tracer = Tracer(enabled=False, exporters=[exporter])
+
+    with tracer.span("chat.turn") as span:
+        span.set(http_status=200)
+        tracer.current_span().add("retries")
+
+    assert exporter.spans == []
+    assert tracer.stats() == {}
+
+
+def test_spans_are_nested_and_keep_attributes():
+    exporter = ListExporter()
+    tracer = Tracer(enabled=True, exporters=[exporter])
+
+    with tracer.span("chat.turn"):
+        with tracer.span("chat_complete", model="llama") as span:
+            tracer.current_span().set(http_status=200)
+            tracer.current_span().add("retries")
+            span.set(prompt_tokens=10, completion_tokens=3)
+
+    child, parent = exporter.spans
+    assert child["parent_id"] == parent["span_id"]
+    assert child["trace_id"] == parent["trace_id"]
+    assert parent["parent_id"] is None
+    assert child["attributes"] == {
+        "model": "llama",
+        "http_status": 200,
+        "retries": 1,
+        "prompt_tokens": 10,
+        "completion_tokens": 3,
+    }
+
+
+def test_bound_functions_keep_the_parent_in_other_threads():
+    exporter = ListExporter()
+    tracer = Tracer(enabled=True, exporters=[exporter])
+
+    def work(i):
+        with tracer.span("ask_data.filter"):
+            pass
+
+    with tracer.span("tool.ask_data"):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(tracer.bind(work), range(8)))
+
+    parent = exporter.spans[-1]
+    assert parent["name"] == "tool.ask_data"
+    assert all(span["parent_id"] == parent["span_id"] for span in exporter.spans[:-1])
+
+
+def test_errors_and_counters_are_aggregated():
+    tracer = Tracer(enabled=True)
+
+    for tokens in [10, 20]:
+        with tracer.span("chat_complete", prompt_tokens=tokens):
+            pass
+    with pytest.raises(ValueError):
+        with tracer.span("chat_complete"):
+            raise ValueError("bad response")
+
+    stats = tracer.stats()["chat_complete"]
+    assert stats["count"] == 3
+    assert stats["errors"] == 1
+    assert stats["prompt_tokens"] == 30
+    assert sum(stats["buckets"].values()) == 3
+
+
+def test_prometheus_text_has_cumulative_buckets():
+    tracer = Tracer(enabled=True, buckets=(0.1, 1.0, float("inf")))
+    for _ in range(3):
+        with tracer.span("search"):
+            pass
+
+    text = tracer.prometheus_text()
+
+    assert 'cosmere_span_duration_seconds_bucket{span="search",le="0.1"} 3' in text
+    assert 'cosmere_span_duration_seconds_bucket{span="search",le="+Inf"} 3' in text
+    assert 'cosmere_span_duration_seconds_count{span="search"} 3' in text
+
+
+def test_json_lines_exporter(tmp_path):
+    path = str(tmp_path / "traces" / "traces.jsonl")
+    exporter = JSONLinesExporter(path)
+    tracer = Tracer(enabled=True, exporters=[exporter])
+
+    with tracer.span("embedding", n_texts=3):
+        pass
+    exporter.close()
+
+    with open(path) as f:
+        spans = [json.loads(line) for line in f]
+    assert [span["name"] for span in spans] == ["embedding"]
+    assert spans[0]["attributes"] == {"n_texts": 3}
+    assert spans[0]["status"] == "ok"
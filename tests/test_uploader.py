@@ -0,0 +1,159 @@
+import os
+import sys
+import threading
+from collections import namedtuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "data_index"))
+
+from uploader import IndexUploader
+
+
+IndexingResult = namedtuple("IndexingResult", ["key", "succeeded", "status_code"])
+
+
+class FakeSearchService:
+    """Local stand-in for the search service upload endpoint"""
+
+    def __init__(self, failing_keys=None, n_failures=1, fail_requests_after=None):
+        """
+        Args:
+            failing_keys (set): Documents that fail individually the first n_failures times.
+            n_failures (int): Number of times every failing document fails.
+            fail_requests_after (int): Number of requests after which every request raises (simulates a crash).
+        """
+        self.failing_keys = failing_keys or set()
+        self.n_failures = n_failures
+        self.fail_requests_after = fail_requests_after
+
+        self.documents = {}
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def upload_documents(self, documents):
+        with self.lock:
+            if self.fail_requests_after is not None and len(self.requests) >= self.fail_requests_after:
+                raise ConnectionError("Service unavailable")
+            self.requests.append([doc["id"] for doc in documents])
+
+        results = []
+        for doc in documents:
+            with self.lock:
+                failed = doc["id"] in self.failing_keys and self.failures.get(doc["id"], 0) < self.n_failures
+                if failed:
+                    self.failures[doc["id"]] = self.failures.get(doc["id"], 0) + 1
+                else:
+                    self.documents[doc["id"]] = doc
+            results.append(IndexingResult(doc["id"], not failed, 503 if failed else 200))
+        return results
+
+
+def make_documents(n, content_size=100):
+    return [{"id": f"doc_{i}", "content": "x" * content_size} for i in range(n)]
+
+
+def test_batches_are_sized_by_payload_bytes():
+    uploader = IndexUploader(FakeSearchService(), max_batch_bytes=1000, max_batch_documents=1000)
+
+    batches = [batch for _, batch in uploader.make_batches(make_documents(50))]
+
+    assert sum(len(batch) for batch in batches) == 50
+    assert all(len(batch) == 7 for batch in batches[:-1])
+
+
+def test_upload_all_documents_concurrently():
+    service = FakeSearchService()
+    uploader = IndexUploader(service, max_batch_bytes=1000, max_workers=4)
+
+    stats = uploader.upload(make_documents(200))
+
+    assert stats == {"uploaded": 200, "skipped": 0, "failed": []}
+    assert len(service.documents) == 200
+    assert len(service.requests) == 29
+
+
+def test_failed_documents_are_retried():
+    service = FakeSearchService(failing_keys={"doc_3", "doc_42"}, n_failures=2)
+    uploader = IndexUploader(service, max_batch_bytes=1000, backoff=0.001)
+
+    stats = uploader.upload(make_documents(50))
+
+    assert stats["uploaded"] == 50
+    assert len(service.documents) == 50
+    assert ["doc_3"] in service.requests
+
+
+def test_documents_failing_after_all_retries_are_reported():
+    service = FakeSearchService(failing_keys={"doc_3"}, n_failures=10)
+    uploader = IndexUploader(service, max_batch_bytes=1000, max_retries=2, backoff=0.001)
+
+    stats = uploader.upload(make_documents(50))
+
+    assert stats["uploaded"] == 49
+    assert stats["failed"] == ["doc_3"]
+
+
+def test_restarted_upload_skips_completed_batches(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.txt")
+    documents = make_documents(100)
+
+    # First run crashes after 5 requests
+    service = FakeSearchService(fail_requests_after=5)
+    uploader = IndexUploader(
+        service, max_batch_bytes=1000, max_workers=1, max_retries=0, checkpoint_path=checkpoint_path
+    )
+    stats = uploader.upload(documents)
+    assert stats["uploaded"] == 35
+
+    # Second run only uploads the remaining batches
+    service = FakeSearchService()
+    uploader = IndexUploader(service, max_batch_bytes=1000, max_workers=1, checkpoint_path=checkpoint_path)
+    stats = uploader.upload(documents)
+
+    assert stats["skipped"] == 35
+    assert stats["uploaded"] == 65
+    assert "doc_0" not in service.documents
+
+    # The complete upload removes the checkpoint, a later run uploads everything again
+    assert not os.path.exists(checkpoint_path)
+    stats = IndexUploader(FakeSearchService(), max_batch_bytes=1000, checkpoint_path=checkpoint_path).upload(documents)
+    assert stats["uploaded"] == 100
+
+
+def test_changed_documents_are_not_skipped(tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.txt")
+    documents = make_documents(20)
+
+    service = FakeSearchService(failing_keys={"doc_19"}, n_failures=10)
+    uploader = IndexUploader(service, max_batch_bytes=1000, max_retries=0, checkpoint_path=checkpoint_path)
+    stats = uploader.upload(documents)
+    assert stats["failed"] == ["doc_19"]
+    assert os.path.exists(checkpoint_path)
+
+    # Same ids, but the content of the first batch changed since the failed run
+    documents[0]["content"] = "y" * 100
+    service = FakeSearchService()
+    stats = IndexUploader(service, max_batch_bytes=1000, checkpoint_path=checkpoint_path).upload(documents)
+
+    assert stats["skipped"] == 7
+    assert stats["uploaded"] == 13
+    assert service.documents["doc_0"]["content"] == "y" * 100
+
+
+def test_action_selects_the_search_client_method():
+    class MergingSearchService(FakeSearchService):
+        def merge_or_upload_documents(self, documents):
+            return self.upload_documents(documents)
+
+        def delete_documents(self, documents):
+            with self.lock:
+                for doc in documents:
+                    self.documents.pop(doc["id"], None)
+            return [IndexingResult(doc["id"], True, 200) for doc in documents]
+
+    service = MergingSearchService()
+    IndexUploader(service, action="merge_or_upload").upload(make_documents(10))
+    stats = IndexUploader(service, action="delete").upload([{"id": f"doc_{i}"} for i in range(4)])
+
+    assert stats["uploaded"] == 4
+    assert sorted(service.documents) == [f"doc_{i}" for i in range(4, 10)]